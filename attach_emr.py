@@ -1,17 +1,10 @@
 #!/usr/bin/env python
+import os
+import sys
+import json
+import atexit
 import logging
-import boto3
-import time
 from optparse import OptionParser
-from aws_beamline_devtools.emr_client import EMR
-from aws_beamline_devtools.emr_config import EMRConfig
-from aws_beamline_devtools.compute_manager import ComputeManager
-from aws_beamline_devtools.create_sparkmagic_config import CreateSparkMagicConfig
-
-logging.basicConfig(
-    format='%(asctime)s %(levelname)-8s %(message)s',
-    level=logging.INFO,
-    datefmt='%Y-%m-%d %H:%M:%S')
 
 def main():
     """
@@ -22,6 +15,36 @@ def main():
         --clusterSize, -s : T-shirt size of the cluster configured in config file. See emr.yaml.(Required for creating new cluster)
         --configFile, -e  : Externally provided YAML config file to set up EMR cluster. Default value: emr.yaml (Optional for creating new cluster)
         --paraSetName, -p : Parameter set name defined in the YAML file. Default value: default (Optional for creating new cluster)
+        --newCluster, -n  : Launch a new cluster even when a live cluster with the same spec fingerprint exists. (Optional for creating new cluster)
+        --maintainPool    : Evict expired warm clusters and refill the pool configured for --clusterSize and --paramSetName. (Optional)
+        --sparkmagicConfig: Path of the generated sparkmagic config. Default value: /home/ec2-user/.sparkmagic/config.json (Optional)
+        --livySessions    : Reserve capacity by pre-starting Livy sessions per kind, e.g. pyspark=1,spark=1. sparkmagic kernels do not use them. Default: livy_warm_sessions of the parameter set, none when unset (Optional)
+        --refreshTemplate : Revalidate the cached sparkmagic template against GitHub, otherwise the template bundled with the package is used. (Optional)
+        --bulkManifest    : Launch every cluster of a YAML manifest of param_set, size and count entries through a rate limited worker pool. (Optional)
+        --bulkTerminate   : Terminate a comma separated list of JobFlowIds, or those listed in a file, through the same worker pool. (Optional)
+        --forceTerminate  : Disable termination protection before --bulkTerminate or --reapIdle terminate a cluster. (Optional)
+        --bulkWorkers     : Concurrent bulk submissions. Default value: 8 (Optional)
+        --bulkRate        : EMR API calls per second in bulk mode, lowered automatically when throttled. Default value: 1.0 (Optional)
+        --bulkReport      : Also write the bulk status report as JSON to this file. (Optional)
+        --reapIdle        : Warn, then terminate clusters launched by this tool that stayed idle past the reaper_idle_minutes of their parameter set. (Optional)
+        --reapInterval    : With --reapIdle, sweep every this many minutes instead of once. (Optional)
+        --reapDryRun      : With --reapIdle, only report what would be warned or terminated. (Optional)
+        --updatePolicies  : Apply the managed scaling and auto termination settings of --clusterSize and --paramSetName to the running cluster --emrClusterId. (Optional)
+        --runSteps        : Run a YAML file of steps and their dependencies on --emrClusterId, filling its concurrent step slots. (Optional)
+        --resize          : Resize the running cluster --emrClusterId in place to this size of its parameter set, refusing changes that need a relaunch. (Optional)
+        --resizeWait      : With --resize, wait up to --waitTimeout minutes until the fleets have their new capacity. (Optional)
+        --watchSpot       : Watch the core and task fleets of --emrClusterId for lost spot capacity and rebalance them to on demand within spot_rebalance_max_on_demand_units. (Optional)
+        --watchInterval   : With --watchSpot, seconds between fleet checks. Default value: 60 (Optional)
+        --spotEventLog    : With --watchSpot, JSON lines file of timestamped spot events. Default value: ~/.beamline/spot-events.jsonl (Optional)
+        --buildLayer      : Build and stage the dependency layer of --paramSetName unless the staged one has the same dependency hash. (Optional)
+        --tuningReport    : Print the Spark executor sizing derived for --clusterSize and --paramSetName without launching anything. (Optional)
+        --profile         : Print per phase launch time breakdowns and percentiles from the launch history, grouped by --profileBy. (Optional)
+        --profileBy       : Launch attribute to compare in --profile, e.g. cluster_size, debugging, release_label. Default value: cluster_size (Optional)
+        --historyFile     : SQLite launch history, written after every launch. Default value: ~/.beamline/history.db (Optional)
+        --targetReadyMinutes: Choose spot or on demand capacity and spot timeouts from the launch history so a new cluster is ready within this many minutes. (Optional for creating new cluster)
+        --metricsFile     : On exit, write EMR API metrics as a Prometheus textfile (.prom) or JSON snapshot. (Optional)
+        --verbose, -v     : Debug logging, including truncated EMR API responses. (Optional)
+        --waitTimeout, -t : Minutes to wait for a new cluster to be ready. Default value: 60 (Optional for creating new cluster)
     """
     parser = OptionParser(usage="usage: %prog [options] filename",
                           version="%prog 1.0")
@@ -41,38 +64,395 @@ def main():
                       dest="param_set_name",
                       default="default",
                       help="Parameter set name, See: emr.yaml")
+    parser.add_option("-n", "--newCluster",
+                      dest="new_cluster",
+                      action="store_true",
+                      default=False,
+                      help="Always launch a new cluster instead of reusing a live cluster built from the same size and parameter set.")
+    parser.add_option("--maintainPool",
+                      dest="maintain_pool",
+                      action="store_true",
+                      default=False,
+                      help="Evict expired warm clusters and refill the pool for --clusterSize and --paramSetName, then exit.")
+    parser.add_option("--sparkmagicConfig",
+                      dest="sparkmagic_config",
+                      default="/home/ec2-user/.sparkmagic/config.json",
+                      help="Path of the generated sparkmagic config, Default: /home/ec2-user/.sparkmagic/config.json")
+    parser.add_option("--livySessions",
+                      dest="livy_sessions",
+                      default=None,
+                      help="Reserve cluster capacity by pre-starting Livy sessions on the master after attaching, e.g. pyspark=1,spark=1. sparkmagic kernels start their own sessions and do not use these. Default: livy_warm_sessions of the parameter set, none when unset")
+    parser.add_option("--refreshTemplate",
+                      dest="refresh_template",
+                      action="store_true",
+                      default=False,
+                      help="Revalidate the cached sparkmagic config template against GitHub before generating the config.")
+    parser.add_option("--bulkManifest",
+                      dest="bulk_manifest",
+                      default=None,
+                      help="Launch the clusters listed in a YAML manifest of param_set, size and count entries, then exit.")
+    parser.add_option("--bulkTerminate",
+                      dest="bulk_terminate",
+                      default=None,
+                      help="Terminate clusters: comma separated JobFlowIds, or a file with one JobFlowId per line.")
+    parser.add_option("--forceTerminate",
+                      dest="force_terminate",
+                      action="store_true",
+                      default=False,
+                      help="Disable termination protection before --bulkTerminate or --reapIdle terminate a cluster.")
+    parser.add_option("--bulkWorkers",
+                      dest="bulk_workers",
+                      type="int",
+                      default=8,
+                      help="Concurrent bulk submissions, Default: 8")
+    parser.add_option("--bulkRate",
+                      dest="bulk_rate",
+                      type="float",
+                      default=1.0,
+                      help="EMR API calls per second in bulk mode, lowered automatically when throttled, Default: 1.0")
+    parser.add_option("--bulkReport",
+                      dest="bulk_report",
+                      default=None,
+                      help="Also write the bulk status report as JSON to this file.")
+    parser.add_option("--reapIdle",
+                      dest="reap_idle",
+                      action="store_true",
+                      default=False,
+                      help="Warn, then terminate clusters launched by this tool that stayed idle past the reaper_idle_minutes of their parameter set.")
+    parser.add_option("--reapInterval",
+                      dest="reap_interval",
+                      type="int",
+                      default=0,
+                      help="With --reapIdle, sweep every this many minutes instead of once.")
+    parser.add_option("--reapDryRun",
+                      dest="reap_dry_run",
+                      action="store_true",
+                      default=False,
+                      help="With --reapIdle, only report what would be warned or terminated.")
+    parser.add_option("--updatePolicies",
+                      dest="update_policies",
+                      action="store_true",
+                      default=False,
+                      help="Apply the managed scaling and auto termination settings of --clusterSize and --paramSetName to the running cluster --emrClusterId, then exit.")
+    parser.add_option("--runSteps",
+                      dest="run_steps",
+                      default=None,
+                      help="Run the steps of a YAML file on --emrClusterId as their dependencies complete, print their status, then exit.")
+    parser.add_option("--resize",
+                      dest="resize",
+                      default=None,
+                      help="Resize the core and task fleets of the running cluster --emrClusterId in place to this size of its parameter set, then exit. Changes that need a relaunch, such as another master instance type, are refused.")
+    parser.add_option("--resizeWait",
+                      dest="resize_wait",
+                      action="store_true",
+                      default=False,
+                      help="With --resize, wait up to --waitTimeout minutes until the provisioned capacity matches the new size.")
+    parser.add_option("--watchSpot",
+                      dest="watch_spot",
+                      action="store_true",
+                      default=False,
+                      help="Watch the core and task fleets of --emrClusterId for lost spot capacity, raise their on demand targets up to the spot_rebalance_max_on_demand_units of the cluster's parameter set and lower them back once spot capacity returns. Runs until the cluster stops or Ctrl-C.")
+    parser.add_option("--watchInterval",
+                      dest="watch_interval",
+                      type="float",
+                      default=60,
+                      help="Seconds between fleet checks of --watchSpot, Default: 60")
+    parser.add_option("--spotEventLog",
+                      dest="spot_event_log",
+                      default=None,
+                      help="JSON lines file --watchSpot appends timestamped events to, Default: ~/.beamline/spot-events.jsonl")
+    parser.add_option("--buildLayer",
+                      dest="build_layer",
+                      action="store_true",
+                      default=False,
+                      help="Build the Python and JAR dependency layer of --paramSetName and stage it to its dependency_s3_path unless it is already staged, then exit.")
+    parser.add_option("--tuningReport",
+                      dest="tuning_report",
+                      action="store_true",
+                      default=False,
+                      help="Print the Spark executor sizing derived from the fleets of --clusterSize and --paramSetName, then exit without launching a cluster.")
+    parser.add_option("--profile",
+                      dest="profile",
+                      action="store_true",
+                      default=False,
+                      help="Print per phase launch times and percentiles from the launch history, grouped by --profileBy, then exit. --clusterSize and --paramSetName filter the launches.")
+    parser.add_option("--profileBy",
+                      dest="profile_by",
+                      default="cluster_size",
+                      help="Launch attribute compared by --profile: cluster_size, param_set, release_label, fingerprint, debugging, subnet_id, primary_instance_type or hour_of_day, Default: cluster_size")
+    parser.add_option("--historyFile",
+                      dest="history_file",
+                      default=None,
+                      help="SQLite launch history, written after every launch, Default: ~/.beamline/history.db")
+    parser.add_option("--targetReadyMinutes",
+                      dest="target_ready_minutes",
+                      type="float",
+                      default=None,
+                      help="Choose spot or on demand capacity and spot timeouts from the launch history so a new cluster is ready within this many minutes.")
+    parser.add_option("--metricsFile",
+                      dest="metrics_file",
+                      default=None,
+                      help="On exit, write EMR API call counts, latency histograms, retries and throttles to this file: Prometheus textfile when it ends with .prom, JSON otherwise.")
+    parser.add_option("-v", "--verbose",
+                      dest="verbose",
+                      action="store_true",
+                      default=False,
+                      help="Debug logging, including truncated EMR API responses.")
+    parser.add_option("-t", "--waitTimeout",
+                      dest="wait_timeout",
+                      type="int",
+                      default=60,
+                      help="Minutes to wait for a new cluster to be ready, Default: 60")
 
     (options, args) = parser.parse_args()
 
+    logging.basicConfig(
+        format='%(asctime)s %(levelname)-8s %(message)s',
+        level=logging.DEBUG if options.verbose else logging.INFO,
+        datefmt='%Y-%m-%d %H:%M:%S')
+    if options.verbose:
+        # Keep the SDK's own wire logging out of --verbose output.
+        for name in ("boto3", "botocore", "urllib3", "s3transfer"):
+            logging.getLogger(name).setLevel(logging.INFO)
+    if options.metrics_file is not None:
+        from aws_beamline_devtools.instrumentation import metrics
+        atexit.register(metrics.write, options.metrics_file)
+
+    # Package modules are imported once options are parsed, so `attach-emr -h` and option errors stay fast.
+    # boto3 itself is only imported when the first EMR API call is made.
+    from aws_beamline_devtools.emr_client import EMR
+    from aws_beamline_devtools.waiter import ClusterWaitError, ClusterWaitTimeout
+    from aws_beamline_devtools.compute_manager import ComputeManager
+    from aws_beamline_devtools.cluster_pool import ClusterPool
+    from aws_beamline_devtools.create_sparkmagic_config import CreateSparkMagicConfig
+
+    def warm_livy_sessions(master_private_ip, counts):
+        # A session that fails to start must not fail the attach.
+        if not counts:
+            return None
+        from aws_beamline_devtools.livy_pool import LivySessionPool
+        logging.info("Pre-starting Livy sessions {}: they hold YARN capacity until Livy times them out, "
+                     "notebook kernels still start sessions of their own".format(counts))
+        try:
+            sessions = LivySessionPool(master_private_ip).warm(counts)
+        except Exception as e:
+            logging.warning("Could not pre-start Livy sessions on {}: {}".format(master_private_ip, e))
+            return None
+        return {kind: [x.to_dict() for x in ready] for kind, ready in sessions.items()}
+
+    livy_session_counts = None
+    if options.livy_sessions is not None:
+        from aws_beamline_devtools.livy_pool import parse_session_counts
+        try:
+            livy_session_counts = parse_session_counts(options.livy_sessions)
+        except ValueError as e:
+            parser.error("--livySessions: {}".format(e))
+
     logging.info("Options provided: {}".format(options))
     logging.info("Arguments provided: {}".format(args))
 
 
-    if not options.cluster_id == "UNKNOWN":
+    if options.update_policies:
+        if options.cluster_id == "UNKNOWN" or options.cluster_size == "UNKNOWN":
+            parser.error("--updatePolicies requires --emrClusterId and --clusterSize.")
+        compute_manager = ComputeManager(cluster_size=options.cluster_size, param_set_name=options.param_set_name, emr_config_path=options.config_file, emr=EMR())
+        compute_manager.update_policies(options.cluster_id)
+
+    elif options.run_steps is not None:
+        if options.cluster_id == "UNKNOWN":
+            parser.error("--runSteps requires --emrClusterId.")
+        from aws_beamline_devtools.steps import StepScheduler, load_steps, format_report
+        scheduler = StepScheduler(EMR(), options.cluster_id)
+        # Ctrl-C cancels the submitted steps before exiting.
+        runs = scheduler.run(load_steps(options.run_steps))
+        print(format_report(runs))
+        if any(x.state != "COMPLETED" for x in runs):
+            sys.exit(1)
+
+    elif options.resize is not None:
+        if options.cluster_id == "UNKNOWN":
+            parser.error("--resize requires --emrClusterId.")
+        from aws_beamline_devtools.emr_client import ResizeRefused, param_set_tag_key
+        emr = EMR(cache=True)
+        tags = {x["Key"]: x["Value"] for x in emr.get_cluster_description(options.cluster_id)["Cluster"].get("Tags", [])}
+        # Sizes are defined per parameter set, the cluster's own one wins over --paramSetName.
+        compute_manager = ComputeManager(cluster_size=options.resize, param_set_name=tags.get(param_set_tag_key, options.param_set_name),
+                                         emr_config_path=options.config_file, emr=emr)
+        try:
+            changes = compute_manager.resize_compute(options.cluster_id, wait=options.resize_wait, timeout=options.wait_timeout * 60)
+        except ResizeRefused as e:
+            logging.error(str(e))
+            sys.exit(1)
+        for change in changes:
+            print("{} fleet {}: {}/{} on demand/spot units, was {}/{}".format(
+                change.fleet_type, change.action, change.to_on_demand, change.to_spot, change.from_on_demand, change.from_spot))
+        if options.resize_wait and not all(x.converged for x in changes):
+            sys.exit(1)
+
+    elif options.watch_spot:
+        if options.cluster_id == "UNKNOWN":
+            parser.error("--watchSpot requires --emrClusterId.")
+        from aws_beamline_devtools.spot_watcher import SpotWatcher, default_event_log_path, format_report
+        watcher = SpotWatcher.for_cluster(EMR(cache=True), options.cluster_id, options.config_file, options.param_set_name,
+                                          event_log_path=options.spot_event_log or default_event_log_path)
+        try:
+            watcher.watch(options.watch_interval)
+        except KeyboardInterrupt:
+            pass
+        print(format_report(watcher.events))
+
+    elif not options.cluster_id == "UNKNOWN":
         logging.info("Cluster id (--cluster_id) input is provided. Ignoring options --clusterSize, --configFile and --paramSetName")
         logging.info("Attaching Jupyter notebook to cluster id: {}".format(options.cluster_id))
-        emr = EMR()
-        sparkmagic = CreateSparkMagicConfig()
-        master_private_ip = emr.get_cluster_instances(options.cluster_id).get("Instances")[0].get("PrivateIpAddress")
-        response = sparkmagic.generate_config(master_private_ip)
+        emr = EMR(cache=True)
+        sparkmagic = CreateSparkMagicConfig(config_path=options.sparkmagic_config, refresh_template=options.refresh_template)
+        master_private_ip = emr.get_master_private_ip(options.cluster_id)
+        if master_private_ip is None:
+            logging.error("Cluster {} has no running master node.".format(options.cluster_id))
+            sys.exit(1)
+        response = sparkmagic.generate_config(master_private_ip, warm_livy_sessions(master_private_ip, livy_session_counts))
         if response:
             logging.info("Connection set up completed. Please test connectivity using shell command:`curl {}:8998/sessions`".format(master_private_ip))
 
+    elif options.bulk_manifest is not None or options.bulk_terminate is not None:
+        from aws_beamline_devtools.bulk import BulkRunner, format_report
+        # The token bucket owns retries and backoff, SDK retries would bypass it and hide throttling from it.
+        runner = BulkRunner(EMR(max_pool_connections=max(10, options.bulk_workers), sdk_retries=0),
+                            max_workers=options.bulk_workers, rate=options.bulk_rate)
+        if options.bulk_manifest is not None:
+            items = runner.create(runner.load_manifest(options.bulk_manifest), options.config_file)
+        else:
+            if os.path.isfile(options.bulk_terminate):
+                with open(options.bulk_terminate) as f:
+                    cluster_ids = [x.strip() for x in f if x.strip()]
+            else:
+                cluster_ids = [x.strip() for x in options.bulk_terminate.split(",") if x.strip()]
+            items = runner.terminate(cluster_ids, disable_protection=options.force_terminate)
+        print(format_report(items))
+        if options.bulk_report is not None:
+            with open(options.bulk_report, "w") as f:
+                json.dump([x.to_dict() for x in items], f, indent=2)
+        if any(x.status == "FAILED" for x in items):
+            sys.exit(1)
+
+    elif options.reap_idle:
+        import time
+        from aws_beamline_devtools.reaper import Reaper, format_report
+        reaper = Reaper(EMR(cache=True), emr_config_path=options.config_file, disable_protection=options.force_terminate,
+                        dry_run=options.reap_dry_run)
+        while True:
+            print(format_report(reaper.sweep()))
+            if options.reap_interval <= 0:
+                break
+            time.sleep(options.reap_interval * 60)
+
+    elif options.build_layer:
+        from aws_beamline_devtools.emr_config import compile_config
+        from aws_beamline_devtools.dependency_layer import layer_for_param_set
+        params = compile_config(options.config_file).param_sets.get(options.param_set_name)
+        if params is None:
+            parser.error("No parameter set {} in {}.".format(options.param_set_name, options.config_file))
+        layer = layer_for_param_set(params, os.path.dirname(os.path.abspath(options.config_file)))
+        if layer is None:
+            logging.info("Parameter set {} declares no python_requirements or dependency_jars.".format(options.param_set_name))
+        else:
+            layer.ensure()
+            print("Dependency hash: {}\nArchive: {}\nBootstrap action: {}".format(layer.digest, layer.archive_path, layer.bootstrap_path))
+
+    elif options.profile:
+        from aws_beamline_devtools.launch_history import LaunchHistory, default_history_path, format_profile
+        # Failed and timed out launches would skew the phase times.
+        filters = {"outcome": "WAITING"}
+        if options.profile_by != "param_set":
+            filters["param_set"] = options.param_set_name
+        if options.cluster_size != "UNKNOWN" and options.profile_by != "cluster_size":
+            filters["cluster_size"] = options.cluster_size
+        try:
+            samples = LaunchHistory(options.history_file or default_history_path).phase_samples(options.profile_by, filters)
+        except ValueError as e:
+            parser.error(str(e))
+        print(format_profile(samples, options.profile_by))
+
+    elif options.tuning_report:
+        if options.cluster_size == "UNKNOWN":
+            parser.error("--tuningReport requires --clusterSize.")
+        from aws_beamline_devtools.emr_config import EMRConfig
+        from aws_beamline_devtools.spark_tuning import tune_spark
+        compute_config = EMRConfig(cluster_size=options.cluster_size, param_set_name=options.param_set_name, emr_config_path=options.config_file)
+        print("Spark executor sizing for parameter set {}, size {} (spark_executor_tuning: {})".format(
+            options.param_set_name, options.cluster_size, compute_config.spark_executor_tuning))
+        print(tune_spark(compute_config).format_report(compute_config.spark_defaults))
+
+    elif options.maintain_pool:
+        if options.cluster_size == "UNKNOWN":
+            parser.error("--maintainPool requires --clusterSize.")
+        emr = EMR()
+        compute_manager = ComputeManager(cluster_size=options.cluster_size, param_set_name=options.param_set_name, emr_config_path=options.config_file, emr=emr)
+        compute_config = compute_manager.compute_config
+        response = ClusterPool(emr).maintain(compute_manager, compute_config.pool_target_idle, compute_config.pool_idle_ttl_minutes)
+        logging.info("Cluster pool maintained: {}".format(response))
+
     elif not options.cluster_size == "UNKNOWN":
         logging.info("Parameters: Cluster Size={}, Param set name={}, Config_file={}".format(options.cluster_size, options.param_set_name, options.config_file))
-        compute_manager = ComputeManager(cluster_size=options.cluster_size, param_set_name=options.param_set_name, emr_config_path=options.config_file)
-        emr = EMR()
-        sparkmagic = CreateSparkMagicConfig()
+        emr = EMR(cache=True)
+        history = None
+        if options.target_ready_minutes is not None:
+            from aws_beamline_devtools.launch_history import LaunchHistory, default_history_path
+            history = LaunchHistory(options.history_file or default_history_path)
+        compute_manager = ComputeManager(cluster_size=options.cluster_size, param_set_name=options.param_set_name, emr_config_path=options.config_file, emr=emr,
+                                         target_ready_seconds=options.target_ready_minutes * 60 if options.target_ready_minutes is not None else None,
+                                         history=history)
+        sparkmagic = CreateSparkMagicConfig(config_path=options.sparkmagic_config, refresh_template=options.refresh_template)
         logging.info("Config file at path: {} shall be used.".format(options.config_file))
-        cluster_id = compute_manager.start_compute().get("JobFlowId")
+        compute_config = compute_manager.compute_config
+        cluster_id = None
+        launched = False
+        pool_refill = None
+        if compute_config.pool_target_idle > 0 and not options.new_cluster:
+            pool = ClusterPool(emr)
+            cluster_id = pool.acquire(compute_manager)
+            # The pool is refilled while this attach waits, with its own manager so no launch plan is shared.
+            pool_refill = pool.maintain_in_background(
+                ComputeManager(cluster_size=options.cluster_size, param_set_name=options.param_set_name, emr_config_path=options.config_file, emr=emr),
+                compute_config.pool_target_idle, compute_config.pool_idle_ttl_minutes)
+        if cluster_id is None:
+            existing_cluster = None if options.new_cluster else compute_manager.find_compute()
+            if existing_cluster is not None:
+                cluster_id = existing_cluster["Id"]
+                logging.info("Reusing cluster {} built from the same specification. Use --newCluster to launch a new one.".format(cluster_id))
+            else:
+                cluster_id = compute_manager.start_compute().get("JobFlowId")
+                launched = True
         logging.info("Cluster Id: {}".format(cluster_id))
-        cluster_state = emr.get_cluster_state(cluster_id)
-        while cluster_state not in ["WAITING"]:
-            logging.info("EMR Cluster is not ready yet. Current state={}. WIll check back in 15 secs.".format(cluster_state))
-            time.sleep(15)
-            cluster_state = emr.get_cluster_state(cluster_id)
-        master_private_ip = emr.get_cluster_instances(cluster_id).get("Instances")[0].get("PrivateIpAddress")
-        response = sparkmagic.generate_config(master_private_ip)
+
+        def record_history(result, outcome=None):
+            # Only launches waited for from the start have complete phase times.
+            if not launched:
+                return
+            from aws_beamline_devtools.launch_history import LaunchHistory, default_history_path, record_launch
+            try:
+                record_launch(LaunchHistory(options.history_file or default_history_path), emr, cluster_id, compute_manager, result, outcome)
+            except Exception as e:
+                logging.warning("Could not record the launch of cluster {}: {}".format(cluster_id, e))
+
+        try:
+            result = emr.wait_for_cluster(cluster_id, timeout=options.wait_timeout * 60)
+        except ClusterWaitError as e:
+            logging.error("{}. Time spent per state: {}".format(e, e.result.state_durations))
+            record_history(e.result, "TIMEOUT" if isinstance(e, ClusterWaitTimeout) else None)
+            sys.exit(1)
+        record_history(result)
+        if pool_refill is not None:
+            pool_refill.join()
+        logging.info("EMR Cluster is ready after {:.0f} secs and {} status checks. Time spent per state: {}".format(
+            result.elapsed, result.polls, {k: round(v) for k, v in result.state_durations.items()}))
+        master_private_ip = emr.get_master_private_ip(cluster_id)
+        if master_private_ip is None:
+            logging.error("Cluster {} has no running master node.".format(cluster_id))
+            sys.exit(1)
+        if livy_session_counts is None:
+            livy_session_counts = compute_config.livy_warm_sessions
+        response = sparkmagic.generate_config(master_private_ip, warm_livy_sessions(master_private_ip, livy_session_counts))
         if response:
             logging.info("Connection set up completed. Please test connectivity using shell command:`curl {}:8998/sessions`".format(master_private_ip))
     else:
@@ -0,0 +1,151 @@
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Dict, Callable, Iterable
+from aws_beamline_devtools.emr_client import EMR
+from aws_beamline_devtools.waiter import ClusterWaiter, WaitResult, failure_states
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncEMR:
+    """
+    asyncio front end of EMR for managing many clusters concurrently.
+
+    API calls run on a bounded thread pool, so at most max_concurrency requests are in flight;
+    the rest queue. Cluster arguments are built by EMR._build_cluster_args, exactly as for EMR.
+    """
+    def __init__(self, max_concurrency: int = 10, emr: Optional[EMR] = None, endpoint_url: Optional[str] = None):
+        """
+        Keyword Arguments:
+            max_concurrency {int} -- API requests in flight at once (default: {10})
+            emr {Optional[EMR]} -- EMR client to wrap, by default one with a connection pool sized to max_concurrency (default: {None})
+            endpoint_url {Optional[str]} -- EMR endpoint, e.g. a local stub, when emr is not provided (default: {None})
+        """
+        self._max_concurrency = max_concurrency
+        self._emr = emr if emr is not None else EMR(endpoint_url=endpoint_url,
+                                                    max_pool_connections=max(10, max_concurrency))
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency)
+
+    @property
+    def emr(self) -> EMR:
+        return self._emr
+
+    async def _run(self, function: Callable, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(function, *args, **kwargs))
+
+    async def create_cluster(self, **kwargs) -> Dict:
+        """
+        Create an EMR cluster, see EMR.create_cluster for the arguments.
+
+        Returns:
+            Dictionary -- Response from emr run_job_flow API
+        """
+        return await self._run(self._emr.create_cluster, **kwargs)
+
+    async def get_cluster_state(self, cluster_id: str) -> str:
+        """
+        Get state of a cluster given its cluster id
+
+        Arguments:
+            cluster_id {str} -- JobflowId
+
+        Returns:
+            str -- State of cluster like WAITING, RUNNING, STARTING etc.
+        """
+        return await self._run(self._emr.get_cluster_state, cluster_id)
+
+    async def get_cluster_description(self, cluster_id: str) -> Dict:
+        """
+        Describe cluster for given JobFlowId
+
+        Arguments:
+            cluster_id {str} -- JobFlowId
+
+        Returns:
+            Dictionary -- Response to describe cluster API
+        """
+        return await self._run(self._emr.get_cluster_description, cluster_id)
+
+    async def get_cluster_instances(self, cluster_id: str, instance_group_types: List = ["MASTER"]) -> Dict:
+        """
+        Get instance details of an EMR cluster
+
+        Arguments:
+            cluster_id {str} -- JobFlowId
+
+        Keyword Arguments:
+            instance_group_types {List} -- Type if instance (default: {["MASTER"]})
+
+        Returns:
+            Dictionary-- Response of list_instances API with the instances of every page
+        """
+        return await self._run(self._emr.get_cluster_instances, cluster_id, instance_group_types)
+
+    async def get_master_private_ip(self, cluster_id: str) -> Optional[str]:
+        """
+        Private IP address of the running master node
+
+        Arguments:
+            cluster_id {str} -- JobFlowId
+
+        Returns:
+            Optional[str] -- Private IP, None when no master instance is running
+        """
+        return await self._run(self._emr.get_master_private_ip, cluster_id)
+
+    async def terminate_cluster(self, cluster_id: str) -> Dict:
+        """
+        Terminate an EMR cluster.
+
+        Arguments:
+            cluster_id {str} -- JobFlowId
+
+        Returns:
+            Dictionary-- Response of terminate_job_flows API
+        """
+        return await self._run(self._emr.terminate_cluster, cluster_id)
+
+    async def wait_for_cluster(self,
+                               cluster_id: str,
+                               target_states: Iterable[str] = ("WAITING",),
+                               failure_states: Iterable[str] = failure_states,
+                               timeout: Optional[float] = 3600,
+                               callbacks: Optional[Dict[str, Callable[[str, Dict], None]]] = None,
+                               jitter: float = 0.2) -> WaitResult:
+        """
+        Wait until a cluster reaches one of the target states without blocking the event loop.
+        Uses the same phase aware backoff as EMR.wait_for_cluster; a thread is only held while a
+        DescribeCluster request is in flight.
+
+        Arguments:
+            cluster_id {str} -- JobFlowId
+
+        Keyword Arguments:
+            target_states {Iterable[str]} -- States that end the wait (default: {("WAITING",)})
+            failure_states {Iterable[str]} -- States that raise ClusterFailedError (default: {TERMINATING, TERMINATED, TERMINATED_WITH_ERRORS})
+            timeout {Optional[float]} -- Deadline in seconds, raises ClusterWaitTimeout when passed (default: {3600})
+            callbacks {Optional[Dict[str, Callable[[str, Dict], None]]]} -- Per state callbacks called with (state, describe_cluster response) (default: {None})
+            jitter {float} -- Jitter fraction applied to poll delays (default: {0.2})
+
+        Returns:
+            WaitResult -- Final state, seconds spent per state and number of DescribeCluster calls
+        """
+        progress = ClusterWaiter(target_states=target_states,
+                                 failure_states=failure_states,
+                                 timeout=timeout,
+                                 callbacks=callbacks,
+                                 jitter=jitter).progress(cluster_id)
+        while True:
+            delay = progress.observe(await self._run(self._emr._describe_uncached, cluster_id))
+            if delay is None:
+                return progress.result
+            await asyncio.sleep(delay)
+
+    def close(self):
+        """
+        Shut the thread pool down once queued calls are done.
+        """
+        self._executor.shutdown(wait=True)
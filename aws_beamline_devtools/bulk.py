@@ -0,0 +1,271 @@
+import time
+import random
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Dict, Callable, Any
+from aws_beamline_devtools.emr_client import EMR
+from aws_beamline_devtools.compute_manager import ComputeManager
+from aws_beamline_devtools.instrumentation import metrics, is_throttle_error
+
+logger = logging.getLogger(__name__)
+# EMR operation retried for each bulk action.
+action_operations = {"create": "run_job_flow", "terminate": "terminate_job_flows"}
+
+
+class TokenBucket:
+    """
+    Thread safe token bucket whose refill rate adapts to throttling: halved on every throttled
+    call, raised back by a tenth of the configured rate per successful call.
+    """
+    def __init__(self, rate: float, capacity: float, min_rate: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        """
+        Arguments:
+            rate {float} -- Tokens added per second
+            capacity {float} -- Largest burst
+
+        Keyword Arguments:
+            min_rate {Optional[float]} -- Lowest rate throttling can push the bucket to (default: {rate / 16})
+        """
+        self._max_rate = rate
+        self._min_rate = min_rate if min_rate is not None else rate / 16.0
+        self._capacity = capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self.rate = rate
+        self._tokens = capacity
+        self._updated = clock()
+
+    def acquire(self, tokens: float = 1.0):
+        """
+        Block until tokens are available and take them.
+
+        Keyword Arguments:
+            tokens {float} -- Tokens to take (default: {1.0})
+        """
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            self._sleep(wait)
+
+    def throttled(self):
+        with self._lock:
+            self.rate = max(self._min_rate, self.rate / 2.0)
+
+    def succeeded(self):
+        with self._lock:
+            self.rate = min(self._max_rate, self.rate + self._max_rate / 10.0)
+
+
+def call_with_retry(function: Callable[[], Any], bucket: TokenBucket, max_attempts: int = 8,
+                    base_delay: float = 1.0, max_delay: float = 30.0,
+                    on_retry: Optional[Callable[[BaseException, int], None]] = None,
+                    sleep: Callable[[float], None] = time.sleep):
+    """
+    Call through the token bucket, retrying throttled calls with jittered exponential backoff.
+
+    Arguments:
+        function {Callable[[], Any]} -- API call
+        bucket {TokenBucket} -- Client side rate limiter
+
+    Keyword Arguments:
+        max_attempts {int} -- Attempts before the throttling error is raised (default: {8})
+        base_delay {float} -- Backoff after the first throttled attempt in seconds (default: {1.0})
+        max_delay {float} -- Longest backoff in seconds (default: {30.0})
+        on_retry {Optional[Callable[[BaseException, int], None]]} -- Called with the error and attempt number before a retry (default: {None})
+
+    Returns:
+        tuple -- (result, attempts made)
+    """
+    for attempt in range(1, max_attempts + 1):
+        bucket.acquire()
+        try:
+            result = function()
+        except Exception as e:
+            if not is_throttle_error(e) or attempt == max_attempts:
+                raise
+            bucket.throttled()
+            if on_retry is not None:
+                on_retry(e, attempt)
+            sleep(min(max_delay, base_delay * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0))
+            continue
+        bucket.succeeded()
+        return result, attempt
+
+
+class BulkItem:
+    """
+    One unit of work of a bulk run and its outcome.
+    """
+    __slots__ = ("action", "param_set", "cluster_size", "cluster_id", "status", "attempts", "error", "elapsed")
+
+    def __init__(self, action: str, param_set: Optional[str] = None, cluster_size: Optional[str] = None,
+                 cluster_id: Optional[str] = None):
+        self.action = action
+        self.param_set = param_set
+        self.cluster_size = cluster_size
+        self.cluster_id = cluster_id
+        self.status = "PENDING"
+        self.attempts = 0
+        self.error: Optional[str] = None
+        self.elapsed = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {k: getattr(self, k) for k in self.__slots__}
+
+
+class BulkRunner:
+    """
+    Launches or terminates many clusters through a worker pool, with client side rate limiting.
+    """
+    def __init__(self, emr: EMR, max_workers: int = 8, rate: float = 1.0, burst: float = 2.0,
+                 max_attempts: int = 8):
+        """
+        Arguments:
+            emr {EMR} -- EMR client shared by the workers, built with sdk_retries=0 so throttled calls reach the token bucket
+
+        Keyword Arguments:
+            max_workers {int} -- Concurrent submissions (default: {8})
+            rate {float} -- API calls per second across all workers (default: {1.0})
+            burst {float} -- Calls allowed in a burst (default: {2.0})
+            max_attempts {int} -- Attempts per call when throttled (default: {8})
+        """
+        self._emr = emr
+        self._max_workers = max_workers
+        self._bucket = TokenBucket(rate, burst)
+        self._max_attempts = max_attempts
+
+    @staticmethod
+    def load_manifest(path: str) -> List[Dict[str, Any]]:
+        """
+        Read a bulk manifest:
+
+            clusters:
+            - param_set: default
+              size: M
+              count: 5
+
+        Arguments:
+            path {str} -- YAML manifest path
+
+        Returns:
+            List[Dict[str, Any]] -- Entries with param_set, size and count
+        """
+        import yaml
+        with open(path) as f:
+            manifest = yaml.safe_load(f) or {}
+        entries = manifest.get("clusters") or []
+        for entry in entries:
+            if "size" not in entry:
+                raise ValueError("Manifest entry {} has no size".format(entry))
+            entry.setdefault("param_set", "default")
+            entry.setdefault("count", 1)
+        return entries
+
+    def _execute(self, item: BulkItem, function: Callable[[], Any], on_success: Callable[[Any], None]):
+        started = time.monotonic()
+
+        def retried(error, attempt):
+            item.attempts = attempt + 1
+            metrics.record_retry(action_operations[item.action])
+            logger.warning("Throttled on {} {} (attempt {}), backing off".format(item.action, item.cluster_id or item.cluster_size, attempt))
+
+        try:
+            result, item.attempts = call_with_retry(function, self._bucket, self._max_attempts, on_retry=retried)
+            on_success(result)
+        except Exception as e:
+            item.attempts = max(item.attempts, 1)
+            item.status = "FAILED"
+            item.error = str(e)
+            logger.error("{} failed for {}: {}".format(item.action, item.cluster_id or item.cluster_size, e))
+        item.elapsed = round(time.monotonic() - started, 3)
+        return item
+
+    def _run(self, jobs: List[tuple]) -> List[BulkItem]:
+        with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+            return list(executor.map(lambda x: self._execute(*x), jobs))
+
+    def create(self, entries: List[Dict[str, Any]], emr_config_path: str) -> List[BulkItem]:
+        """
+        Launch count clusters for every (param_set, size) entry.
+
+        Arguments:
+            entries {List[Dict[str, Any]]} -- Manifest entries, see load_manifest
+            emr_config_path {str} -- emr.yaml path
+
+        Returns:
+            List[BulkItem] -- Outcome per cluster, status SUBMITTED or FAILED
+        """
+        jobs: List[tuple] = []
+        managers: Dict[tuple, ComputeManager] = {}
+        for entry in entries:
+            key = (entry["param_set"], entry["size"])
+            if key not in managers:
+                managers[key] = ComputeManager(cluster_size=entry["size"], param_set_name=entry["param_set"],
+                                               emr_config_path=emr_config_path, emr=self._emr)
+            for _ in range(entry["count"]):
+                item = BulkItem("create", param_set=entry["param_set"], cluster_size=entry["size"])
+
+                def submitted(response, item=item):
+                    item.cluster_id = response["JobFlowId"]
+                    item.status = "SUBMITTED"
+
+                jobs.append((item, managers[key].start_compute, submitted))
+        return self._run(jobs)
+
+    def terminate(self, cluster_ids: List[str], disable_protection: bool = False) -> List[BulkItem]:
+        """
+        Terminate clusters.
+
+        Arguments:
+            cluster_ids {List[str]} -- JobFlowIds
+
+        Keyword Arguments:
+            disable_protection {bool} -- Turn termination protection off first (default: {False})
+
+        Returns:
+            List[BulkItem] -- Outcome per cluster, status TERMINATING or FAILED
+        """
+        jobs: List[tuple] = []
+        for cluster_id in cluster_ids:
+            item = BulkItem("terminate", cluster_id=cluster_id)
+
+            def terminate(cluster_id=cluster_id):
+                if disable_protection:
+                    self._emr.set_termination_protection(cluster_id, False)
+                return self._emr.terminate_cluster(cluster_id)
+
+            def terminating(response, item=item):
+                item.status = "TERMINATING"
+
+            jobs.append((item, terminate, terminating))
+        return self._run(jobs)
+
+
+def format_report(items: List[BulkItem]) -> str:
+    """
+    Plain text status table of a bulk run.
+
+    Arguments:
+        items {List[BulkItem]} -- Bulk run outcome
+
+    Returns:
+        str -- One line per item and a summary line
+    """
+    lines = ["{:<10} {:<12} {:<6} {:<22} {:<12} {:>8} {:>9}  {}".format(
+        "ACTION", "PARAM_SET", "SIZE", "CLUSTER_ID", "STATUS", "ATTEMPTS", "SECONDS", "ERROR")]
+    for x in items:
+        lines.append("{:<10} {:<12} {:<6} {:<22} {:<12} {:>8} {:>9.1f}  {}".format(
+            x.action, x.param_set or "-", x.cluster_size or "-", x.cluster_id or "-", x.status,
+            x.attempts, x.elapsed, x.error or ""))
+    failed = len([x for x in items if x.status == "FAILED"])
+    lines.append("{} item(s), {} succeeded, {} failed".format(len(items), len(items) - failed, failed))
+    return "\n".join(lines)
@@ -0,0 +1,257 @@
+import os
+import json
+import time
+import uuid
+import fcntl
+import threading
+import logging
+import tempfile
+from contextlib import contextmanager
+from typing import Optional, List, Dict
+from aws_beamline_devtools.emr_client import EMR, pool_tag_key
+
+logger = logging.getLogger(__name__)
+
+default_pool_state_path = os.path.join(os.path.expanduser("~"), ".beamline", "cluster_pool.json")
+# Pool clusters still coming up can be handed out when no ready one is left; the caller waits for them.
+ready_states = ["WAITING"]
+provisioning_states = ["STARTING", "BOOTSTRAPPING"]
+# Reserved pool slots not launched within this many seconds are given up.
+reservation_ttl_seconds = 1800
+
+
+@contextmanager
+def locked_json_state(path: str, empty: Dict):
+    """
+    Read, modify and atomically save a JSON state file under an exclusive file lock.
+
+    Arguments:
+        path {str} -- State file
+        empty {Dict} -- State to start from when the file does not exist yet
+
+    Yields:
+        Dictionary -- State, saved when the block exits, also when it raises
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    with open(path + ".lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            state = empty
+            if os.path.exists(path):
+                with open(path) as f:
+                    state = json.load(f)
+            try:
+                yield state
+            finally:
+                # Saved even when an API call fails part way, so launched clusters are not lost.
+                fd, tmp_path = tempfile.mkstemp(dir=directory, prefix="." + os.path.basename(path) + ".")
+                with os.fdopen(fd, "w") as f:
+                    json.dump(state, f, indent=2, sort_keys=True)
+                os.replace(tmp_path, path)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class ClusterPool:
+    """
+    Pool of pre-warmed, unassigned EMR clusters per (parameter set, cluster size).
+
+    The pool state is a JSON file guarded by an exclusive file lock, so several attach-emr
+    processes on the same notebook instance can share it without handing out a cluster twice.
+    """
+    def __init__(self, emr: EMR, state_path: str = default_pool_state_path):
+        """
+        Arguments:
+            emr {EMR} -- EMR client used to check, launch and terminate pool clusters
+
+        Keyword Arguments:
+            state_path {str} -- Local pool state file (default: {~/.beamline/cluster_pool.json})
+        """
+        self._emr = emr
+        self._state_path = state_path
+
+    def _locked_state(self):
+        return locked_json_state(self._state_path, {"clusters": {}, "reservations": {}})
+
+    def cluster_ids(self) -> List[str]:
+        """
+        JobFlowIds of the unassigned clusters in the pool, any size and parameter set.
+
+        Returns:
+            List[str] -- JobFlowIds
+        """
+        with self._locked_state() as state:
+            return sorted(state["clusters"])
+
+    @staticmethod
+    def _members(state: Dict, param_set_name: str, cluster_size: str) -> Dict[str, Dict]:
+        return {k: v for k, v in state["clusters"].items()
+                if v["param_set"] == param_set_name and v["cluster_size"] == cluster_size}
+
+    def acquire(self, compute_manager) -> Optional[str]:
+        """
+        Take a cluster out of the pool. Ready clusters are preferred, then the oldest cluster still
+        provisioning. Clusters built from an outdated specification are never handed out.
+
+        Arguments:
+            compute_manager {ComputeManager} -- Manager for the requested size and parameter set
+
+        Returns:
+            Optional[str] -- JobFlowId of the assigned cluster, None when the pool is empty
+        """
+        fingerprint = compute_manager.spec_fingerprint()
+        with self._locked_state() as state:
+            members = self._members(state, compute_manager.param_set_name, compute_manager.cluster_size)
+            fallback: Optional[str] = None
+            for cluster_id, entry in sorted(members.items(), key=lambda x: x[1]["created_at"]):
+                if entry["fingerprint"] != fingerprint:
+                    continue
+                cluster_state = self._emr.get_cluster_state(cluster_id)
+                if cluster_state in ready_states:
+                    del state["clusters"][cluster_id]
+                    logger.info("Assigned warm cluster {} from the pool".format(cluster_id))
+                    return cluster_id
+                if cluster_state in provisioning_states:
+                    fallback = fallback or cluster_id
+                else:
+                    logger.info("Dropping pool cluster {} in state {}".format(cluster_id, cluster_state))
+                    del state["clusters"][cluster_id]
+            if fallback is not None:
+                del state["clusters"][fallback]
+                logger.info("No warm cluster is ready, assigned cluster {} still provisioning from the pool".format(fallback))
+            return fallback
+
+    def replenish(self, compute_manager, target_idle: int, idle_ttl_minutes: int) -> List[str]:
+        """
+        Launch clusters until the pool holds target_idle unassigned clusters for the size and
+        parameter set. Launches return as soon as EMR accepts them, provisioning happens in the
+        background.
+
+        Missing slots are reserved under the pool lock and launched outside of it, since a launch
+        may first build and upload a dependency layer; other processes can acquire clusters
+        meanwhile and do not launch the reserved slots a second time.
+
+        Arguments:
+            compute_manager {ComputeManager} -- Manager for the size and parameter set
+            target_idle {int} -- Number of unassigned clusters to keep
+            idle_ttl_minutes {int} -- Minutes an unassigned cluster may stay in the pool
+
+        Returns:
+            List[str] -- JobFlowIds of the launched clusters
+        """
+        fingerprint = compute_manager.spec_fingerprint()
+        now = time.time()
+        with self._locked_state() as state:
+            reservations = state.setdefault("reservations", {})
+            for reservation_id, entry in list(reservations.items()):
+                # Left behind by a process that died while launching.
+                if now - entry["reserved_at"] > reservation_ttl_seconds:
+                    del reservations[reservation_id]
+            members = self._members(state, compute_manager.param_set_name, compute_manager.cluster_size)
+            current = len([x for x in members.values() if x["fingerprint"] == fingerprint])
+            current += len([x for x in reservations.values() if x["fingerprint"] == fingerprint and
+                            x["param_set"] == compute_manager.param_set_name and x["cluster_size"] == compute_manager.cluster_size])
+            reserved = []
+            for _ in range(max(0, target_idle - current)):
+                reservation_id = uuid.uuid4().hex
+                reservations[reservation_id] = {
+                    "param_set": compute_manager.param_set_name,
+                    "cluster_size": compute_manager.cluster_size,
+                    "fingerprint": fingerprint,
+                    "reserved_at": now,
+                }
+                reserved.append(reservation_id)
+
+        launched: List[str] = []
+        try:
+            for reservation_id in reserved:
+                cluster_id = compute_manager.start_compute(extra_tags={pool_tag_key: "true"}).get("JobFlowId")
+                with self._locked_state() as state:
+                    state.setdefault("reservations", {}).pop(reservation_id, None)
+                    state["clusters"][cluster_id] = {
+                        "param_set": compute_manager.param_set_name,
+                        "cluster_size": compute_manager.cluster_size,
+                        "fingerprint": fingerprint,
+                        "created_at": time.time(),
+                        "idle_ttl_minutes": idle_ttl_minutes,
+                    }
+                launched.append(cluster_id)
+        finally:
+            unused = reserved[len(launched):]
+            if unused:
+                with self._locked_state() as state:
+                    for reservation_id in unused:
+                        state.setdefault("reservations", {}).pop(reservation_id, None)
+        if launched:
+            logger.info("Launched {} cluster(s) to refill the pool: {}".format(len(launched), launched))
+        return launched
+
+    def evict_expired(self, fingerprints: Optional[Dict[tuple, str]] = None,
+                      idle_ttl_minutes: Optional[Dict[tuple, int]] = None) -> List[str]:
+        """
+        Terminate unassigned clusters that sat in the pool past their TTL, or that were built from a
+        specification other than the current one.
+
+        Keyword Arguments:
+            fingerprints {Optional[Dict[tuple, str]]} -- Current spec fingerprint per (param_set, cluster_size) (default: {None})
+            idle_ttl_minutes {Optional[Dict[tuple, int]]} -- Current TTL per (param_set, cluster_size), overrides the TTL recorded at launch (default: {None})
+
+        Returns:
+            List[str] -- JobFlowIds of the terminated clusters
+        """
+        now = time.time()
+        evicted: List[str] = []
+        with self._locked_state() as state:
+            for cluster_id, entry in list(state["clusters"].items()):
+                key = (entry["param_set"], entry["cluster_size"])
+                expected = (fingerprints or {}).get(key)
+                ttl = (idle_ttl_minutes or {}).get(key, entry["idle_ttl_minutes"])
+                expired = now - entry["created_at"] > ttl * 60
+                if expired or (expected is not None and expected != entry["fingerprint"]):
+                    logger.info("Evicting pool cluster {} ({})".format(cluster_id, "idle TTL expired" if expired else "outdated specification"))
+                    self._emr.set_termination_protection(cluster_id, False)
+                    self._emr.terminate_cluster(cluster_id)
+                    del state["clusters"][cluster_id]
+                    evicted.append(cluster_id)
+        return evicted
+
+    def maintain(self, compute_manager, target_idle: int, idle_ttl_minutes: int) -> Dict[str, List[str]]:
+        """
+        Evict expired or outdated clusters, then refill the pool for a size and parameter set.
+
+        Arguments:
+            compute_manager {ComputeManager} -- Manager for the size and parameter set
+            target_idle {int} -- Number of unassigned clusters to keep
+            idle_ttl_minutes {int} -- Minutes an unassigned cluster may stay in the pool
+
+        Returns:
+            Dictionary -- JobFlowIds that were "evicted" and "launched"
+        """
+        key = (compute_manager.param_set_name, compute_manager.cluster_size)
+        evicted = self.evict_expired({key: compute_manager.spec_fingerprint()}, {key: idle_ttl_minutes})
+        launched = self.replenish(compute_manager, target_idle, idle_ttl_minutes)
+        return {"evicted": evicted, "launched": launched}
+
+    def maintain_in_background(self, compute_manager, target_idle: int, idle_ttl_minutes: int) -> threading.Thread:
+        """
+        Run maintain in a thread, e.g. while the caller waits for its own cluster. Failures are logged,
+        a pool that could not be refilled is refilled by the next attach or --maintainPool.
+
+        Arguments:
+            compute_manager {ComputeManager} -- Manager for the size and parameter set, not shared with the caller
+            target_idle {int} -- Number of unassigned clusters to keep
+            idle_ttl_minutes {int} -- Minutes an unassigned cluster may stay in the pool
+
+        Returns:
+            threading.Thread -- Started thread, to be joined
+        """
+        def run():
+            try:
+                self.maintain(compute_manager, target_idle, idle_ttl_minutes)
+            except Exception as e:
+                logger.warning("Could not maintain the cluster pool: {}".format(e))
+
+        thread = threading.Thread(target=run, name="cluster-pool-maintain")
+        thread.start()
+        return thread
@@ -1,16 +1,15 @@
 import os
-import json
-import boto3
 import logging
-import importlib
-from botocore.config import Config
-from aws_beamline_devtools.emr_client import EMR
+from typing import Optional, List, Dict, Any
+from aws_beamline_devtools.emr_client import EMR, FleetResize, param_set_tag_key, cluster_size_tag_key, fingerprint_tag_key
 from aws_beamline_devtools.emr_config import EMRConfig
+from aws_beamline_devtools.instrumentation import log_response
+from aws_beamline_devtools.spark_tuning import tune_spark
+from aws_beamline_devtools.dependency_layer import DependencyLayer, layer_for_param_set
+from aws_beamline_devtools.launch_history import LaunchHistory, default_history_path
+from aws_beamline_devtools.provisioning import ProvisioningPlan, ProvisioningPredictor, log_plan, rank_subnets
 
-logging.basicConfig(
-    format='%(asctime)s %(levelname)-8s %(message)s',
-    level=logging.INFO,
-    datefmt='%Y-%m-%d %H:%M:%S')
+logger = logging.getLogger(__name__)
 
 compute_engine = "Spark"
 
@@ -22,7 +21,8 @@ class ComputeManager():
     Returns:
         Dictionary -- Response to run_job_flow API
     """
-    def __init__(self, cluster_size: str, param_set_name: str, emr_config_path: str):
+    def __init__(self, cluster_size: str, param_set_name: str, emr_config_path: str, emr: Optional[EMR] = None,
+                 target_ready_seconds: Optional[float] = None, history: Optional[LaunchHistory] = None):
         """
         Creates a new compute based on size, parameter set and configuration path provided.
 
@@ -30,23 +30,80 @@ class ComputeManager():
             cluster_size {str} -- Size of the cluster to be created
             param_set_name {str} -- Parameters set name
             emr_config_path {str} -- Path where the emr configuration file is stored.
+
+        Keyword Arguments:
+            emr {Optional[EMR]} -- EMR client to use, a new one sharing the process wide boto3 client when not provided (default: {None})
+            target_ready_seconds {Optional[float]} -- Time to ready target; spot and on demand capacity and spot timeouts are chosen from the launch history to meet it (default: {None})
+            history {Optional[LaunchHistory]} -- Launch history predictions and subnet rankings are made from (default: {~/.beamline/history.db})
         """
         self._cluster_size = cluster_size
         self._param_set_name = param_set_name
         self._emr_config_path = emr_config_path
-        self.compute_client = EMR()
+        self.compute_client = emr if emr is not None else EMR()
         self.compute_config = EMRConfig(cluster_size=self._cluster_size,
                                     param_set_name=self._param_set_name,
                                     emr_config_path=self._emr_config_path
                                 )
+        self._dependency_layer: Optional[DependencyLayer] = None
+        self._target_ready_seconds = target_ready_seconds
+        self._history = history
+        self.provisioning_plan: Optional[ProvisioningPlan] = None
+        # Spec fingerprint the last cluster started by start_compute is tagged with.
+        self.launch_fingerprint: Optional[str] = None
+
+    @property
+    def cluster_size(self):
+        return self._cluster_size
+
+    @property
+    def param_set_name(self):
+        return self._param_set_name
 
-    def start_compute(self):
-        logging.info("Creating a new EMR cluster: cluster_size = {}, parameter_set_name = {}".format(self._cluster_size, self._param_set_name ))
-        response = self.compute_client.create_cluster(
-            cluster_name = compute_engine+"-"+self._param_set_name+"-Size-"+self._cluster_size,
+    @property
+    def cluster_name(self):
+        return compute_engine+"-"+self._param_set_name+"-Size-"+self._cluster_size
+
+    @property
+    def dependency_layer(self) -> Optional[DependencyLayer]:
+        """
+        Dependency layer of the parameter set, None when it declares no dependencies. JAR paths are relative to emr.yaml.
+        """
+        if self._dependency_layer is None:
+            self._dependency_layer = layer_for_param_set(self.compute_config, os.path.dirname(os.path.abspath(self._emr_config_path)))
+        return self._dependency_layer
+
+    def cluster_parameters(self, extra_tags: Optional[Dict[str, str]] = None,
+                           steps: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """
+        Keyword arguments passed to EMR.create_cluster for this size and parameter set.
+
+        Keyword Arguments:
+            extra_tags {Optional[Dict[str, str]]} -- Tags added on top of the configured ones (default: {None})
+            steps {Optional[List[Dict[str, Any]]]} -- Steps run once the cluster is up, see StepSpec.step_config (default: {None})
+
+        Returns:
+            Dictionary -- create_cluster keyword arguments
+        """
+        tags = dict(self.compute_config.tags or {})
+        tags[param_set_tag_key] = self._param_set_name
+        tags[cluster_size_tag_key] = self._cluster_size
+        tags.update(extra_tags or {})
+        spark_defaults = self.compute_config.spark_defaults
+        if self.compute_config.spark_executor_tuning:
+            # Configured spark_defaults win over the tuned values.
+            spark_defaults = dict(tune_spark(self.compute_config).properties(), **(spark_defaults or {}))
+        bootstraps_paths = self.compute_config.bootstraps_paths
+        spark_jars_path = self.compute_config.spark_jars_path
+        if self.dependency_layer is not None:
+            # The layer is installed before the configured bootstrap actions, which may use it.
+            bootstraps_paths = [self.dependency_layer.bootstrap_path] + list(bootstraps_paths or [])
+            spark_jars_path = list(spark_jars_path or []) + self.dependency_layer.spark_jars()
+        return dict(
+            cluster_name = self.cluster_name,
             logging_s3_path = self.compute_config.logging_s3_path,
             emr_release = self.compute_config.emr_release_label,
             subnet_id = self.compute_config.subnet_id,
+            subnet_ids = self.compute_config.subnet_ids,
             emr_ec2_role = self.compute_config.emr_ec2_role,
             emr_role=self.compute_config.emr_role,
             num_concurrent_steps = self.compute_config.num_concurrent_steps,
@@ -72,11 +129,37 @@ class ComputeManager():
             spot_timeout_to_on_demand_master= self.compute_config.spot_timeout_to_on_demand_master,
             spot_timeout_to_on_demand_core= self.compute_config.spot_timeout_to_on_demand_core,
             spot_timeout_to_on_demand_task= self.compute_config.spot_timeout_to_on_demand_task,
+            instance_types_master = self.compute_config.instance_types_master,
+            instance_types_core = self.compute_config.instance_types_core,
+            instance_types_task = self.compute_config.instance_types_task,
+            spot_allocation_strategy_master = self.compute_config.spot_allocation_strategy_master,
+            spot_allocation_strategy_core = self.compute_config.spot_allocation_strategy_core,
+            spot_allocation_strategy_task = self.compute_config.spot_allocation_strategy_task,
+            on_demand_allocation_strategy_master = self.compute_config.on_demand_allocation_strategy_master,
+            on_demand_allocation_strategy_core = self.compute_config.on_demand_allocation_strategy_core,
+            on_demand_allocation_strategy_task = self.compute_config.on_demand_allocation_strategy_task,
+            ebs_volume_type_master = self.compute_config.ebs_volume_type_master,
+            ebs_volume_type_core = self.compute_config.ebs_volume_type_core,
+            ebs_volume_type_task = self.compute_config.ebs_volume_type_task,
+            ebs_volumes_per_instance_master = self.compute_config.ebs_volumes_per_instance_master,
+            ebs_volumes_per_instance_core = self.compute_config.ebs_volumes_per_instance_core,
+            ebs_volumes_per_instance_task = self.compute_config.ebs_volumes_per_instance_task,
+            ebs_iops_master = self.compute_config.ebs_iops_master,
+            ebs_iops_core = self.compute_config.ebs_iops_core,
+            ebs_iops_task = self.compute_config.ebs_iops_task,
+            ebs_throughput_master = self.compute_config.ebs_throughput_master,
+            ebs_throughput_core = self.compute_config.ebs_throughput_core,
+            ebs_throughput_task = self.compute_config.ebs_throughput_task,
+            managed_scaling_min_units = self.compute_config.managed_scaling_min_units,
+            managed_scaling_max_units = self.compute_config.managed_scaling_max_units,
+            managed_scaling_max_on_demand_units = self.compute_config.managed_scaling_max_on_demand_units,
+            managed_scaling_max_core_units = self.compute_config.managed_scaling_max_core_units,
+            auto_termination_idle_minutes = self.compute_config.auto_termination_idle_minutes,
             python3= self.compute_config.python3,
             spark_glue_catalog= self.compute_config.spark_glue_catalog,
             hive_glue_catalog= self.compute_config.hive_glue_catalog,
             presto_glue_catalog= self.compute_config.presto_glue_catalog,
-            bootstraps_paths= self.compute_config.bootstraps_paths,
+            bootstraps_paths= bootstraps_paths,
             debugging= self.compute_config.debugging,
             applications= self.compute_config.applications,
             visible_to_all_users= self.compute_config.visible_to_all_users,
@@ -87,13 +170,129 @@ class ComputeManager():
             security_groups_slave_additional= self.compute_config.security_groups_slave_additional,
             security_group_service_access= self.compute_config.security_group_service_access,
             spark_log_level = "INFO",
-            spark_jars_path = self.compute_config.spark_jars_path,
-            spark_defaults = self.compute_config.spark_defaults,
+            spark_jars_path = spark_jars_path,
+            spark_defaults = spark_defaults,
             maximize_resource_allocation = self.compute_config.maximize_resource_allocation,
-            steps= None,
+            steps= steps,
             keep_cluster_alive_when_no_steps= self.compute_config.keep_cluster_alive_when_no_steps,
             termination_protected= self.compute_config.termination_protected,
-            tags= self.compute_config.tags
+            tags= tags
         )
-        logging.info(f"response: \n{json.dumps(response, default=str, indent=4)}")
+
+    def spec_fingerprint(self) -> str:
+        """
+        Fingerprint of the cluster specification this manager would launch.
+
+        Returns:
+            str -- Spec fingerprint, see EMR.spec_fingerprint
+        """
+        return EMR.spec_fingerprint(EMR._build_cluster_args(**self.cluster_parameters()))
+
+    def find_compute(self) -> Optional[Dict]:
+        """
+        Look up a live cluster launched from the same specification.
+
+        Returns:
+            Optional[Dict] -- Matching cluster from describe_cluster, None when there is none
+        """
+        return self.compute_client.find_cluster_by_fingerprint(self.spec_fingerprint(), cluster_name=self.cluster_name)
+
+    def update_policies(self, cluster_id: str):
+        """
+        Apply the managed scaling and auto termination settings of this size to a running cluster,
+        removing policies the size no longer declares.
+
+        Arguments:
+            cluster_id {str} -- JobFlowId
+        """
+        config = self.compute_config
+        if config.managed_scaling_max_units is not None:
+            self.compute_client.put_managed_scaling_policy(cluster_id, config.managed_scaling_min_units, config.managed_scaling_max_units,
+                                                           config.managed_scaling_max_on_demand_units, config.managed_scaling_max_core_units)
+        else:
+            self.compute_client.remove_managed_scaling_policy(cluster_id)
+        if config.auto_termination_idle_minutes is not None:
+            self.compute_client.put_auto_termination_policy(cluster_id, config.auto_termination_idle_minutes)
+        else:
+            self.compute_client.remove_auto_termination_policy(cluster_id)
+        logger.info("Scaling and auto termination policies of cluster {} updated from size {}".format(cluster_id, self._cluster_size))
+
+    def resize_compute(self, cluster_id: str, wait: bool = False, timeout: float = 1800) -> List[FleetResize]:
+        """
+        Resize a running cluster in place to this size, see EMR.resize_cluster. The cluster is tagged
+        with its new size, and its spec fingerprint tag is removed since it no longer matches the
+        specification it was launched from, so later launches do not reuse it.
+
+        Arguments:
+            cluster_id {str} -- JobFlowId
+
+        Keyword Arguments:
+            wait {bool} -- Wait until the fleets have their new capacity (default: {False})
+            timeout {float} -- Seconds to wait for (default: {1800})
+
+        Returns:
+            List[FleetResize] -- Change per fleet
+        """
+        changes = self.compute_client.resize_cluster(cluster_id, self.cluster_parameters(), wait=False)
+        if all(x.action == "unchanged" for x in changes):
+            logger.info("Cluster {} already has the fleets of size {}".format(cluster_id, self._cluster_size))
+            return changes
+        self.compute_client.add_tags(cluster_id, {cluster_size_tag_key: self._cluster_size})
+        self.compute_client.remove_tags(cluster_id, [fingerprint_tag_key])
+        logger.info("Cluster {} resized to size {}".format(cluster_id, self._cluster_size))
+        if wait:
+            self.compute_client.wait_for_fleets(cluster_id, changes, timeout)
+        return changes
+
+    def plan_provisioning(self) -> Optional[ProvisioningPlan]:
+        """
+        Plan spot and on demand capacity against the time to ready target, see ProvisioningPredictor.plan.
+
+        Returns:
+            Optional[ProvisioningPlan] -- None without a target
+        """
+        if self._target_ready_seconds is None:
+            return None
+        return ProvisioningPredictor(self.launch_history).plan(self.compute_config, self._target_ready_seconds)
+
+    @property
+    def launch_history(self) -> LaunchHistory:
+        if self._history is None:
+            self._history = LaunchHistory(default_history_path)
+        return self._history
+
+    def ranked_subnets(self) -> Optional[List[str]]:
+        """
+        Subnets of the parameter set, best ranked first when subnet_ranking is enabled, see rank_subnets.
+        With subnet_ranking_keep only that many of the best ranked subnets are returned.
+
+        Returns:
+            Optional[List[str]] -- None when the parameter set uses a single subnet_id
+        """
+        config = self.compute_config
+        if not config.subnet_ids:
+            return None
+        if not config.subnet_ranking:
+            return list(config.subnet_ids)
+        scores = rank_subnets(self.launch_history, list(config.subnet_ids))
+        logger.info("Subnets ranked by recent launches: {}".format(
+            ", ".join("{} ({}/{} ready)".format(x.subnet_id, x.succeeded, x.launches) for x in scores)))
+        return [x.subnet_id for x in scores][:config.subnet_ranking_keep]
+
+    def start_compute(self, extra_tags: Optional[Dict[str, str]] = None, steps: Optional[List[Dict[str, Any]]] = None):
+        logger.info("Creating a new EMR cluster: cluster_size = {}, parameter_set_name = {}".format(self._cluster_size, self._param_set_name ))
+        if self.dependency_layer is not None:
+            self.dependency_layer.ensure()
+        parameters = self.cluster_parameters(extra_tags, steps)
+        # Taken before subnet ranking and plan overrides, so find_compute reuses the cluster as one of this size
+        # whichever subnets or purchase options the launch was given.
+        self.launch_fingerprint = EMR.spec_fingerprint(EMR._build_cluster_args(**dict(parameters, steps=None)))
+        if self.compute_config.subnet_ranking:
+            parameters["subnet_ids"] = self.ranked_subnets()
+        self.provisioning_plan = self.plan_provisioning()
+        if self.provisioning_plan is not None:
+            log_plan(self.provisioning_plan)
+            parameters.update(self.provisioning_plan.overrides)
+        response = self.compute_client.create_cluster(fingerprint=self.launch_fingerprint, **parameters)
+        log_response(logger, "start_compute", response)
         return (response)
@@ -1,14 +1,53 @@
-import re
+import os
+import copy
 import json
-import requests
+import stat
+import pkgutil
 import logging
+import tempfile
+from typing import Optional, List, Dict, Any
 
-logging.basicConfig(
-    format='%(asctime)s %(levelname)-8s %(message)s',
-    level=logging.INFO,
-    datefmt='%Y-%m-%d %H:%M:%S')
+logger = logging.getLogger(__name__)
+
+# The bundled template (templates/sparkmagic_config.json) is example_config.json from this sparkmagic release.
+sparkmagic_version = "0.15.0"
+url = "https://raw.githubusercontent.com/jupyter-incubator/sparkmagic/{}/sparkmagic/example_config.json".format(sparkmagic_version)
+default_config_path = "/home/ec2-user/.sparkmagic/config.json"
+default_cache_dir = os.path.join(os.path.expanduser("~"), ".cache", "aws_beamline_devtools")
+kernel_credentials = ["kernel_python_credentials", "kernel_scala_credentials", "kernel_r_credentials"]
+livy_port = 8998
+# sparkmagic ignores unknown keys, reserved Livy sessions are recorded under this one for code using Livy directly.
+livy_sessions_key = "beamline_livy_sessions"
+
+
+def write_json_atomic(path: str, content: Dict):
+    """
+    Write a JSON document so readers never see a partially written file. An existing file keeps its
+    permissions, a new one gets the default ones of the umask.
+
+    Arguments:
+        path {str} -- Target path
+        content {Dict} -- Document to write
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    try:
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        mode = 0o666 & ~umask
+    # mkstemp creates the file 0600.
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix="." + os.path.basename(path) + ".")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(content, f, indent=2)
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
 
-url = "https://raw.githubusercontent.com/jupyter-incubator/sparkmagic/master/sparkmagic/example_config.json"
 
 class CreateSparkMagicConfig():
     """
@@ -17,12 +56,122 @@ class CreateSparkMagicConfig():
     Returns:
         Boolean -- Config file created?
     """
-    def __init__(self):
-        self.config_template = requests.get(url).text
-
-    def generate_config(self, master_private_ip: str):
-        logging.info("Generating sparkmagic configuration")
-        config_file = open("/home/ec2-user/.sparkmagic/config.json", "w+")
-        config_file.write(re.sub("localhost", master_private_ip, self.config_template))
-        config_file.close()
+    def __init__(self,
+                 config_path: str = default_config_path,
+                 refresh_template: bool = False,
+                 cache_dir: Optional[str] = default_cache_dir,
+                 template_url: str = url,
+                 timeout: float = 5):
+        """
+        Loads the sparkmagic config template. A template cached on disk by an earlier refresh is
+        preferred over the one bundled with the package; the network is only used on refresh.
+
+        Keyword Arguments:
+            config_path {str} -- Where the sparkmagic config is written (default: {"/home/ec2-user/.sparkmagic/config.json"})
+            refresh_template {bool} -- Revalidate the cached template against template_url using ETag / Last-Modified (default: {False})
+            cache_dir {Optional[str]} -- Template cache directory, None disables the cache (default: {~/.cache/aws_beamline_devtools})
+            template_url {str} -- Template download url (default: {url})
+            timeout {float} -- Template download timeout in seconds (default: {5})
+        """
+        self._config_path = config_path
+        self._cache_dir = cache_dir
+        self._template_url = template_url
+        self._timeout = timeout
+        template = self._cached_template()
+        if refresh_template and self._cache_dir is not None:
+            template = self._refresh_template() or template
+        self.config_template: Dict = template or json.loads(
+            pkgutil.get_data("aws_beamline_devtools", "templates/sparkmagic_config.json").decode("utf-8"))
+
+    @property
+    def config_path(self):
+        return self._config_path
+
+    def _cache_paths(self):
+        return (os.path.join(self._cache_dir, "sparkmagic_config.json"),
+                os.path.join(self._cache_dir, "sparkmagic_config.meta.json"))
+
+    def _cached_template(self) -> Optional[Dict]:
+        if self._cache_dir is None:
+            return None
+        template_path, meta_path = self._cache_paths()
+        if not (os.path.exists(template_path) and os.path.exists(meta_path)):
+            return None
+        try:
+            with open(meta_path) as f:
+                if json.load(f).get("url") != self._template_url:
+                    # Cached for another pinned sparkmagic version.
+                    return None
+            with open(template_path) as f:
+                return json.load(f)
+        except ValueError:
+            logger.warning("Ignoring corrupt cached sparkmagic template {}".format(template_path))
+            return None
+
+    def _refresh_template(self) -> Optional[Dict]:
+        # urllib.request pulls in http.client and ssl, only worth importing when refreshing.
+        import urllib.error
+        import urllib.request
+        template_path, meta_path = self._cache_paths()
+        meta: Dict = {}
+        if os.path.exists(meta_path) and os.path.exists(template_path):
+            try:
+                with open(meta_path) as f:
+                    meta = json.load(f)
+            except ValueError:
+                # Fetched unconditionally, which rewrites the metadata.
+                logger.warning("Ignoring corrupt cached sparkmagic template metadata {}".format(meta_path))
+            if meta.get("url") != self._template_url:
+                meta = {}
+        request = urllib.request.Request(self._template_url)
+        if meta.get("etag"):
+            request.add_header("If-None-Match", meta["etag"])
+        if meta.get("last_modified"):
+            request.add_header("If-Modified-Since", meta["last_modified"])
+        try:
+            with urllib.request.urlopen(request, timeout=self._timeout) as response:
+                template = json.loads(response.read().decode("utf-8"))
+                headers = response.headers
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                logger.info("Cached sparkmagic template is up to date")
+            else:
+                logger.warning("Could not refresh sparkmagic template from {}: {}".format(self._template_url, e))
+            return None
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            logger.warning("Could not refresh sparkmagic template from {}: {}".format(self._template_url, e))
+            return None
+        write_json_atomic(template_path, template)
+        write_json_atomic(meta_path, {"url": self._template_url,
+                                      "etag": headers.get("ETag"),
+                                      "last_modified": headers.get("Last-Modified")})
+        logger.info("Refreshed cached sparkmagic template from {}".format(self._template_url))
+        return template
+
+    def build_config(self, master_private_ip: str, port: int = livy_port,
+                     sessions: Optional[Dict[str, List[Dict[str, Any]]]] = None) -> Dict:
+        """
+        Sparkmagic config pointing every kernel at the Livy server of the cluster.
+
+        Arguments:
+            master_private_ip {str} -- Private IP of the EMR master node
+
+        Keyword Arguments:
+            port {int} -- Livy port (default: {8998})
+            sessions {Optional[Dict[str, List[Dict[str, Any]]]]} -- Reserved Livy sessions per kind, written under "beamline_livy_sessions" (default: {None})
+
+        Returns:
+            Dictionary -- Sparkmagic config
+        """
+        config = copy.deepcopy(self.config_template)
+        for kernel in kernel_credentials:
+            if kernel in config:
+                config[kernel]["url"] = "http://{}:{}".format(master_private_ip, port)
+        if sessions:
+            config[livy_sessions_key] = sessions
+        return config
+
+    def generate_config(self, master_private_ip: str, sessions: Optional[Dict[str, List[Dict[str, Any]]]] = None):
+        logger.info("Generating sparkmagic configuration at {}".format(self._config_path))
+        write_json_atomic(self._config_path, self.build_config(master_private_ip, sessions=sessions))
         return True
@@ -0,0 +1,258 @@
+import io
+import os
+import sys
+import json
+import shutil
+import hashlib
+import logging
+import tarfile
+import tempfile
+import threading
+import subprocess
+from typing import Optional, List, Dict, Sequence, Any
+
+logger = logging.getLogger(__name__)
+
+# Where the layer is extracted on every node.
+layer_root = "/opt/beamline/layer"
+# Bumped when the archive layout or the bootstrap script change, so older archives are rebuilt.
+layer_format_version = 1
+# Wheels are downloaded for the nodes' platform, not the one building the layer.
+node_platform = "manylinux2014_x86_64"
+
+bootstrap_template = """#!/bin/bash
+# Generated by aws_beamline_devtools.dependency_layer for dependency hash {digest}
+set -euo pipefail
+sudo mkdir -p {root}
+aws s3 cp {archive} - | sudo tar -xz -C {root}
+if [ -s {root}/requirements.txt ]; then
+  sudo python3 -m pip install --no-index --find-links {root}/wheelhouse -r {root}/requirements.txt
+fi
+"""
+
+
+def _file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _split_s3_path(path: str) -> tuple:
+    bucket, _, key = path[len("s3://"):].partition("/")
+    return bucket, key
+
+
+def new_s3_client(endpoint_url: Optional[str] = None):
+    """
+    Build a boto3 S3 client.
+
+    Keyword Arguments:
+        endpoint_url {Optional[str]} -- S3 endpoint, e.g. a local S3 stand-in (default: {None})
+
+    Returns:
+        botocore client -- boto3 S3 client
+    """
+    import boto3
+    kwargs: Dict[str, Any] = {"service_name": "s3"}
+    if endpoint_url is not None:
+        kwargs["endpoint_url"] = endpoint_url
+    return boto3.Session().client(**kwargs)
+
+
+class DependencyLayer:
+    """
+    Python requirements and JARs of a parameter set, prebuilt once into a content addressed
+    archive on S3. Nodes download and extract it with one bootstrap action and install the
+    wheels offline, instead of resolving packages from PyPI on every node of every cluster.
+    """
+    def __init__(self, s3_path: str, python_requirements: Optional[Sequence[str]] = None,
+                 jars: Optional[Sequence[str]] = None, python_version: str = "3.7",
+                 s3_client=None, endpoint_url: Optional[str] = None):
+        """
+        Arguments:
+            s3_path {str} -- S3 prefix the archives are staged under, e.g. s3://bucket/beamline/layers
+
+        Keyword Arguments:
+            python_requirements {Optional[Sequence[str]]} -- pip requirement specifiers (default: {None})
+            jars {Optional[Sequence[str]]} -- Local JAR paths (default: {None})
+            python_version {str} -- Python version of the nodes the wheels are downloaded for (default: {"3.7"})
+            s3_client {botocore client} -- S3 client to use (default: {None})
+            endpoint_url {Optional[str]} -- S3 endpoint of the lazily created client, e.g. a local S3 stand-in (default: {None})
+        """
+        if not s3_path.startswith("s3://"):
+            raise ValueError("Dependency layer location must be an s3:// path, got {}".format(s3_path))
+        self._s3_path = s3_path.rstrip("/")
+        self._python_requirements = list(python_requirements or [])
+        self._jars = list(jars or [])
+        self._python_version = python_version
+        self._s3_client = s3_client
+        self._endpoint_url = endpoint_url
+        self._digest: Optional[str] = None
+        # Launches sharing the layer, e.g. bulk ones, build it once.
+        self._ensure_lock = threading.Lock()
+        names = [os.path.basename(x) for x in self._jars]
+        if len(set(names)) != len(names):
+            raise ValueError("Dependency JARs must have distinct file names: {}".format(", ".join(self._jars)))
+
+    @property
+    def _s3(self):
+        if self._s3_client is None:
+            self._s3_client = new_s3_client(self._endpoint_url)
+        return self._s3_client
+
+    def manifest(self) -> Dict[str, Any]:
+        """
+        Everything the archive is built from; the dependency hash is taken over it.
+
+        Returns:
+            Dictionary -- Requirements, JAR names and contents hashes, target Python and platform
+        """
+        return {
+            "format": layer_format_version,
+            "python_version": self._python_version,
+            "platform": node_platform,
+            # pip resolves requirements as a set.
+            "python_requirements": sorted(self._python_requirements),
+            "jars": sorted([os.path.basename(x), _file_digest(x)] for x in self._jars),
+        }
+
+    @property
+    def digest(self) -> str:
+        if self._digest is None:
+            canonical = json.dumps(self.manifest(), sort_keys=True, separators=(",", ":"))
+            self._digest = hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+        return self._digest
+
+    @property
+    def archive_path(self) -> str:
+        return "{}/layer-{}.tar.gz".format(self._s3_path, self.digest[:16])
+
+    @property
+    def bootstrap_path(self) -> str:
+        return "{}/layer-{}.sh".format(self._s3_path, self.digest[:16])
+
+    def spark_jars(self) -> List[str]:
+        """
+        spark.jars entries of the layer's JARs, present on every node once extracted.
+
+        Returns:
+            List[str] -- local: URIs
+        """
+        return ["local://{}/jars/{}".format(layer_root, x) for x in sorted(os.path.basename(x) for x in self._jars)]
+
+    def bootstrap_script(self) -> str:
+        return bootstrap_template.format(digest=self.digest, root=layer_root, archive=self.archive_path)
+
+    def exists(self) -> bool:
+        """
+        Are the archive and bootstrap script of the current dependency hash staged?
+
+        Returns:
+            bool -- True when both objects exist
+        """
+        for path in (self.archive_path, self.bootstrap_path):
+            bucket, key = _split_s3_path(path)
+            try:
+                self._s3.head_object(Bucket=bucket, Key=key)
+            except Exception as e:
+                code = str((getattr(e, "response", None) or {}).get("Error", {}).get("Code"))
+                if code in ("404", "NoSuchKey", "NotFound"):
+                    return False
+                raise
+        return True
+
+    def _download_wheels(self, requirements_path: str, wheelhouse: str):
+        subprocess.check_call([sys.executable, "-m", "pip", "download", "--quiet", "--dest", wheelhouse,
+                               "--only-binary=:all:", "--platform", node_platform,
+                               "--python-version", self._python_version, "-r", requirements_path])
+
+    def build_archive(self, path: str):
+        """
+        Build the archive: requirements.txt, the wheels resolved for the nodes and the JARs.
+        Entries are sorted and stripped of times and owners.
+
+        Arguments:
+            path {str} -- Where the .tar.gz is written
+        """
+        workdir = tempfile.mkdtemp(prefix="beamline-layer-")
+        try:
+            requirements_path = os.path.join(workdir, "requirements.txt")
+            with open(requirements_path, "w") as f:
+                f.write("".join(x + "\n" for x in sorted(self._python_requirements)))
+            os.makedirs(os.path.join(workdir, "wheelhouse"))
+            os.makedirs(os.path.join(workdir, "jars"))
+            if self._python_requirements:
+                self._download_wheels(requirements_path, os.path.join(workdir, "wheelhouse"))
+            for jar in self._jars:
+                shutil.copyfile(jar, os.path.join(workdir, "jars", os.path.basename(jar)))
+            with tarfile.open(path, "w:gz") as archive:
+                for root, dirs, files in os.walk(workdir):
+                    dirs.sort()
+                    for name in sorted(dirs + files):
+                        full = os.path.join(root, name)
+                        info = archive.gettarinfo(full, os.path.relpath(full, workdir))
+                        info.mtime, info.uid, info.gid, info.uname, info.gname = 0, 0, 0, "root", "root"
+                        if info.isfile():
+                            with open(full, "rb") as f:
+                                archive.addfile(info, f)
+                        else:
+                            archive.addfile(info)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def ensure(self, force: bool = False) -> bool:
+        """
+        Stage the archive and its bootstrap script unless they exist for the current dependency hash.
+
+        Keyword Arguments:
+            force {bool} -- Rebuild and upload even when staged (default: {False})
+
+        Returns:
+            bool -- True when the layer was built, False when the staged one is reused
+        """
+        with self._ensure_lock:
+            if not force and self.exists():
+                logger.info("Reusing dependency layer {}".format(self.archive_path))
+                return False
+            self._stage()
+            return True
+
+    def _stage(self):
+        logger.info("Building dependency layer {} ({} Python requirement(s), {} JAR(s))".format(
+            self.archive_path, len(self._python_requirements), len(self._jars)))
+        fd, archive = tempfile.mkstemp(suffix=".tar.gz")
+        os.close(fd)
+        try:
+            self.build_archive(archive)
+            bucket, key = _split_s3_path(self.archive_path)
+            with open(archive, "rb") as f:
+                self._s3.put_object(Bucket=bucket, Key=key, Body=f)
+            # The script is uploaded last, so an existing script always points at a complete archive.
+            bucket, key = _split_s3_path(self.bootstrap_path)
+            self._s3.put_object(Bucket=bucket, Key=key, Body=io.BytesIO(self.bootstrap_script().encode("utf-8")))
+        finally:
+            os.unlink(archive)
+        logger.info("Dependency layer staged, bootstrap action {}".format(self.bootstrap_path))
+
+
+def layer_for_param_set(params, base_dir: str = ".", **kwargs) -> Optional[DependencyLayer]:
+    """
+    Dependency layer of a parameter set.
+
+    Arguments:
+        params {EMRConfig or ParamSetSpec} -- Parameter set with python_requirements, dependency_jars, dependency_s3_path and dependency_python_version
+
+    Keyword Arguments:
+        base_dir {str} -- Directory relative JAR paths are resolved against, usually the one of emr.yaml (default: {"."})
+        **kwargs -- Passed to DependencyLayer, e.g. s3_client or endpoint_url
+
+    Returns:
+        Optional[DependencyLayer] -- None when the parameter set declares no dependencies
+    """
+    if not params.python_requirements and not params.dependency_jars:
+        return None
+    jars = [os.path.join(base_dir, x) for x in params.dependency_jars or []]
+    return DependencyLayer(params.dependency_s3_path, params.python_requirements, jars,
+                           python_version=params.dependency_python_version, **kwargs)
@@ -1,20 +1,413 @@
-from typing import Optional, List, Dict, Any, Union, Collection
+from typing import Optional, List, Dict, Any, Union, Collection, Callable, Iterable, Iterator, Mapping
 import logging
 import json
-import boto3
+import time
+import hashlib
+import datetime
+import threading
+from aws_beamline_devtools.waiter import ClusterWaiter, WaitResult, failure_states
+from aws_beamline_devtools.response_cache import ResponseCache
+from aws_beamline_devtools.instrumentation import metrics, log_response
+from aws_beamline_devtools.instance_catalog import instance_store_disks
 
-logging.basicConfig(
-    format='%(asctime)s %(levelname)-8s %(message)s',
-    level=logging.INFO,
-    datefmt='%Y-%m-%d %H:%M:%S')
+logger = logging.getLogger(__name__)
+
+tag_prefix = "beamline:"
+fingerprint_tag_key = tag_prefix + "spec-fingerprint"
+pool_tag_key = tag_prefix + "pool"
+param_set_tag_key = tag_prefix + "param-set"
+cluster_size_tag_key = tag_prefix + "cluster-size"
+# Active states in the order a matching cluster is preferred for reuse.
+reusable_states = ["WAITING", "RUNNING", "BOOTSTRAPPING", "STARTING"]
+# Instance types EMR accepts per fleet; core and task fleets take more when an allocation strategy is set.
+max_fleet_instance_types = 5
+max_fleet_instance_types_with_strategy = 30
+spot_allocation_strategies = ("capacity-optimized", "price-capacity-optimized", "lowest-price", "diversified",
+                              "capacity-optimized-prioritized")
+on_demand_allocation_strategies = ("lowest-price", "prioritized")
+# Smallest and largest volume in GiB per EBS volume type.
+ebs_volume_sizes = {"gp2": (1, 16384), "gp3": (1, 16384), "io1": (4, 16384), "io2": (4, 16384),
+                    "st1": (125, 16384), "sc1": (125, 16384), "standard": (1, 1024)}
+
+# First releases of each major version supporting managed scaling and auto termination.
+managed_scaling_releases = {5: (5, 30, 0), 6: (6, 1, 0)}
+auto_termination_releases = {5: (5, 34, 0), 6: (6, 4, 0)}
+# Idle timeouts EMR accepts, in seconds.
+auto_termination_idle_timeouts = (60, 7 * 24 * 3600)
+# Steps accepted per add_job_flow_steps call and step ids per list_steps or cancel_steps filter.
+max_steps_per_call = 256
+max_step_ids_per_call = 10
+# Cluster states in which instance fleets can be modified.
+resizable_states = ("WAITING", "RUNNING")
+
+_shared_client = None
+_shared_client_lock = threading.Lock()
+
+
+def fleet_instance_types_limit(role: str, allocation_strategy: Optional[str] = None) -> int:
+    """
+    Most instance types EMR accepts in one fleet.
+
+    Arguments:
+        role {str} -- master, core or task
+
+    Keyword Arguments:
+        allocation_strategy {Optional[str]} -- Spot or on demand allocation strategy of the fleet (default: {None})
+
+    Returns:
+        int -- Instance type limit
+    """
+    if allocation_strategy and role != "master":
+        return max_fleet_instance_types_with_strategy
+    return max_fleet_instance_types
+
+
+def release_supports(release_label: str, releases: Dict[int, tuple]) -> bool:
+    """
+    Is an EMR release at least the first release of its major version listed in releases?
+
+    Arguments:
+        release_label {str} -- EMR release, e.g. emr-5.28.0
+        releases {Dict[int, tuple]} -- First supporting release per major version, e.g. managed_scaling_releases
+
+    Returns:
+        bool -- True when supported, also for major versions newer than those listed
+    """
+    try:
+        version = tuple(int(x) for x in release_label.split("-", 1)[1].split("."))
+    except (IndexError, ValueError):
+        return True
+    if version[0] > max(releases):
+        return True
+    return version[0] in releases and version >= releases[version[0]]
+
+
+def managed_scaling_policy(min_units: int, max_units: int, max_on_demand_units: Optional[int] = None,
+                           max_core_units: Optional[int] = None) -> Dict:
+    """
+    ManagedScalingPolicy of an instance fleet cluster.
+
+    Arguments:
+        min_units {int} -- Fewest instance fleet units the cluster scales in to
+        max_units {int} -- Most instance fleet units the cluster scales out to
+
+    Keyword Arguments:
+        max_on_demand_units {Optional[int]} -- Most on demand units, the rest is spot (default: {None})
+        max_core_units {Optional[int]} -- Most core fleet units, the rest is task (default: {None})
+
+    Returns:
+        Dictionary -- ManagedScalingPolicy
+    """
+    limits: Dict[str, Any] = {
+        "UnitType": "InstanceFleetUnits",
+        "MinimumCapacityUnits": min_units,
+        "MaximumCapacityUnits": max_units,
+    }
+    if max_on_demand_units is not None:
+        limits["MaximumOnDemandCapacityUnits"] = max_on_demand_units
+    if max_core_units is not None:
+        limits["MaximumCoreCapacityUnits"] = max_core_units
+    return {"ComputeLimits": limits}
+
+
+def new_client(endpoint_url: Optional[str] = None, max_pool_connections: Optional[int] = None,
+               sdk_retries: Optional[int] = None):
+    """
+    Build a boto3 EMR client.
+
+    Keyword Arguments:
+        endpoint_url {Optional[str]} -- EMR endpoint, e.g. a local stub (default: {None})
+        max_pool_connections {Optional[int]} -- HTTP connection pool size (default: {None})
+        sdk_retries {Optional[int]} -- Retries botocore makes itself, e.g. of throttled calls, None keeps its default (default: {None})
+
+    Returns:
+        botocore client -- boto3 EMR client
+    """
+    import boto3
+    kwargs: Dict[str, Any] = {"service_name": "emr"}
+    if endpoint_url is not None:
+        kwargs["endpoint_url"] = endpoint_url
+    config: Dict[str, Any] = {}
+    if max_pool_connections is not None:
+        config["max_pool_connections"] = max_pool_connections
+    if sdk_retries is not None:
+        # max_attempts counts retries after the first attempt, also in the botocore~=1.13 this package pins.
+        config["retries"] = {"max_attempts": sdk_retries}
+    if config:
+        from botocore.config import Config
+        kwargs["config"] = Config(**config)
+    return boto3.Session().client(**kwargs)
+
+
+def shared_client():
+    """
+    EMR client shared by every EMR object in the process. boto3 is imported and the client built
+    on first use, so commands that never call EMR don't pay for it.
+
+    Returns:
+        botocore client -- boto3 EMR client
+    """
+    global _shared_client
+    if _shared_client is None:
+        with _shared_client_lock:
+            if _shared_client is None:
+                _shared_client = new_client()
+    return _shared_client
+
+
+class ResizeRefused(ValueError):
+    """
+    Raised when a resize needs changes only a relaunch can make, e.g. another master instance type.
+    """
+    def __init__(self, cluster_id: str, reasons: List[str]):
+        super().__init__("Cluster {} can't be resized in place: {}".format(cluster_id, "; ".join(reasons)))
+        self.cluster_id = cluster_id
+        self.reasons = reasons
+
+
+class FleetResize:
+    """
+    Capacity change of one instance fleet in a resize.
+    """
+    __slots__ = ("fleet_type", "fleet_id", "action", "from_on_demand", "from_spot", "to_on_demand", "to_spot",
+                 "provisioned_on_demand", "provisioned_spot")
+
+    def __init__(self, fleet_type: str, fleet_id: Optional[str], action: str, from_on_demand: int, from_spot: int,
+                 to_on_demand: int, to_spot: int):
+        self.fleet_type = fleet_type
+        self.fleet_id = fleet_id
+        # modified, added or unchanged
+        self.action = action
+        self.from_on_demand = from_on_demand
+        self.from_spot = from_spot
+        self.to_on_demand = to_on_demand
+        self.to_spot = to_spot
+        self.provisioned_on_demand: Optional[int] = None
+        self.provisioned_spot: Optional[int] = None
+
+    @property
+    def converged(self) -> bool:
+        return self.provisioned_on_demand == self.to_on_demand and self.provisioned_spot == self.to_spot
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict({k: getattr(self, k) for k in self.__slots__}, converged=self.converged)
 
 
 class EMR:
 
-    def __init__(self):
-        self._session = boto3.Session()
-        self._client_emr = boto3.Session().client(service_name="emr")
+    def __init__(self, cache: bool = False, cache_ttls: Optional[Dict[str, float]] = None, cache_max_entries: int = 256,
+                 client=None, endpoint_url: Optional[str] = None, max_pool_connections: Optional[int] = None,
+                 sdk_retries: Optional[int] = None):
+        """
+        Keyword Arguments:
+            cache {bool} -- Cache describe_cluster, list_clusters and list_instances responses and coalesce identical concurrent requests (default: {False})
+            cache_ttls {Optional[Dict[str, float]]} -- Seconds to keep responses per operation (default: {response_cache.default_ttls})
+            cache_max_entries {int} -- Cached responses kept before least recently used ones are evicted (default: {256})
+            client {botocore client} -- EMR client to use instead of the lazily created process wide one (default: {None})
+            endpoint_url {Optional[str]} -- Use a dedicated client for this endpoint, e.g. a local stub (default: {None})
+            max_pool_connections {Optional[int]} -- Use a dedicated client with this connection pool size (default: {None})
+            sdk_retries {Optional[int]} -- Use a dedicated client making this many retries itself, 0 leaves retrying to the caller (default: {None})
+        """
+        self._client = client
+        self._endpoint_url = endpoint_url
+        self._max_pool_connections = max_pool_connections
+        self._sdk_retries = sdk_retries
+        self._cache: Optional[ResponseCache] = ResponseCache(cache_ttls, cache_max_entries) if cache else None
+
+    @property
+    def _client_emr(self):
+        if self._client is None:
+            if self._endpoint_url is None and self._max_pool_connections is None and self._sdk_retries is None:
+                self._client = shared_client()
+            else:
+                with _shared_client_lock:
+                    if self._client is None:
+                        self._client = new_client(self._endpoint_url, self._max_pool_connections, self._sdk_retries)
+        return self._client
+
+    def _invoke(self, operation: str, **kwargs) -> Dict:
+        with metrics.timer(operation) as timed:
+            timed["response"] = getattr(self._client_emr, operation)(**kwargs)
+        log_response(logger, operation, timed["response"])
+        return timed["response"]
+
+    def _call(self, operation: str, **kwargs) -> Dict:
+        if self._cache is None:
+            return self._invoke(operation, **kwargs)
+        return self._cache.get_or_call(operation, kwargs, lambda: self._invoke(operation, **kwargs))
+
+    def _describe_uncached(self, cluster_id: str) -> Dict:
+        # Waiters need the current state, never a cached one.
+        return self._invoke("describe_cluster", ClusterId=cluster_id)
+
+    def _pages(self, operation: str, **kwargs) -> Iterator[Dict]:
+        if self._cache is None:
+            return self._timed_pages(operation, self._client_emr.get_paginator(operation).paginate(**kwargs))
+        return self._cached_pages(operation, **kwargs)
+
+    @staticmethod
+    def _timed_pages(operation: str, pages: Iterable[Dict]) -> Iterator[Dict]:
+        # Each page fetched by the paginator is one API call.
+        pages = iter(pages)
+        while True:
+            started = time.perf_counter()
+            try:
+                page = next(pages)
+            except StopIteration:
+                return
+            except Exception as e:
+                metrics.observe(operation, time.perf_counter() - started, error=e)
+                raise
+            metrics.observe(operation, time.perf_counter() - started,
+                            retries=page.get("ResponseMetadata", {}).get("RetryAttempts", 0))
+            log_response(logger, operation, page)
+            yield page
+
+    def _cached_pages(self, operation: str, **kwargs) -> Iterator[Dict]:
+        while True:
+            page = self._call(operation, **kwargs)
+            yield page
+            if not page.get("Marker"):
+                return
+            kwargs = dict(kwargs, Marker=page["Marker"])
+
+    def _paginate(self, operation: str, result_key: str, **kwargs) -> Iterator[Dict]:
+        for page in self._pages(operation, **kwargs):
+            for item in page.get(result_key, []):
+                yield item
+
+    def invalidate_cache(self, cluster_id: Optional[str] = None):
+        """
+        Drop cached responses about a cluster, or all of them.
+
+        Keyword Arguments:
+            cluster_id {Optional[str]} -- JobFlowId, None drops everything (default: {None})
+        """
+        if self._cache is not None:
+            self._cache.invalidate(cluster_id)
+
+    @property
+    def cache_stats(self) -> Optional[Dict[str, int]]:
+        return None if self._cache is None else self._cache.stats()
+
+
+    @staticmethod
+    def _fleet_instance_types(pars: Dict, role: str) -> List[Mapping[str, Any]]:
+        return [x if isinstance(x, Mapping) else {"instance_type": x}
+                for x in pars.get("instance_types_" + role) or [pars["instance_type_" + role]]]
+
+    @staticmethod
+    def _build_ebs_configuration(pars: Dict, role: str, instance_type: str) -> Optional[Dict]:
+        """
+        EbsConfiguration of an instance type of a fleet, None for instance types with NVMe
+        instance store, which already provide fast local disks.
+
+        Arguments:
+            pars {Dict} -- create_cluster arguments
+            role {str} -- master, core or task
+            instance_type {str} -- EC2 instance type
+
+        Returns:
+            Optional[Dict] -- EBS configuration
+        """
+        if instance_store_disks(instance_type):
+            return None
+        volume: Dict[str, Any] = {
+            "SizeInGB": pars["instance_ebs_size_" + role],
+            "VolumeType": pars.get("ebs_volume_type_" + role) or "gp2"
+        }
+        if pars.get("ebs_iops_" + role) is not None:
+            volume["Iops"] = pars["ebs_iops_" + role]
+        if pars.get("ebs_throughput_" + role) is not None:
+            volume["Throughput"] = pars["ebs_throughput_" + role]
+        return {
+            "EbsBlockDeviceConfigs": [{
+                "VolumeSpecification": volume,
+                "VolumesPerInstance": pars.get("ebs_volumes_per_instance_" + role) or 1
+            }],
+            "EbsOptimized": True
+        }
+
+    @staticmethod
+    def _yarn_local_dirs(pars: Dict) -> Optional[str]:
+        """
+        yarn.nodemanager.local-dirs spreading shuffle and spill over every data volume. EMR mounts
+        the volumes of a node at /mnt, /mnt1, /mnt2 and so on; yarn-site applies to every node, so
+        the dirs are only set when all core and task instance types have the same volume count.
+
+        Arguments:
+            pars {Dict} -- create_cluster arguments
+
+        Returns:
+            Optional[str] -- Comma separated dirs, None to keep EMR's default
+        """
+        counts = set()
+        for role in ("core", "task"):
+            if pars["instance_num_spot_" + role] > 0 or pars["instance_num_on_demand_" + role] > 0:
+                for x in EMR._fleet_instance_types(pars, role):
+                    counts.add(instance_store_disks(x["instance_type"]) or pars.get("ebs_volumes_per_instance_" + role) or 1)
+        if len(counts) != 1 or counts == {1}:
+            return None
+        return ",".join("/mnt{}/yarn".format(i or "") for i in range(counts.pop()))
+
+    @staticmethod
+    def _build_instance_fleet(pars: Dict, role: str) -> Dict:
+        """
+        InstanceFleets entry of one role. A role is given either one instance_type_<role> or a list
+        of instance_types_<role> entries with their weighted capacity and spot bid.
+
+        Arguments:
+            pars {Dict} -- create_cluster arguments
+            role {str} -- master, core or task
+
+        Returns:
+            Dictionary -- Instance fleet config
+        """
+        name = role.upper()
+        spot_strategy = pars.get("spot_allocation_strategy_" + role)
+        on_demand_strategy = pars.get("on_demand_allocation_strategy_" + role)
+        instance_types = EMR._fleet_instance_types(pars, role)
+        limit = fleet_instance_types_limit(role, spot_strategy or on_demand_strategy)
+        if len(instance_types) > limit:
+            raise ValueError("{} fleet has {} instance types, EMR allows at most {}".format(name, len(instance_types), limit))
+        if len({x["instance_type"] for x in instance_types}) < len(instance_types):
+            raise ValueError("{} fleet lists an instance type more than once".format(name))
+
+        type_configs: List[Dict] = []
+        for x in instance_types:
+            type_config: Dict = {
+                "InstanceType": x["instance_type"],
+                "WeightedCapacity": x.get("weighted_capacity", 1),
+                "BidPriceAsPercentageOfOnDemandPrice": x.get("spot_bid_percentage_of_on_demand",
+                                                             pars["spot_bid_percentage_of_on_demand_" + role]),
+            }
+            ebs_configuration = EMR._build_ebs_configuration(pars, role, x["instance_type"])
+            if ebs_configuration is not None:
+                type_config["EbsConfiguration"] = ebs_configuration
+            if x.get("priority") is not None:
+                type_config["Priority"] = x["priority"]
+            type_configs.append(type_config)
 
+        fleet: Dict = {
+            "Name": name,
+            "InstanceFleetType": name,
+            "TargetOnDemandCapacity": pars["instance_num_on_demand_" + role],
+            "TargetSpotCapacity": pars["instance_num_spot_" + role],
+            "InstanceTypeConfigs": type_configs,
+        }
+        launch_specifications: Dict = {}
+        if pars["instance_num_spot_" + role] > 0:
+            launch_specifications["SpotSpecification"] = {
+                "TimeoutDurationMinutes": pars["spot_provisioning_timeout_" + role],
+                "TimeoutAction": "SWITCH_TO_ON_DEMAND" if pars["spot_timeout_to_on_demand_" + role] else "TERMINATE_CLUSTER",
+            }
+            if spot_strategy:
+                launch_specifications["SpotSpecification"]["AllocationStrategy"] = spot_strategy
+        if on_demand_strategy and pars["instance_num_on_demand_" + role] > 0:
+            launch_specifications["OnDemandSpecification"] = {"AllocationStrategy": on_demand_strategy}
+        if launch_specifications:
+            fleet["LaunchSpecifications"] = launch_specifications
+        return fleet
 
     @staticmethod
     def _build_cluster_args(**pars):
@@ -29,12 +422,16 @@ class EMR:
             "Instances": {
                 "KeepJobFlowAliveWhenNoSteps": pars["keep_cluster_alive_when_no_steps"],
                 "TerminationProtected": pars["termination_protected"],
-                "Ec2SubnetId": pars["subnet_id"],
                 "InstanceFleets": []
             },
             "EbsRootVolumeSize": pars["ebs_root_volume_size"],
             "StepConcurrencyLevel": pars["num_concurrent_steps"]
         }
+        # Instance fleets can be given several subnets, EMR launches in the one with the most capacity.
+        if pars.get("subnet_ids"):
+            args["Instances"]["Ec2SubnetIds"] = list(pars["subnet_ids"])
+        else:
+            args["Instances"]["Ec2SubnetId"] = pars["subnet_id"]
 
         # EC2 Key Pair
         if pars["key_pair_name"] is not None:
@@ -145,135 +542,60 @@ class EMR:
             if pars["steps"] is not None:
                 args["Steps"] += pars["steps"]
 
-        # Master Instance Fleet
-        timeout_action_master: str = "SWITCH_TO_ON_DEMAND" if pars[
-            "spot_timeout_to_on_demand_master"] else "TERMINATE_CLUSTER"
-        fleet_master: Dict = {
-            "Name":
-            "MASTER",
-            "InstanceFleetType":
-            "MASTER",
-            "TargetOnDemandCapacity":
-            pars["instance_num_on_demand_master"],
-            "TargetSpotCapacity":
-            pars["instance_num_spot_master"],
-            "InstanceTypeConfigs": [
-                {
-                    "InstanceType": pars["instance_type_master"],
-                    "WeightedCapacity": 1,
-                    "BidPriceAsPercentageOfOnDemandPrice": pars["spot_bid_percentage_of_on_demand_master"],
-                    "EbsConfiguration": {
-                        "EbsBlockDeviceConfigs": [{
-                            "VolumeSpecification": {
-                                "SizeInGB": pars["instance_ebs_size_master"],
-                                "VolumeType": "gp2"
-                            },
-                            "VolumesPerInstance": 1
-                        }],
-                        "EbsOptimized":
-                        True
-                    },
-                },
-            ],
-        }
-        if pars["instance_num_spot_master"] > 0:
-            fleet_master["LaunchSpecifications"]: Dict = {
-                "SpotSpecification": {
-                    "TimeoutDurationMinutes": pars["spot_provisioning_timeout_master"],
-                    "TimeoutAction": timeout_action_master,
-                }
-            }
-        args["Instances"]["InstanceFleets"].append(fleet_master)
-
-        # Core Instance Fleet
-        if (pars["instance_num_spot_core"] > 0) or pars["instance_num_on_demand_core"] > 0:
-            timeout_action_core = "SWITCH_TO_ON_DEMAND" if pars[
-                "spot_timeout_to_on_demand_core"] else "TERMINATE_CLUSTER"
-            fleet_core: Dict = {
-                "Name":
-                "CORE",
-                "InstanceFleetType":
-                "CORE",
-                "TargetOnDemandCapacity":
-                pars["instance_num_on_demand_core"],
-                "TargetSpotCapacity":
-                pars["instance_num_spot_core"],
-                "InstanceTypeConfigs": [
-                    {
-                        "InstanceType": pars["instance_type_core"],
-                        "WeightedCapacity": 1,
-                        "BidPriceAsPercentageOfOnDemandPrice": pars["spot_bid_percentage_of_on_demand_core"],
-                        "EbsConfiguration": {
-                            "EbsBlockDeviceConfigs": [{
-                                "VolumeSpecification": {
-                                    "SizeInGB": pars["instance_ebs_size_core"],
-                                    "VolumeType": "gp2"
-                                },
-                                "VolumesPerInstance": 1
-                            }],
-                            "EbsOptimized":
-                            True
-                        },
-                    },
-                ],
-            }
-            if pars["instance_num_spot_core"] > 0:
-                fleet_core["LaunchSpecifications"]: Dict = {
-                    "SpotSpecification": {
-                        "TimeoutDurationMinutes": pars["spot_provisioning_timeout_core"],
-                        "TimeoutAction": timeout_action_core,
-                    }
-                }
-            args["Instances"]["InstanceFleets"].append(fleet_core)
-
-        # Task Instance Fleet
-        if (pars["instance_num_spot_task"] > 0) or pars["instance_num_on_demand_task"] > 0:
-            timeout_action_task: str = "SWITCH_TO_ON_DEMAND" if pars[
-                "spot_timeout_to_on_demand_task"] else "TERMINATE_CLUSTER"
-            fleet_task: Dict = {
-                "Name":
-                "TASK",
-                "InstanceFleetType":
-                "TASK",
-                "TargetOnDemandCapacity":
-                pars["instance_num_on_demand_task"],
-                "TargetSpotCapacity":
-                pars["instance_num_spot_task"],
-                "InstanceTypeConfigs": [
-                    {
-                        "InstanceType": pars["instance_type_task"],
-                        "WeightedCapacity": 1,
-                        "BidPriceAsPercentageOfOnDemandPrice": pars["spot_bid_percentage_of_on_demand_task"],
-                        "EbsConfiguration": {
-                            "EbsBlockDeviceConfigs": [{
-                                "VolumeSpecification": {
-                                    "SizeInGB": pars["instance_ebs_size_task"],
-                                    "VolumeType": "gp2"
-                                },
-                                "VolumesPerInstance": 1
-                            }],
-                            "EbsOptimized":
-                            True
-                        },
-                    },
-                ],
-            }
-            if pars["instance_num_spot_task"] > 0:
-                fleet_task["LaunchSpecifications"]: Dict = {
-                    "SpotSpecification": {
-                        "TimeoutDurationMinutes": pars["spot_provisioning_timeout_task"],
-                        "TimeoutAction": timeout_action_task,
-                    }
+        # Instance Fleets, core and task only when instances are requested
+        for role in ("master", "core", "task"):
+            if role == "master" or pars["instance_num_spot_" + role] > 0 or pars["instance_num_on_demand_" + role] > 0:
+                args["Instances"]["InstanceFleets"].append(EMR._build_instance_fleet(pars, role))
+
+        # Managed scaling and idle auto termination
+        if pars.get("managed_scaling_max_units") is not None:
+            args["ManagedScalingPolicy"] = managed_scaling_policy(pars["managed_scaling_min_units"],
+                                                                  pars["managed_scaling_max_units"],
+                                                                  pars.get("managed_scaling_max_on_demand_units"),
+                                                                  pars.get("managed_scaling_max_core_units"))
+        if pars.get("auto_termination_idle_minutes") is not None:
+            args["AutoTerminationPolicy"] = {"IdleTimeout": pars["auto_termination_idle_minutes"] * 60}
+
+        # Local dirs of multi volume nodes
+        local_dirs = EMR._yarn_local_dirs(pars)
+        if local_dirs is not None:
+            args["Configurations"].append({
+                "Classification": "yarn-site",
+                "Properties": {
+                    "yarn.nodemanager.local-dirs": local_dirs
                 }
-            args["Instances"]["InstanceFleets"].append(fleet_task)
+            })
 
         # Tags
         if pars["tags"] is not None:
             args["Tags"] = [{"Key": k, "Value": v} for k, v in pars["tags"].items()]
 
-        logging.info(f"args: \n{json.dumps(args, default=str, indent=4)}")
+        log_response(logger, "_build_cluster_args", args)
         return args
 
+    @staticmethod
+    def spec_fingerprint(args: Dict) -> str:
+        """
+        Hash run_job_flow arguments into a stable fingerprint. Keys are sorted and tags owned by
+        this tool (prefixed with "beamline:") are ignored, so the fingerprint only changes when the
+        cluster specification does.
+
+        Arguments:
+            args {Dict} -- Output of _build_cluster_args
+
+        Returns:
+            str -- Hex encoded sha256 of the canonical specification
+        """
+        spec = dict(args)
+        if spec.get("Instances", {}).get("Ec2SubnetIds") is not None:
+            # EMR picks among the subnets regardless of their order.
+            spec["Instances"] = dict(spec["Instances"], Ec2SubnetIds=sorted(spec["Instances"]["Ec2SubnetIds"]))
+        if spec.get("Tags") is not None:
+            spec["Tags"] = sorted([x for x in spec["Tags"] if not x["Key"].startswith(tag_prefix)],
+                                  key=lambda x: x["Key"])
+        canonical = json.dumps(spec, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
     def create_cluster(self,
                        cluster_name: str,
                        logging_s3_path: str,
@@ -325,7 +647,35 @@ class EMR:
                        steps: Optional[List[Dict[str, Collection[str]]]] = None,
                        keep_cluster_alive_when_no_steps: bool = True,
                        termination_protected: bool = False,
-                       tags: Optional[Dict[str, str]] = None):
+                       tags: Optional[Dict[str, str]] = None,
+                       instance_types_master: Optional[List[Union[str, Dict[str, Any]]]] = None,
+                       instance_types_core: Optional[List[Union[str, Dict[str, Any]]]] = None,
+                       instance_types_task: Optional[List[Union[str, Dict[str, Any]]]] = None,
+                       spot_allocation_strategy_master: Optional[str] = None,
+                       spot_allocation_strategy_core: Optional[str] = None,
+                       spot_allocation_strategy_task: Optional[str] = None,
+                       on_demand_allocation_strategy_master: Optional[str] = None,
+                       on_demand_allocation_strategy_core: Optional[str] = None,
+                       on_demand_allocation_strategy_task: Optional[str] = None,
+                       ebs_volume_type_master: str = "gp2",
+                       ebs_volume_type_core: str = "gp2",
+                       ebs_volume_type_task: str = "gp2",
+                       ebs_volumes_per_instance_master: int = 1,
+                       ebs_volumes_per_instance_core: int = 1,
+                       ebs_volumes_per_instance_task: int = 1,
+                       ebs_iops_master: Optional[int] = None,
+                       ebs_iops_core: Optional[int] = None,
+                       ebs_iops_task: Optional[int] = None,
+                       ebs_throughput_master: Optional[int] = None,
+                       ebs_throughput_core: Optional[int] = None,
+                       ebs_throughput_task: Optional[int] = None,
+                       managed_scaling_min_units: Optional[int] = None,
+                       managed_scaling_max_units: Optional[int] = None,
+                       managed_scaling_max_on_demand_units: Optional[int] = None,
+                       managed_scaling_max_core_units: Optional[int] = None,
+                       auto_termination_idle_minutes: Optional[int] = None,
+                       subnet_ids: Optional[List[str]] = None,
+                       fingerprint: Optional[str] = None):
         """
         Create an EMR cluster using instance fleet configurations
 
@@ -379,18 +729,56 @@ class EMR:
             spark_jars_path {Optional[List[str]]} -- Spark jar in s3 (default: {None})
             spark_defaults {Dict[str, str]} -- Spark defaults (default: {None})
             maximize_resource_allocation {bool} -- Configure your executors to utilize the maximum resources possible? (default: {False})
-            steps {Optional[List[Dict[str, Collection[str]]]]} -- Steps to execute(default: {None})
+            steps {Optional[List[Dict[str, Collection[str]]]]} -- Steps to execute, left out of the spec fingerprint (default: {None})
             keep_cluster_alive_when_no_steps {bool} -- Keep cluster alive when no steps executed? (default: {True})
             termination_protected {bool} -- Termination protection enabled? (default: {False})
             tags {Optional[Dict[str, str]]} -- Tags(default: {None})
+            instance_types_master {Optional[List[Union[str, Dict[str, Any]]]]} -- Instance types of the master fleet, replacing instance_type_master. Entries are types or dicts with instance_type, weighted_capacity, spot_bid_percentage_of_on_demand and priority (default: {None})
+            instance_types_core {Optional[List[Union[str, Dict[str, Any]]]]} -- Instance types of the core fleet, see instance_types_master (default: {None})
+            instance_types_task {Optional[List[Union[str, Dict[str, Any]]]]} -- Instance types of the task fleet, see instance_types_master (default: {None})
+            spot_allocation_strategy_master {Optional[str]} -- Spot allocation strategy of the master fleet, e.g. capacity-optimized (default: {None})
+            spot_allocation_strategy_core {Optional[str]} -- Spot allocation strategy of the core fleet (default: {None})
+            spot_allocation_strategy_task {Optional[str]} -- Spot allocation strategy of the task fleet (default: {None})
+            on_demand_allocation_strategy_master {Optional[str]} -- On demand allocation strategy of the master fleet, lowest-price or prioritized (default: {None})
+            on_demand_allocation_strategy_core {Optional[str]} -- On demand allocation strategy of the core fleet (default: {None})
+            on_demand_allocation_strategy_task {Optional[str]} -- On demand allocation strategy of the task fleet (default: {None})
+            ebs_volume_type_master {str} -- EBS volume type of master nodes: gp2, gp3, io1, io2, st1, sc1 or standard (default: {"gp2"})
+            ebs_volume_type_core {str} -- EBS volume type of core nodes (default: {"gp2"})
+            ebs_volume_type_task {str} -- EBS volume type of task nodes (default: {"gp2"})
+            ebs_volumes_per_instance_master {int} -- EBS volumes of instance_ebs_size_master GB per master node (default: {1})
+            ebs_volumes_per_instance_core {int} -- EBS volumes of instance_ebs_size_core GB per core node (default: {1})
+            ebs_volumes_per_instance_task {int} -- EBS volumes of instance_ebs_size_task GB per task node (default: {1})
+            ebs_iops_master {Optional[int]} -- Provisioned IOPS per master volume, for io1, io2 and gp3 (default: {None})
+            ebs_iops_core {Optional[int]} -- Provisioned IOPS per core volume (default: {None})
+            ebs_iops_task {Optional[int]} -- Provisioned IOPS per task volume (default: {None})
+            ebs_throughput_master {Optional[int]} -- Throughput in MiB/s per master volume, gp3 only (default: {None})
+            ebs_throughput_core {Optional[int]} -- Throughput in MiB/s per core volume (default: {None})
+            ebs_throughput_task {Optional[int]} -- Throughput in MiB/s per task volume (default: {None})
+            managed_scaling_min_units {Optional[int]} -- Managed scaling: fewest instance fleet units (default: {None})
+            managed_scaling_max_units {Optional[int]} -- Managed scaling: most instance fleet units, None disables managed scaling (default: {None})
+            managed_scaling_max_on_demand_units {Optional[int]} -- Managed scaling: most on demand units (default: {None})
+            managed_scaling_max_core_units {Optional[int]} -- Managed scaling: most core fleet units (default: {None})
+            auto_termination_idle_minutes {Optional[int]} -- Terminate the cluster after it has been idle this long, None keeps it running (default: {None})
+            subnet_ids {Optional[List[str]]} -- Subnets EMR chooses the one with the most fleet capacity from, replacing subnet_id (default: {None})
+            fingerprint {Optional[str]} -- Spec fingerprint to tag the cluster with, e.g. the one of a size before launch time adjustments, None hashes these arguments (default: {None})
+
+            Instance types with NVMe instance store (see data/instance_catalog.json) get no EBS volumes.
 
         Returns:
-            Dictionary -- Response from emr run_job_flow API
+            Dictionary -- Response from emr run_job_flow API. The spec fingerprint is stored in the "beamline:spec-fingerprint" tag.
         """ 
 
-        args = EMR._build_cluster_args(**locals())
-        response = self._client_emr.run_job_flow(**args)
-        logging.info(f"Response: \n{json.dumps(response, default=str, indent=4)}")
+        pars = dict(locals())
+        del pars["fingerprint"]
+        args = EMR._build_cluster_args(**pars)
+        if fingerprint is None:
+            # Steps submitted at launch are work for the cluster, not part of its specification.
+            spec = args if steps is None else EMR._build_cluster_args(**dict(pars, steps=None))
+            fingerprint = EMR.spec_fingerprint(spec)
+        args.setdefault("Tags", []).append({"Key": fingerprint_tag_key, "Value": fingerprint})
+        response = self._invoke("run_job_flow", **args)
+        self.invalidate_cache(response["JobFlowId"])
+        logger.info("Cluster {} created".format(response["JobFlowId"]))
         return response
 
     def get_cluster_state(self, cluster_id: str) -> str:
@@ -404,8 +792,7 @@ class EMR:
         Returns:
             str -- State of cluster like WAITING, RUNNING, STARTING etc.
         """
-        response: Dict = self._client_emr.describe_cluster(ClusterId=cluster_id)
-        logging.info(f"Response: \n{json.dumps(response, default=str, indent=4)}")
+        response: Dict = self._call("describe_cluster", ClusterId=cluster_id)
         return response["Cluster"]["Status"]["State"]
 
     def get_cluster_description(self, cluster_id: str):
@@ -418,13 +805,12 @@ class EMR:
         Returns:
             Dictionary -- Response to describe cluster API
         """
-        response: Dict = self._client_emr.describe_cluster(ClusterId=cluster_id)
-        logging.info(f"Response: \n{json.dumps(response, default=str, indent=4)}")
+        response: Dict = self._call("describe_cluster", ClusterId=cluster_id)
         return response
 
     def get_cluster_instances(self, cluster_id: str, instance_group_types: List=["MASTER"]):
         """
-        Get instance details of an EMR cluster
+        Get instance details of an EMR cluster, all list_instances pages included
 
         Arguments:
             cluster_id {str} -- JobFlowId
@@ -433,12 +819,191 @@ class EMR:
             instance_group_types {List} -- Type if instance (default: {["MASTER"]})
 
         Returns:
-            Dictionary-- Response of list_instances API
+            Dictionary-- Response of list_instances API with the instances of every page
         """
-        response: Dict = self._client_emr.list_instances(ClusterId=cluster_id, InstanceGroupTypes=instance_group_types)
-        logging.info(f"Response: \n{json.dumps(response, default=str, indent=4)}")
+        response: Dict = {"Instances": list(self.iter_instances(cluster_id, instance_group_types=instance_group_types))}
         return response
 
+    def iter_instances(self,
+                       cluster_id: str,
+                       instance_group_types: Optional[List[str]] = None,
+                       instance_fleet_type: Optional[str] = None,
+                       instance_states: Optional[List[str]] = None) -> Iterator[Dict]:
+        """
+        Lazily iterate over the instances of a cluster, one list_instances page at a time.
+        Filters are applied by EMR. Instance group and instance fleet filters can't be combined.
+
+        Arguments:
+            cluster_id {str} -- JobFlowId
+
+        Keyword Arguments:
+            instance_group_types {Optional[List[str]]} -- MASTER, CORE and/or TASK, for instance group clusters (default: {None})
+            instance_fleet_type {Optional[str]} -- MASTER, CORE or TASK, for instance fleet clusters (default: {None})
+            instance_states {Optional[List[str]]} -- e.g. ["RUNNING"] (default: {None})
+
+        Returns:
+            Iterator[Dict] -- Instances as returned by list_instances
+        """
+        kwargs: Dict[str, Any] = {"ClusterId": cluster_id}
+        if instance_group_types is not None:
+            kwargs["InstanceGroupTypes"] = list(instance_group_types)
+        if instance_fleet_type is not None:
+            kwargs["InstanceFleetType"] = instance_fleet_type
+        if instance_states is not None:
+            kwargs["InstanceStates"] = list(instance_states)
+        return self._paginate("list_instances", "Instances", **kwargs)
+
+    def iter_instance_fleets(self, cluster_id: str) -> Iterator[Dict]:
+        """
+        Lazily iterate over the instance fleets of a cluster, one list_instance_fleets page at a time.
+
+        Arguments:
+            cluster_id {str} -- JobFlowId
+
+        Returns:
+            Iterator[Dict] -- Instance fleets with their target and provisioned capacity, as returned by list_instance_fleets
+        """
+        return self._paginate("list_instance_fleets", "InstanceFleets", ClusterId=cluster_id)
+
+    def iter_clusters(self,
+                      cluster_states: Optional[List[str]] = None,
+                      created_after: Optional[datetime.datetime] = None,
+                      created_before: Optional[datetime.datetime] = None) -> Iterator[Dict]:
+        """
+        Lazily iterate over clusters, one list_clusters page at a time. Filters are applied by EMR.
+
+        Keyword Arguments:
+            cluster_states {Optional[List[str]]} -- e.g. ["WAITING", "RUNNING"] (default: {None})
+            created_after {Optional[datetime.datetime]} -- Only clusters created after this time (default: {None})
+            created_before {Optional[datetime.datetime]} -- Only clusters created before this time (default: {None})
+
+        Returns:
+            Iterator[Dict] -- Cluster summaries as returned by list_clusters
+        """
+        kwargs: Dict[str, Any] = {}
+        if cluster_states is not None:
+            kwargs["ClusterStates"] = list(cluster_states)
+        if created_after is not None:
+            kwargs["CreatedAfter"] = created_after
+        if created_before is not None:
+            kwargs["CreatedBefore"] = created_before
+        return self._paginate("list_clusters", "Clusters", **kwargs)
+
+    def iter_steps(self,
+                   cluster_id: str,
+                   step_states: Optional[List[str]] = None,
+                   step_ids: Optional[List[str]] = None) -> Iterator[Dict]:
+        """
+        Lazily iterate over the steps of a cluster, most recent first, one list_steps page at a time.
+
+        Arguments:
+            cluster_id {str} -- JobFlowId
+
+        Keyword Arguments:
+            step_states {Optional[List[str]]} -- e.g. ["PENDING", "RUNNING"] (default: {None})
+            step_ids {Optional[List[str]]} -- Only these steps (default: {None})
+
+        Returns:
+            Iterator[Dict] -- Step summaries as returned by list_steps
+        """
+        kwargs: Dict[str, Any] = {"ClusterId": cluster_id}
+        if step_states is not None:
+            kwargs["StepStates"] = list(step_states)
+        if step_ids is not None:
+            kwargs["StepIds"] = list(step_ids)
+        return self._paginate("list_steps", "Steps", **kwargs)
+
+    def add_steps(self, cluster_id: str, steps: List[Dict[str, Any]]) -> List[str]:
+        """
+        Submit steps to a running cluster, at most 256 per add_job_flow_steps call.
+
+        Arguments:
+            cluster_id {str} -- JobFlowId
+            steps {List[Dict[str, Any]]} -- Step configurations with Name, ActionOnFailure and HadoopJarStep
+
+        Returns:
+            List[str] -- Step ids, in the order of steps
+        """
+        step_ids: List[str] = []
+        for start in range(0, len(steps), max_steps_per_call):
+            response = self._invoke("add_job_flow_steps", JobFlowId=cluster_id, Steps=steps[start:start + max_steps_per_call])
+            step_ids += response["StepIds"]
+        self.invalidate_cache(cluster_id)
+        logger.info("{} step(s) submitted to cluster {}".format(len(step_ids), cluster_id))
+        return step_ids
+
+    def cancel_steps(self, cluster_id: str, step_ids: List[str],
+                     cancellation_option: str = "SEND_INTERRUPT") -> List[Dict]:
+        """
+        Cancel pending or running steps.
+
+        Arguments:
+            cluster_id {str} -- JobFlowId
+            step_ids {List[str]} -- Steps to cancel
+
+        Keyword Arguments:
+            cancellation_option {str} -- SEND_INTERRUPT or TERMINATE_PROCESS (default: {"SEND_INTERRUPT"})
+
+        Returns:
+            List[Dict] -- CancelStepsInfoList entries with the outcome per step
+        """
+        info: List[Dict] = []
+        for start in range(0, len(step_ids), max_step_ids_per_call):
+            response = self._invoke("cancel_steps", ClusterId=cluster_id, StepIds=step_ids[start:start + max_step_ids_per_call],
+                                    StepCancellationOption=cancellation_option)
+            info += response.get("CancelStepsInfoList", [])
+        self.invalidate_cache(cluster_id)
+        return info
+
+    def get_master_private_ip(self, cluster_id: str) -> Optional[str]:
+        """
+        Private IP address of the running master node, for instance fleet and instance group clusters.
+
+        Arguments:
+            cluster_id {str} -- JobFlowId
+
+        Returns:
+            Optional[str] -- Private IP, None when no master instance is running
+        """
+        cluster: Dict = self._call("describe_cluster", ClusterId=cluster_id)["Cluster"]
+        if cluster.get("InstanceCollectionType") == "INSTANCE_GROUP":
+            masters = self.iter_instances(cluster_id, instance_group_types=["MASTER"], instance_states=["RUNNING"])
+        else:
+            masters = self.iter_instances(cluster_id, instance_fleet_type="MASTER", instance_states=["RUNNING"])
+        for instance in masters:
+            if instance.get("PrivateIpAddress"):
+                return instance["PrivateIpAddress"]
+        return None
+
+    def find_cluster_by_fingerprint(self, fingerprint: str, cluster_name: Optional[str] = None,
+                                    cluster_states: List[str] = reusable_states) -> Optional[Dict]:
+        """
+        Find a live cluster created from the same specification.
+
+        Arguments:
+            fingerprint {str} -- Spec fingerprint (see spec_fingerprint)
+
+        Keyword Arguments:
+            cluster_name {Optional[str]} -- Only describe clusters with this name, saves a DescribeCluster call per unrelated cluster (default: {None})
+            cluster_states {List[str]} -- Acceptable states, earlier states are preferred (default: {reusable_states})
+
+        Returns:
+            Optional[Dict] -- Cluster from describe_cluster response, None when no cluster matches
+        """
+        candidates: List[Dict] = [x for x in self.iter_clusters(cluster_states=cluster_states)
+                                  if cluster_name is None or x["Name"] == cluster_name]
+        candidates.sort(key=lambda x: cluster_states.index(x["Status"]["State"]))
+        for candidate in candidates:
+            cluster: Dict = self._call("describe_cluster", ClusterId=candidate["Id"])["Cluster"]
+            tags = {x["Key"]: x["Value"] for x in cluster.get("Tags", [])}
+            # Pool clusters are dedicated to whoever takes them out of the pool, never shared.
+            if tags.get(fingerprint_tag_key) == fingerprint and pool_tag_key not in tags:
+                logger.info("Cluster {} ({}) matches spec fingerprint {}".format(
+                    cluster["Id"], cluster["Status"]["State"], fingerprint))
+                return cluster
+        logger.info("No live cluster matches spec fingerprint {}".format(fingerprint))
+        return None
+
     def terminate_cluster(self, cluster_id: str) -> None:
         """
         Terminate an EMR cluster.
@@ -449,8 +1014,310 @@ class EMR:
         Returns:
             Dictionary-- Response of terminate_job_flows API
         """
-        response: Dict = self._client_emr.terminate_job_flows(JobFlowIds=[
+        response: Dict = self._invoke("terminate_job_flows", JobFlowIds=[
             cluster_id,
         ])
-        logging.info(f"Response: \n{json.dumps(response, default=str, indent=4)}")
-        return response
\ No newline at end of file
+        logger.info("Cluster {} is terminating".format(cluster_id))
+        self.invalidate_cache(cluster_id)
+        return response
+
+    def wait_for_cluster(self,
+                         cluster_id: str,
+                         target_states: Iterable[str] = ("WAITING",),
+                         failure_states: Iterable[str] = failure_states,
+                         timeout: Optional[float] = 3600,
+                         callbacks: Optional[Dict[str, Callable[[str, Dict], None]]] = None,
+                         jitter: float = 0.2) -> WaitResult:
+        """
+        Wait until a cluster reaches one of the target states. Polls back off while the cluster is
+        early in a phase and tighten near the expected transition, and the wait stops as soon as a
+        failure state is seen.
+
+        Arguments:
+            cluster_id {str} -- JobFlowId
+
+        Keyword Arguments:
+            target_states {Iterable[str]} -- States that end the wait (default: {("WAITING",)})
+            failure_states {Iterable[str]} -- States that raise ClusterFailedError (default: {TERMINATING, TERMINATED, TERMINATED_WITH_ERRORS})
+            timeout {Optional[float]} -- Deadline in seconds, raises ClusterWaitTimeout when passed (default: {3600})
+            callbacks {Optional[Dict[str, Callable[[str, Dict], None]]]} -- Per state callbacks called with (state, describe_cluster response) (default: {None})
+            jitter {float} -- Jitter fraction applied to poll delays (default: {0.2})
+
+        Returns:
+            WaitResult -- Final state, seconds spent per state and number of DescribeCluster calls
+        """
+        waiter = ClusterWaiter(describe=self._describe_uncached,
+                               target_states=target_states,
+                               failure_states=failure_states,
+                               timeout=timeout,
+                               callbacks=callbacks,
+                               jitter=jitter)
+        return waiter.wait(cluster_id)
+
+    def put_managed_scaling_policy(self, cluster_id: str, min_units: int, max_units: int,
+                                   max_on_demand_units: Optional[int] = None, max_core_units: Optional[int] = None) -> Dict:
+        """
+        Attach or replace the managed scaling policy of a running cluster.
+
+        Arguments:
+            cluster_id {str} -- JobFlowId
+            min_units {int} -- Fewest instance fleet units
+            max_units {int} -- Most instance fleet units
+
+        Keyword Arguments:
+            max_on_demand_units {Optional[int]} -- Most on demand units (default: {None})
+            max_core_units {Optional[int]} -- Most core fleet units (default: {None})
+
+        Returns:
+            Dictionary -- Response of put_managed_scaling_policy API
+        """
+        response: Dict = self._invoke("put_managed_scaling_policy", ClusterId=cluster_id,
+                                      ManagedScalingPolicy=managed_scaling_policy(min_units, max_units,
+                                                                                  max_on_demand_units, max_core_units))
+        self.invalidate_cache(cluster_id)
+        return response
+
+    def remove_managed_scaling_policy(self, cluster_id: str) -> Dict:
+        """
+        Turn managed scaling off for a running cluster.
+
+        Arguments:
+            cluster_id {str} -- JobFlowId
+
+        Returns:
+            Dictionary -- Response of remove_managed_scaling_policy API
+        """
+        response: Dict = self._invoke("remove_managed_scaling_policy", ClusterId=cluster_id)
+        self.invalidate_cache(cluster_id)
+        return response
+
+    def put_auto_termination_policy(self, cluster_id: str, idle_minutes: int) -> Dict:
+        """
+        Attach or replace the idle auto termination policy of a running cluster.
+
+        Arguments:
+            cluster_id {str} -- JobFlowId
+            idle_minutes {int} -- Idle time after which the cluster terminates
+
+        Returns:
+            Dictionary -- Response of put_auto_termination_policy API
+        """
+        response: Dict = self._invoke("put_auto_termination_policy", ClusterId=cluster_id,
+                                      AutoTerminationPolicy={"IdleTimeout": idle_minutes * 60})
+        self.invalidate_cache(cluster_id)
+        return response
+
+    def remove_auto_termination_policy(self, cluster_id: str) -> Dict:
+        """
+        Keep a running cluster alive when idle.
+
+        Arguments:
+            cluster_id {str} -- JobFlowId
+
+        Returns:
+            Dictionary -- Response of remove_auto_termination_policy API
+        """
+        response: Dict = self._invoke("remove_auto_termination_policy", ClusterId=cluster_id)
+        self.invalidate_cache(cluster_id)
+        return response
+
+    def add_tags(self, cluster_id: str, tags: Dict[str, str]) -> Dict:
+        """
+        Add or overwrite cluster tags.
+
+        Arguments:
+            cluster_id {str} -- JobFlowId
+            tags {Dict[str, str]} -- Tags
+
+        Returns:
+            Dictionary -- Response of add_tags API
+        """
+        response: Dict = self._invoke("add_tags", ResourceId=cluster_id, Tags=[{"Key": k, "Value": v} for k, v in tags.items()])
+        self.invalidate_cache(cluster_id)
+        return response
+
+    def remove_tags(self, cluster_id: str, keys: List[str]) -> Dict:
+        """
+        Remove cluster tags.
+
+        Arguments:
+            cluster_id {str} -- JobFlowId
+            keys {List[str]} -- Tag keys
+
+        Returns:
+            Dictionary -- Response of remove_tags API
+        """
+        response: Dict = self._invoke("remove_tags", ResourceId=cluster_id, TagKeys=list(keys))
+        self.invalidate_cache(cluster_id)
+        return response
+
+    def modify_instance_fleet(self, cluster_id: str, instance_fleet_id: str,
+                              on_demand_units: Optional[int] = None, spot_units: Optional[int] = None) -> Dict:
+        """
+        Change the target capacity of an instance fleet of a running cluster.
+
+        Arguments:
+            cluster_id {str} -- JobFlowId
+            instance_fleet_id {str} -- Fleet ID from list_instance_fleets
+
+        Keyword Arguments:
+            on_demand_units {Optional[int]} -- New TargetOnDemandCapacity, unchanged when None (default: {None})
+            spot_units {Optional[int]} -- New TargetSpotCapacity, unchanged when None (default: {None})
+
+        Returns:
+            Dictionary -- Response of modify_instance_fleet API
+        """
+        fleet: Dict[str, Any] = {"InstanceFleetId": instance_fleet_id}
+        if on_demand_units is not None:
+            fleet["TargetOnDemandCapacity"] = on_demand_units
+        if spot_units is not None:
+            fleet["TargetSpotCapacity"] = spot_units
+        response: Dict = self._invoke("modify_instance_fleet", ClusterId=cluster_id, InstanceFleet=fleet)
+        self.invalidate_cache(cluster_id)
+        return response
+
+    def add_instance_fleet(self, cluster_id: str, fleet: Dict) -> Dict:
+        """
+        Add a task instance fleet to a running cluster.
+
+        Arguments:
+            cluster_id {str} -- JobFlowId
+            fleet {Dict} -- Instance fleet config, see _build_instance_fleet
+
+        Returns:
+            Dictionary -- Response of add_instance_fleet API, with the new InstanceFleetId
+        """
+        response: Dict = self._invoke("add_instance_fleet", ClusterId=cluster_id, InstanceFleet=fleet)
+        self.invalidate_cache(cluster_id)
+        return response
+
+    def resize_cluster(self, cluster_id: str, pars: Dict[str, Any], wait: bool = False, timeout: float = 1800,
+                       poll_interval: float = 30, sleep: Callable[[float], None] = time.sleep,
+                       clock: Callable[[], float] = time.monotonic) -> List[FleetResize]:
+        """
+        Resize the core and task fleets of a running cluster to the capacities of another size, keeping
+        its data and sessions. Nothing is changed when any difference needs a relaunch: other instance
+        types in a fleet, such as another master instance type, or adding or removing the core fleet.
+        A task fleet missing from the cluster is added, the master fleet keeps its capacity.
+
+        Arguments:
+            cluster_id {str} -- JobFlowId
+            pars {Dict[str, Any]} -- create_cluster arguments of the target size, see ComputeManager.cluster_parameters
+
+        Keyword Arguments:
+            wait {bool} -- Wait until the provisioned capacity of the fleets matches their new targets (default: {False})
+            timeout {float} -- Seconds to wait for, a warning is logged when the fleets have not converged by then (default: {1800})
+            poll_interval {float} -- Seconds between list_instance_fleets calls while waiting (default: {30})
+
+        Raises:
+            ResizeRefused: The resize needs a relaunch, or the cluster or a fleet is not in a resizable state
+
+        Returns:
+            List[FleetResize] -- Change per fleet, with the provisioned capacity last seen when waiting
+        """
+        state = self.get_cluster_state(cluster_id)
+        if state not in resizable_states:
+            raise ResizeRefused(cluster_id, ["cluster is {}, fleets can only be modified while {}".format(state, " or ".join(resizable_states))])
+        current = {x["InstanceFleetType"]: x for x in self.iter_instance_fleets(cluster_id)}
+        reasons: List[str] = []
+        changes: List[FleetResize] = []
+        wanted_fleets: Dict[str, Dict] = {}
+        for role in ("master", "core", "task"):
+            name = role.upper()
+            wanted = None
+            if role == "master" or pars["instance_num_spot_" + role] > 0 or pars["instance_num_on_demand_" + role] > 0:
+                wanted = EMR._build_instance_fleet(pars, role)
+            fleet = current.get(name)
+            if fleet is None and wanted is None:
+                continue
+            if fleet is None:
+                if role != "task":
+                    reasons.append("the cluster has no {} fleet, only task fleets can be added".format(name))
+                else:
+                    wanted_fleets[name] = wanted
+                    changes.append(FleetResize(name, None, "added", 0, 0, wanted["TargetOnDemandCapacity"], wanted["TargetSpotCapacity"]))
+                continue
+            from_units = (fleet.get("TargetOnDemandCapacity", 0), fleet.get("TargetSpotCapacity", 0))
+            if fleet.get("Status", {}).get("State") != "RUNNING":
+                reasons.append("the {} fleet is {}".format(name, fleet.get("Status", {}).get("State")))
+            if wanted is None:
+                if role == "core":
+                    reasons.append("the CORE fleet can't be removed")
+                else:
+                    changes.append(FleetResize(name, fleet["Id"], "modified" if any(from_units) else "unchanged", *from_units, 0, 0))
+                continue
+            running_types = sorted(x["InstanceType"] for x in fleet.get("InstanceTypeSpecifications", []))
+            wanted_types = sorted(x["InstanceType"] for x in wanted["InstanceTypeConfigs"])
+            if running_types != wanted_types:
+                reasons.append("the {} fleet runs {} instead of {}".format(name, ", ".join(running_types), ", ".join(wanted_types)))
+            to_units = (wanted["TargetOnDemandCapacity"], wanted["TargetSpotCapacity"])
+            if role == "master":
+                # The master fleet is a single node that can't be modified, moving it between spot and on demand needs a relaunch.
+                if to_units != from_units:
+                    logger.info("Cluster {} keeps its MASTER fleet capacity of {} on demand and {} spot units".format(cluster_id, *from_units))
+                continue
+            changes.append(FleetResize(name, fleet["Id"], "modified" if to_units != from_units else "unchanged", *from_units, *to_units))
+        if reasons:
+            raise ResizeRefused(cluster_id, reasons)
+
+        for change in changes:
+            if change.action == "added":
+                change.fleet_id = self.add_instance_fleet(cluster_id, wanted_fleets[change.fleet_type]).get("InstanceFleetId")
+            elif change.action == "modified":
+                self.modify_instance_fleet(cluster_id, change.fleet_id, change.to_on_demand, change.to_spot)
+            if change.action != "unchanged":
+                logger.info("Cluster {} {} fleet {}: {} on demand and {} spot units, from {} and {}".format(
+                    cluster_id, change.fleet_type, change.action, change.to_on_demand, change.to_spot, change.from_on_demand, change.from_spot))
+        if wait:
+            self.wait_for_fleets(cluster_id, changes, timeout, poll_interval, sleep, clock)
+        return changes
+
+    def wait_for_fleets(self, cluster_id: str, changes: List[FleetResize], timeout: float = 1800,
+                        poll_interval: float = 30, sleep: Callable[[float], None] = time.sleep,
+                        clock: Callable[[], float] = time.monotonic) -> bool:
+        """
+        Wait until the provisioned capacity of resized fleets matches their targets.
+
+        Arguments:
+            cluster_id {str} -- JobFlowId
+            changes {List[FleetResize]} -- Fleets to wait for, their provisioned capacity is updated
+
+        Keyword Arguments:
+            timeout {float} -- Seconds to wait for (default: {1800})
+            poll_interval {float} -- Seconds between list_instance_fleets calls (default: {30})
+
+        Returns:
+            bool -- True when every fleet converged in time
+        """
+        started = clock()
+        while True:
+            fleets = {x["Id"]: x for x in self.iter_instance_fleets(cluster_id)}
+            for change in changes:
+                fleet = fleets.get(change.fleet_id, {})
+                change.provisioned_on_demand = fleet.get("ProvisionedOnDemandCapacity", 0)
+                change.provisioned_spot = fleet.get("ProvisionedSpotCapacity", 0)
+            if all(x.converged for x in changes):
+                logger.info("Fleets of cluster {} converged after {:.0f} seconds".format(cluster_id, clock() - started))
+                return True
+            if clock() - started >= timeout:
+                logger.warning("Fleets of cluster {} have not converged after {:.0f} seconds: {}".format(
+                    cluster_id, timeout, ", ".join("{} {}/{} on demand, {}/{} spot".format(
+                        x.fleet_type, x.provisioned_on_demand, x.to_on_demand, x.provisioned_spot, x.to_spot) for x in changes if not x.converged)))
+                return False
+            sleep(poll_interval)
+
+    def set_termination_protection(self, cluster_id: str, termination_protected: bool):
+        """
+        Enable or disable termination protection of an EMR cluster.
+
+        Arguments:
+            cluster_id {str} -- JobFlowId
+            termination_protected {bool} -- Protect the cluster from termination?
+
+        Returns:
+            Dictionary-- Response of set_termination_protection API
+        """
+        response: Dict = self._invoke("set_termination_protection", JobFlowIds=[cluster_id],
+                                      TerminationProtected=termination_protected)
+        self.invalidate_cache(cluster_id)
+        return response
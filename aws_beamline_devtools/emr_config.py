@@ -1,115 +1,705 @@
-import yaml
+import os
+import hashlib
 import logging
-
-logging.basicConfig(
-    format='%(asctime)s %(levelname)-8s %(message)s',
-    level=logging.INFO,
-    datefmt='%Y-%m-%d %H:%M:%S')
+import threading
+from collections import namedtuple
+from types import MappingProxyType
+from typing import Optional, List, Dict, Tuple, Any, Mapping
+from aws_beamline_devtools.emr_client import (fleet_instance_types_limit, max_fleet_instance_types_with_strategy,
+                                              spot_allocation_strategies, on_demand_allocation_strategies,
+                                              ebs_volume_sizes, release_supports, managed_scaling_releases,
+                                              auto_termination_releases, auto_termination_idle_timeouts)
+from aws_beamline_devtools.instance_catalog import instance_store_disks
+from aws_beamline_devtools.livy_pool import livy_session_kinds
+
+logger = logging.getLogger(__name__)
 emr_release_label = "emr-5.28.0"
 app_name = "spark"
 app_version = "2.4.4"
 
+# Marks a field that has to be set.
+required = object()
+roles = ("master", "core", "task")
+
+# (key, accepted type, default) of every key of a spec.clusterSize.<param set>.<size> entry.
+cluster_size_fields: List[Tuple[str, Any, Any]] = []
+for _role in roles:
+    cluster_size_fields += [
+        ("instance_type_" + _role, str, None),
+        ("instance_num_on_demand_" + _role, int, 0),
+        ("instance_num_spot_" + _role, int, 0),
+        ("instance_ebs_size_" + _role, int, None),
+        ("spot_bid_percentage_of_on_demand_" + _role, int, 100),
+    ]
+for _role in roles:
+    cluster_size_fields.append(("spot_provisioning_timeout_" + _role, int, None))
+for _role in roles:
+    cluster_size_fields.append(("spot_timeout_to_on_demand_" + _role, bool, True))
+for _role in roles:
+    cluster_size_fields += [
+        ("instance_types_" + _role, list, None),
+        ("spot_allocation_strategy_" + _role, str, None),
+        ("on_demand_allocation_strategy_" + _role, str, None),
+        ("ebs_volume_type_" + _role, str, "gp2"),
+        ("ebs_volumes_per_instance_" + _role, int, 1),
+        ("ebs_iops_" + _role, int, None),
+        ("ebs_throughput_" + _role, int, None),
+    ]
+cluster_size_fields += [
+    ("pool_target_idle", int, 0),
+    ("pool_idle_ttl_minutes", int, 120),
+    ("managed_scaling_min_units", int, None),
+    ("managed_scaling_max_units", int, None),
+    ("managed_scaling_max_on_demand_units", int, None),
+    ("managed_scaling_max_core_units", int, None),
+    ("auto_termination_idle_minutes", int, None),
+]
+
+# (key, accepted type, default) of every key of a spec.clusterParamSet.<param set> entry.
+param_set_fields: List[Tuple[str, Any, Any]] = [
+    ("emr_release_label", str, emr_release_label),
+    ("logging_s3_path", str, None),
+    ("subnet_id", str, None),
+    ("subnet_ids", list, None),
+    ("subnet_ranking", bool, False),
+    ("subnet_ranking_keep", int, None),
+    ("emr_ec2_role", str, required),
+    ("emr_role", str, required),
+    ("spark_glue_catalog", bool, None),
+    ("hive_glue_catalog", bool, None),
+    ("presto_glue_catalog", bool, None),
+    ("debugging", bool, None),
+    ("applications", list, None),
+    ("visible_to_all_users", bool, None),
+    ("key_pair_name", str, None),
+    ("security_group_master", str, None),
+    ("security_groups_master_additional", list, None),
+    ("security_group_slave", str, None),
+    ("security_groups_slave_additional", list, None),
+    ("security_group_service_access", str, None),
+    ("spark_log_level", str, None),
+    ("spark_jars_path", list, None),
+    ("spark_defaults", dict, None),
+    ("spark_executor_tuning", bool, False),
+    ("maximize_resource_allocation", bool, None),
+    ("keep_cluster_alive_when_no_steps", bool, None),
+    ("termination_protected", bool, None),
+    ("tags", dict, None),
+    ("python3", bool, None),
+    ("bootstraps_paths", list, None),
+    ("ebs_root_volume_size", int, 15),
+    ("num_concurrent_steps", int, 5),
+    ("reaper_idle_minutes", int, None),
+    ("reaper_grace_minutes", int, 30),
+    ("livy_warm_sessions", dict, None),
+    ("python_requirements", list, None),
+    ("dependency_jars", list, None),
+    ("dependency_s3_path", str, None),
+    ("dependency_python_version", str, "3.7"),
+    ("spot_rebalance_max_on_demand_units", int, None),
+    ("spot_rebalance_restore_minutes", int, 5),
+]
+
+# Keys of an instance_types_<role> entry, given either as a mapping or as an instance type name.
+instance_type_keys = ("instance_type", "weighted_capacity", "spot_bid_percentage_of_on_demand", "priority")
+
+# Immutable records, lists are stored as tuples and mappings as read only views.
+ClusterSizeSpec = namedtuple("ClusterSizeSpec", [x[0] for x in cluster_size_fields])
+ParamSetSpec = namedtuple("ParamSetSpec", [x[0] for x in param_set_fields])
+
+
+class ConfigError(ValueError):
+    """
+    emr.yaml is invalid or has no entry for the requested size or parameter set.
+    """
+
+
+def _freeze(value):
+    if isinstance(value, list):
+        return tuple(_freeze(x) for x in value)
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    return value
+
+
+def _compile_entry(location: str, entry: Any, fields: List[Tuple[str, Any, Any]], record, errors: List[str]):
+    if not isinstance(entry, dict):
+        errors.append("{}: expected a mapping".format(location))
+        return None
+    values = {}
+    for key, kind, default in fields:
+        value = entry.get(key)
+        if value is None:
+            if default is required:
+                errors.append("{}: {} is required".format(location, key))
+            values[key] = None if default is required else default
+            continue
+        # bool is a subclass of int, so True is not accepted as a count.
+        if not isinstance(value, kind) or (kind is int and isinstance(value, bool)):
+            errors.append("{}: {} must be {}, got {!r}".format(location, key, kind.__name__, value))
+            value = None if default is required else default
+        elif kind is int and value < 0:
+            errors.append("{}: {} must not be negative, got {}".format(location, key, value))
+            value = None if default is required else default
+        values[key] = _freeze(value)
+    unknown = sorted(set(entry) - set(values))
+    if unknown:
+        logger.warning("{}: ignoring unknown key(s) {}".format(location, ", ".join(map(str, unknown))))
+    return record(**values)
+
+
+def _compile_instance_types(location: str, role: str, entries: Tuple, default_bid: int, errors: List[str]) -> Tuple:
+    compiled = []
+    for i, entry in enumerate(entries):
+        entry_location = "{}: instance_types_{}[{}]".format(location, role, i)
+        if isinstance(entry, str):
+            entry = {"instance_type": entry}
+        if not isinstance(entry, Mapping):
+            errors.append("{} must be an instance type or a mapping".format(entry_location))
+            continue
+        unknown = sorted(set(entry) - set(instance_type_keys))
+        if unknown:
+            errors.append("{} has unknown key(s) {}".format(entry_location, ", ".join(map(str, unknown))))
+        instance_type = entry.get("instance_type")
+        weight = entry.get("weighted_capacity", 1)
+        bid = entry.get("spot_bid_percentage_of_on_demand", default_bid)
+        priority = entry.get("priority")
+        if not isinstance(instance_type, str):
+            errors.append("{}: instance_type is required".format(entry_location))
+        if not isinstance(weight, int) or isinstance(weight, bool) or weight < 1:
+            errors.append("{}: weighted_capacity must be a positive int, got {!r}".format(entry_location, weight))
+        elif role == "master" and weight != 1:
+            errors.append("{}: weighted_capacity of master instance types must be 1".format(entry_location))
+        if not isinstance(bid, (int, float)) or isinstance(bid, bool) or not 0 < bid <= 1000:
+            errors.append("{}: spot_bid_percentage_of_on_demand must be between 1 and 1000, got {!r}".format(entry_location, bid))
+        if priority is not None and (not isinstance(priority, (int, float)) or isinstance(priority, bool) or priority < 0):
+            errors.append("{}: priority must be a non negative number, got {!r}".format(entry_location, priority))
+        values = {"instance_type": instance_type, "weighted_capacity": weight, "spot_bid_percentage_of_on_demand": bid}
+        if priority is not None:
+            values["priority"] = priority
+        compiled.append(MappingProxyType(values))
+    return tuple(compiled)
+
+
+def _check_storage(location: str, role: str, size, instance_types: Tuple, errors: List[str]):
+    # Instance store types get no EBS volumes, so only EBS backed types need valid volume settings.
+    if all(instance_store_disks(x["instance_type"]) for x in instance_types):
+        return
+    volume_type = getattr(size, "ebs_volume_type_" + role)
+    volume_size = getattr(size, "instance_ebs_size_" + role)
+    iops = getattr(size, "ebs_iops_" + role)
+    throughput = getattr(size, "ebs_throughput_" + role)
+    if volume_type not in ebs_volume_sizes:
+        errors.append("{}: ebs_volume_type_{} must be one of {}".format(location, role, ", ".join(ebs_volume_sizes)))
+        return
+    smallest, largest = ebs_volume_sizes[volume_type]
+    if volume_size is None:
+        errors.append("{}: instance_ebs_size_{} is required for EBS backed instance types".format(location, role))
+    elif not smallest <= volume_size <= largest:
+        errors.append("{}: instance_ebs_size_{} must be between {} and {} GB for {} volumes, got {}".format(
+            location, role, smallest, largest, volume_type, volume_size))
+    if getattr(size, "ebs_volumes_per_instance_" + role) < 1:
+        errors.append("{}: ebs_volumes_per_instance_{} must be at least 1".format(location, role))
+    if volume_type in ("io1", "io2"):
+        max_ratio = 50 if volume_type == "io1" else 500
+        if iops is None:
+            errors.append("{}: ebs_iops_{} is required for {} volumes".format(location, role, volume_type))
+        elif not 100 <= iops <= 64000:
+            errors.append("{}: ebs_iops_{} must be between 100 and 64000, got {}".format(location, role, iops))
+        elif volume_size and iops > max_ratio * volume_size:
+            errors.append("{}: ebs_iops_{} can be at most {} per GB of {} volumes, got {} for {} GB".format(
+                location, role, max_ratio, volume_type, iops, volume_size))
+    elif volume_type == "gp3":
+        if iops is not None and not 3000 <= iops <= 16000:
+            errors.append("{}: ebs_iops_{} must be between 3000 and 16000 for gp3 volumes, got {}".format(location, role, iops))
+    elif iops is not None:
+        errors.append("{}: ebs_iops_{} is only supported for io1, io2 and gp3 volumes".format(location, role))
+    if throughput is not None:
+        if volume_type != "gp3":
+            errors.append("{}: ebs_throughput_{} is only supported for gp3 volumes".format(location, role))
+        elif not 125 <= throughput <= 1000:
+            errors.append("{}: ebs_throughput_{} must be between 125 and 1000 MiB/s, got {}".format(location, role, throughput))
+        elif throughput * 4 > (iops or 3000):
+            errors.append("{}: ebs_throughput_{} can be at most a quarter of the volume's IOPS ({})".format(location, role, iops or 3000))
+
+
+def _check_livy_sessions(location: str, counts: Optional[Mapping[str, Any]], errors: List[str]):
+    for kind, count in (counts or {}).items():
+        if kind not in livy_session_kinds:
+            errors.append("{}: livy_warm_sessions kind must be one of {}, got {}".format(location, ", ".join(livy_session_kinds), kind))
+        elif not isinstance(count, int) or isinstance(count, bool) or count < 0:
+            errors.append("{}: livy_warm_sessions.{} must be a non negative int, got {!r}".format(location, kind, count))
+
+
+def _check_subnets(location: str, params, errors: List[str]):
+    if params.subnet_ids is None:
+        if params.subnet_ranking:
+            errors.append("{}: subnet_ranking requires subnet_ids".format(location))
+        return
+    if params.subnet_id is not None:
+        errors.append("{}: set either subnet_id or subnet_ids, not both".format(location))
+    if not params.subnet_ids:
+        errors.append("{}: subnet_ids must list at least one subnet".format(location))
+    for subnet in params.subnet_ids:
+        if not isinstance(subnet, str) or not subnet.startswith("subnet-"):
+            errors.append("{}: subnet_ids entries must be subnet IDs, got {!r}".format(location, subnet))
+    if len(set(params.subnet_ids)) != len(params.subnet_ids):
+        errors.append("{}: subnet_ids lists a subnet more than once".format(location))
+    if params.subnet_ranking_keep is not None and params.subnet_ranking_keep < 1:
+        errors.append("{}: subnet_ranking_keep must be at least 1, got {}".format(location, params.subnet_ranking_keep))
+
+
+def _check_spot_rebalance(location: str, params, errors: List[str]):
+    if params.spot_rebalance_max_on_demand_units is not None and params.spot_rebalance_max_on_demand_units < 0:
+        errors.append("{}: spot_rebalance_max_on_demand_units must not be negative, got {}".format(
+            location, params.spot_rebalance_max_on_demand_units))
+    if params.spot_rebalance_restore_minutes < 0:
+        errors.append("{}: spot_rebalance_restore_minutes must not be negative, got {}".format(
+            location, params.spot_rebalance_restore_minutes))
+
+
+def _check_dependencies(location: str, params, errors: List[str]):
+    if not params.python_requirements and not params.dependency_jars:
+        return
+    if params.dependency_s3_path is None:
+        errors.append("{}: dependency_s3_path is required with python_requirements or dependency_jars".format(location))
+    elif not params.dependency_s3_path.startswith("s3://"):
+        errors.append("{}: dependency_s3_path must be an s3:// path, got {}".format(location, params.dependency_s3_path))
+    for jar in params.dependency_jars or ():
+        if not isinstance(jar, str) or not jar.endswith(".jar"):
+            errors.append("{}: dependency_jars entries must be paths of .jar files, got {!r}".format(location, jar))
+
+
+def _check_policies(location: str, size, release_label: str, errors: List[str]):
+    scaling = [size.managed_scaling_min_units, size.managed_scaling_max_units,
+               size.managed_scaling_max_on_demand_units, size.managed_scaling_max_core_units]
+    if any(x is not None for x in scaling):
+        min_units, max_units, max_on_demand_units, max_core_units = scaling
+        if min_units is None or max_units is None:
+            errors.append("{}: managed_scaling_min_units and managed_scaling_max_units are both required for managed scaling".format(location))
+        elif not 1 <= min_units <= max_units:
+            errors.append("{}: managed_scaling_min_units must be at least 1 and at most managed_scaling_max_units".format(location))
+        else:
+            for key, value in (("managed_scaling_max_on_demand_units", max_on_demand_units), ("managed_scaling_max_core_units", max_core_units)):
+                if value is not None and value > max_units:
+                    errors.append("{}: {} must not exceed managed_scaling_max_units".format(location, key))
+        if not release_supports(release_label, managed_scaling_releases):
+            errors.append("{}: managed scaling needs emr-5.30.0 or emr-6.1.0 and later, the parameter set uses {}".format(location, release_label))
+    idle_minutes = size.auto_termination_idle_minutes
+    if idle_minutes is not None:
+        smallest, largest = auto_termination_idle_timeouts
+        if not smallest <= idle_minutes * 60 <= largest:
+            errors.append("{}: auto_termination_idle_minutes must be between {} and {}".format(location, smallest // 60, largest // 60))
+        if not release_supports(release_label, auto_termination_releases):
+            errors.append("{}: auto termination needs emr-5.34.0 or emr-6.4.0 and later, the parameter set uses {}".format(location, release_label))
+        # Warm pool clusters sit idle by design, EMR would terminate them before the pool hands them out.
+        if size.pool_target_idle > 0 and idle_minutes < size.pool_idle_ttl_minutes:
+            errors.append("{}: auto_termination_idle_minutes must be at least pool_idle_ttl_minutes ({}) when pool_target_idle is set".format(
+                location, size.pool_idle_ttl_minutes))
+
+
+def _check_cluster_size(location: str, size, errors: List[str]):
+    replaced = {}
+    for role in roles:
+        count = getattr(size, "instance_num_on_demand_" + role) + getattr(size, "instance_num_spot_" + role)
+        instance_types = getattr(size, "instance_types_" + role)
+        spot_strategy = getattr(size, "spot_allocation_strategy_" + role)
+        on_demand_strategy = getattr(size, "on_demand_allocation_strategy_" + role)
+        if instance_types is not None:
+            if getattr(size, "instance_type_" + role) is not None:
+                errors.append("{}: set either instance_type_{} or instance_types_{}, not both".format(location, role, role))
+            if not instance_types:
+                errors.append("{}: instance_types_{} is empty".format(location, role))
+            instance_types = _compile_instance_types(location, role, instance_types,
+                                                     getattr(size, "spot_bid_percentage_of_on_demand_" + role), errors)
+            names = [x["instance_type"] for x in instance_types]
+            if len(set(names)) < len(names):
+                errors.append("{}: instance_types_{} lists an instance type more than once".format(location, role))
+            # Invalid strategies are reported below and don't raise the limit.
+            strategies = [x for x in (spot_strategy, on_demand_strategy)
+                          if x in spot_allocation_strategies + on_demand_allocation_strategies]
+            limit = fleet_instance_types_limit(role, strategies[0] if strategies else None)
+            if len(instance_types) > limit:
+                errors.append("{}: instance_types_{} has {} instance types, EMR allows at most {}{}".format(
+                    location, role, len(instance_types), limit,
+                    " without an allocation strategy" if limit < max_fleet_instance_types_with_strategy and role != "master" else ""))
+            replaced["instance_types_" + role] = instance_types
+        elif count and getattr(size, "instance_type_" + role) is None:
+            errors.append("{}: instance_type_{} or instance_types_{} is required when {} instances are requested".format(
+                location, role, role, role))
+        if spot_strategy is not None and spot_strategy not in spot_allocation_strategies:
+            errors.append("{}: spot_allocation_strategy_{} must be one of {}".format(location, role, ", ".join(spot_allocation_strategies)))
+        if on_demand_strategy is not None and on_demand_strategy not in on_demand_allocation_strategies:
+            errors.append("{}: on_demand_allocation_strategy_{} must be one of {}".format(
+                location, role, ", ".join(on_demand_allocation_strategies)))
+        if getattr(size, "instance_num_spot_" + role) and getattr(size, "spot_provisioning_timeout_" + role) is None:
+            errors.append("{}: spot_provisioning_timeout_{} is required when spot {} instances are requested".format(location, role, role))
+        if count:
+            if instance_types is None:
+                instance_type = getattr(size, "instance_type_" + role)
+                instance_types = ({"instance_type": instance_type},) if instance_type is not None else ()
+            _check_storage(location, role, size, instance_types, errors)
+    if size.instance_num_on_demand_master + size.instance_num_spot_master != 1:
+        # EMR refuses a master fleet whose target capacity is not exactly one unit.
+        errors.append("{}: exactly one master instance is required, instance_num_on_demand_master and instance_num_spot_master add up to {}".format(
+            location, size.instance_num_on_demand_master + size.instance_num_spot_master))
+    return size._replace(**replaced)
+
+
+class CompiledConfig:
+    """
+    Every cluster size and parameter set of an emr.yaml, validated once.
+    """
+    __slots__ = ("path", "digest", "stat_key", "cluster_sizes", "param_sets")
+
+    def __init__(self, path: str, digest: str, stat_key: tuple,
+                 cluster_sizes: Dict[str, Dict[str, Any]], param_sets: Dict[str, Any]):
+        self.path = path
+        self.digest = digest
+        self.stat_key = stat_key
+        self.cluster_sizes = MappingProxyType({k: MappingProxyType(v) for k, v in cluster_sizes.items()})
+        self.param_sets = MappingProxyType(param_sets)
+
+    def resolve(self, param_set_name: str, cluster_size: str) -> Tuple[Any, Any]:
+        """
+        Records of a size within a parameter set.
+
+        Arguments:
+            param_set_name {str} -- Parameters set name
+            cluster_size {str} -- Size of the cluster
+
+        Returns:
+            tuple -- (ClusterSizeSpec, ParamSetSpec)
+        """
+        if param_set_name not in self.param_sets:
+            raise ConfigError("Parameter set '{}' is not defined in {}, available: {}".format(
+                param_set_name, self.path, ", ".join(sorted(self.param_sets)) or "none"))
+        sizes = self.cluster_sizes.get(param_set_name, {})
+        if cluster_size not in sizes:
+            raise ConfigError("Cluster size '{}' is not defined for parameter set '{}' in {}, available: {}".format(
+                cluster_size, param_set_name, self.path, ", ".join(sorted(sizes)) or "none"))
+        return sizes[cluster_size], self.param_sets[param_set_name]
+
+
+def _load_yaml(content: bytes):
+    import yaml
+    # The libyaml based loader is several times faster, fall back to pure Python when it is not built in.
+    return yaml.load(content, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
+
+
+def _compile(path: str, content: bytes, digest: str, stat_key: tuple) -> CompiledConfig:
+    import yaml
+    try:
+        document = _load_yaml(content) or {}
+    except yaml.YAMLError as e:
+        raise ConfigError("{} is not valid YAML: {}".format(path, e)) from e
+    spec = document.get("spec") if isinstance(document, dict) else None
+    if not isinstance(spec, dict):
+        raise ConfigError("{}: no spec section".format(path))
+    errors: List[str] = []
+    param_sets = {}
+    for name, entry in (spec.get("clusterParamSet") or {}).items():
+        param_sets[name] = _compile_entry("clusterParamSet.{}".format(name), entry, param_set_fields, ParamSetSpec, errors)
+        if param_sets[name] is not None:
+            _check_livy_sessions("clusterParamSet.{}".format(name), param_sets[name].livy_warm_sessions, errors)
+            _check_dependencies("clusterParamSet.{}".format(name), param_sets[name], errors)
+            _check_subnets("clusterParamSet.{}".format(name), param_sets[name], errors)
+            _check_spot_rebalance("clusterParamSet.{}".format(name), param_sets[name], errors)
+    cluster_sizes: Dict[str, Dict[str, Any]] = {}
+    for name, sizes in (spec.get("clusterSize") or {}).items():
+        if name not in param_sets:
+            errors.append("clusterSize.{}: no clusterParamSet named {}".format(name, name))
+        cluster_sizes[name] = {}
+        for size_name, entry in (sizes or {}).items():
+            location = "clusterSize.{}.{}".format(name, size_name)
+            size = _compile_entry(location, entry, cluster_size_fields, ClusterSizeSpec, errors)
+            if size is not None:
+                cluster_sizes[name][size_name] = _check_cluster_size(location, size, errors)
+                if param_sets.get(name) is not None:
+                    _check_policies(location, size, param_sets[name].emr_release_label, errors)
+    if errors:
+        raise ConfigError("{} is invalid:\n  ".format(path) + "\n  ".join(errors))
+    return CompiledConfig(path, digest, stat_key, cluster_sizes, param_sets)
+
+
+_compiled_lock = threading.Lock()
+_compiled: Dict[str, CompiledConfig] = {}
+
+
+def compile_config(emr_config_path: str = "emr.yaml") -> CompiledConfig:
+    """
+    Parse and validate an emr.yaml. The result is cached per path and only recompiled when the
+    file's mtime or size changed and its sha256 differs from the compiled one.
+
+    Keyword Arguments:
+        emr_config_path {str} -- Path where the emr configuration file is stored (default: {"emr.yaml"})
+
+    Returns:
+        CompiledConfig -- Validated sizes and parameter sets
+    """
+    path = os.path.abspath(emr_config_path)
+    stat = os.stat(path)
+    stat_key = (stat.st_mtime_ns, stat.st_size)
+    compiled = _compiled.get(path)
+    if compiled is not None and compiled.stat_key == stat_key:
+        return compiled
+    with _compiled_lock:
+        compiled = _compiled.get(path)
+        if compiled is not None and compiled.stat_key == stat_key:
+            return compiled
+        with open(path, "rb") as f:
+            content = f.read()
+        digest = hashlib.sha256(content).hexdigest()
+        if compiled is not None and compiled.digest == digest:
+            compiled.stat_key = stat_key
+            return compiled
+        compiled = _compile(path, content, digest, stat_key)
+        _compiled[path] = compiled
+        logger.debug("Compiled {} ({} parameter sets)".format(path, len(compiled.param_sets)))
+        return compiled
+
+
 class EMRConfig:
     """
-    Module that parses a YAML formatted config file to be used as an input to create EMR cluster.
+    Parameters of one cluster size within a parameter set of a YAML formatted config file, used
+    as an input to create EMR cluster. The file is compiled once, see compile_config.
 
     Returns:
         Object -- Parameter value
     """
+    __slots__ = ("_compiled", "_cluster_size", "_param_set_name", "_size", "_params",
+                 "_app_name", "_app_version", "_emr_release_label")
 
     def __init__(self, cluster_size: str, param_set_name: str, emr_config_path: str="emr.yaml"):
-        self._emr_config = yaml.load(open(emr_config_path), Loader=yaml.SafeLoader).get("spec")
+        self._compiled = compile_config(emr_config_path)
         self._cluster_size = cluster_size
         self._app_name = app_name
         self._app_version = app_version
         self._param_set_name = param_set_name
-        self._cluster_size_config = self._emr_config["clusterSize"].get(self._param_set_name).get(self._cluster_size)
-        self._emr_release_label = emr_release_label
-        self._cluster_parameters = self._emr_config["clusterParamSet"].get(self._param_set_name)
+        self._size, self._params = self._compiled.resolve(param_set_name, cluster_size)
+        self._emr_release_label = self._params.emr_release_label
+
+    @property
+    def compiled(self) -> CompiledConfig:
+        return self._compiled
 
     @property
     def  instance_type_master(self):
-        return self._cluster_size_config.get("instance_type_master")
+        return self._size.instance_type_master
 
     @property
     def  instance_num_on_demand_master(self):
-        return self._cluster_size_config.get("instance_num_on_demand_master")
+        return self._size.instance_num_on_demand_master
 
     @property
     def  instance_num_spot_master(self):
-        return self._cluster_size_config.get("instance_num_spot_master")
+        return self._size.instance_num_spot_master
 
     @property
     def  instance_ebs_size_master(self):
-        return self._cluster_size_config.get("instance_ebs_size_master")
+        return self._size.instance_ebs_size_master
 
     @property
     def  spot_bid_percentage_of_on_demand_master(self):
-        return self._cluster_size_config.get("spot_bid_percentage_of_on_demand_master")
+        return self._size.spot_bid_percentage_of_on_demand_master
 
     @property
     def  instance_type_core(self):
-        return self._cluster_size_config.get("instance_type_core")
+        return self._size.instance_type_core
 
     @property
     def  instance_num_on_demand_core(self):
-        return self._cluster_size_config.get("instance_num_on_demand_core")
+        return self._size.instance_num_on_demand_core
 
     @property
     def  instance_num_spot_core(self):
-        return self._cluster_size_config.get("instance_num_spot_core")
+        return self._size.instance_num_spot_core
 
     @property
     def  instance_ebs_size_core(self):
-        return self._cluster_size_config.get("instance_ebs_size_core")
+        return self._size.instance_ebs_size_core
 
     @property
     def  spot_bid_percentage_of_on_demand_core(self):
-        return self._cluster_size_config.get("spot_bid_percentage_of_on_demand_core")
+        return self._size.spot_bid_percentage_of_on_demand_core
 
     @property
     def  instance_type_task(self):
-        return self._cluster_size_config.get("instance_type_task")
+        return self._size.instance_type_task
 
     @property
     def  instance_num_on_demand_task(self):
-        return self._cluster_size_config.get("instance_num_on_demand_task")
+        return self._size.instance_num_on_demand_task
 
     @property
     def  instance_num_spot_task(self):
-        return self._cluster_size_config.get("instance_num_spot_task")
+        return self._size.instance_num_spot_task
 
     @property
     def  instance_ebs_size_task(self):
-        return self._cluster_size_config.get("instance_ebs_size_task")
+        return self._size.instance_ebs_size_task
 
     @property
     def  spot_bid_percentage_of_on_demand_task(self):
-        return self._cluster_size_config.get("spot_bid_percentage_of_on_demand_task")
+        return self._size.spot_bid_percentage_of_on_demand_task
 
     @property
     def spot_provisioning_timeout_master(self):
-        return self._cluster_size_config.get("spot_provisioning_timeout_master")
+        return self._size.spot_provisioning_timeout_master
 
     @property
     def spot_provisioning_timeout_core(self):
-        return self._cluster_size_config.get("spot_provisioning_timeout_core")
+        return self._size.spot_provisioning_timeout_core
 
     @property
     def spot_provisioning_timeout_task(self):
-        return self._cluster_size_config.get("spot_provisioning_timeout_task")
+        return self._size.spot_provisioning_timeout_task
 
     @property
     def spot_timeout_to_on_demand_master(self):
-        return self._cluster_size_config.get("spot_timeout_to_on_demand_master")
+        return self._size.spot_timeout_to_on_demand_master
 
     @property
     def spot_timeout_to_on_demand_core(self):
-        return self._cluster_size_config.get("spot_timeout_to_on_demand_core")
+        return self._size.spot_timeout_to_on_demand_core
 
     @property
     def spot_timeout_to_on_demand_task(self):
-        return self._cluster_size_config.get("spot_timeout_to_on_demand_task")
+        return self._size.spot_timeout_to_on_demand_task
+
+    @property
+    def instance_types_master(self):
+        return self._size.instance_types_master
+
+    @property
+    def instance_types_core(self):
+        return self._size.instance_types_core
+
+    @property
+    def instance_types_task(self):
+        return self._size.instance_types_task
+
+    @property
+    def spot_allocation_strategy_master(self):
+        return self._size.spot_allocation_strategy_master
+
+    @property
+    def spot_allocation_strategy_core(self):
+        return self._size.spot_allocation_strategy_core
+
+    @property
+    def spot_allocation_strategy_task(self):
+        return self._size.spot_allocation_strategy_task
+
+    @property
+    def on_demand_allocation_strategy_master(self):
+        return self._size.on_demand_allocation_strategy_master
+
+    @property
+    def on_demand_allocation_strategy_core(self):
+        return self._size.on_demand_allocation_strategy_core
+
+    @property
+    def on_demand_allocation_strategy_task(self):
+        return self._size.on_demand_allocation_strategy_task
+
+    @property
+    def ebs_volume_type_master(self):
+        return self._size.ebs_volume_type_master
+
+    @property
+    def ebs_volume_type_core(self):
+        return self._size.ebs_volume_type_core
+
+    @property
+    def ebs_volume_type_task(self):
+        return self._size.ebs_volume_type_task
+
+    @property
+    def ebs_volumes_per_instance_master(self):
+        return self._size.ebs_volumes_per_instance_master
+
+    @property
+    def ebs_volumes_per_instance_core(self):
+        return self._size.ebs_volumes_per_instance_core
+
+    @property
+    def ebs_volumes_per_instance_task(self):
+        return self._size.ebs_volumes_per_instance_task
+
+    @property
+    def ebs_iops_master(self):
+        return self._size.ebs_iops_master
+
+    @property
+    def ebs_iops_core(self):
+        return self._size.ebs_iops_core
+
+    @property
+    def ebs_iops_task(self):
+        return self._size.ebs_iops_task
+
+    @property
+    def ebs_throughput_master(self):
+        return self._size.ebs_throughput_master
+
+    @property
+    def ebs_throughput_core(self):
+        return self._size.ebs_throughput_core
+
+    @property
+    def ebs_throughput_task(self):
+        return self._size.ebs_throughput_task
+
+    @property
+    def managed_scaling_min_units(self):
+        return self._size.managed_scaling_min_units
+
+    @property
+    def managed_scaling_max_units(self):
+        return self._size.managed_scaling_max_units
+
+    @property
+    def managed_scaling_max_on_demand_units(self):
+        return self._size.managed_scaling_max_on_demand_units
+
+    @property
+    def managed_scaling_max_core_units(self):
+        return self._size.managed_scaling_max_core_units
+
+    @property
+    def auto_termination_idle_minutes(self):
+        return self._size.auto_termination_idle_minutes
+
+    def fleet_instance_types(self, role: str) -> Tuple[Mapping[str, Any], ...]:
+        """
+        Instance types of a fleet with their weighted capacity and spot bid, whether the size
+        lists instance_types_<role> or a single instance_type_<role>.
+
+        Arguments:
+            role {str} -- master, core or task
+
+        Returns:
+            tuple -- Mappings with instance_type, weighted_capacity and spot_bid_percentage_of_on_demand
+        """
+        instance_types = getattr(self._size, "instance_types_" + role)
+        if instance_types is not None:
+            return instance_types
+        if getattr(self._size, "instance_type_" + role) is None:
+            return ()
+        return (MappingProxyType({
+            "instance_type": getattr(self._size, "instance_type_" + role),
+            "weighted_capacity": 1,
+            "spot_bid_percentage_of_on_demand": getattr(self._size, "spot_bid_percentage_of_on_demand_" + role),
+        }),)
+
+    @property
+    def pool_target_idle(self):
+        return self._size.pool_target_idle
+
+    @property
+    def pool_idle_ttl_minutes(self):
+        return self._size.pool_idle_ttl_minutes
 
     @property
     def emr_release_label(self):
@@ -117,116 +707,162 @@ class EMRConfig:
 
     @property
     def logging_s3_path(self):
-        return self._cluster_parameters.get("logging_s3_path")
+        return self._params.logging_s3_path
 
     @property
     def subnet_id(self):
-        return self._cluster_parameters.get("subnet_id")
+        return self._params.subnet_id
+
+    @property
+    def subnet_ids(self):
+        return self._params.subnet_ids
+
+    @property
+    def subnet_ranking(self):
+        return self._params.subnet_ranking
+
+    @property
+    def subnet_ranking_keep(self):
+        return self._params.subnet_ranking_keep
 
     @property
     def emr_ec2_role(self):
-        return self._cluster_parameters.get("emr_ec2_role")
+        return self._params.emr_ec2_role
 
     @property
     def emr_role(self):
-        return self._cluster_parameters.get("emr_role")
+        return self._params.emr_role
 
     @property
     def spark_glue_catalog(self):
-        return self._cluster_parameters.get("spark_glue_catalog")
+        return self._params.spark_glue_catalog
 
     @property
     def hive_glue_catalog(self):
-        return self._cluster_parameters.get("hive_glue_catalog")
+        return self._params.hive_glue_catalog
 
     @property
     def presto_glue_catalog(self):
-        return self._cluster_parameters.get("presto_glue_catalog")
+        return self._params.presto_glue_catalog
 
     @property
     def debugging(self):
-        return self._cluster_parameters.get("debugging")
+        return self._params.debugging
 
     @property
     def applications(self):
-        return self._cluster_parameters.get("applications")
+        return self._params.applications
 
     @property
     def visible_to_all_users(self):
-        return self._cluster_parameters.get("visible_to_all_users")
+        return self._params.visible_to_all_users
 
     @property
     def key_pair_name(self):
-        return self._cluster_parameters.get("key_pair_name")
+        return self._params.key_pair_name
 
     @property
     def security_group_master(self):
-        return self._cluster_parameters.get("security_group_master")
+        return self._params.security_group_master
 
     @property
     def security_groups_master_additional(self):
-        return self._cluster_parameters.get("security_groups_master_additional")
+        return self._params.security_groups_master_additional
 
     @property
     def security_group_slave(self):
-        return self._cluster_parameters.get("security_group_slave")
+        return self._params.security_group_slave
 
     @property
     def security_groups_slave_additional(self):
-        return self._cluster_parameters.get("security_groups_slave_additional")
+        return self._params.security_groups_slave_additional
 
     @property
     def security_group_service_access(self):
-        return self._cluster_parameters.get("security_group_service_access")
+        return self._params.security_group_service_access
 
     @property
     def spark_log_level(self):
-        return self._cluster_parameters.get("spark_log_level")
+        return self._params.spark_log_level
 
     @property
     def spark_jars_path(self):
-        return self._cluster_parameters.get("spark_jars_path")
+        return self._params.spark_jars_path
 
     @property
     def spark_defaults(self):
-        return self._cluster_parameters.get("spark_defaults")
+        return self._params.spark_defaults
+
+    @property
+    def spark_executor_tuning(self):
+        return self._params.spark_executor_tuning
 
     @property
     def maximize_resource_allocation(self):
-        return self._cluster_parameters.get("maximize_resource_allocation")
+        return self._params.maximize_resource_allocation
 
     @property
     def keep_cluster_alive_when_no_steps(self):
-        return self._cluster_parameters.get("keep_cluster_alive_when_no_steps")
+        return self._params.keep_cluster_alive_when_no_steps
 
     @property
     def termination_protected(self):
-        return self._cluster_parameters.get("termination_protected")
+        return self._params.termination_protected
 
     @property
     def tags(self):
-        return self._cluster_parameters.get("tags")
+        return self._params.tags
 
     @property
     def python3(self):
-        return self._cluster_parameters.get("python3")
+        return self._params.python3
 
     @property
     def bootstraps_paths(self):
-        return self._cluster_parameters.get("bootstraps_paths")
+        return self._params.bootstraps_paths
 
     @property
     def ebs_root_volume_size(self):
-        if self._cluster_parameters.get("ebs_root_volume_size") is None:
-            return 15
-        else:
-            return self._cluster_parameters.get("ebs_root_volume_size")
+        return self._params.ebs_root_volume_size
+
+    @property
+    def reaper_idle_minutes(self):
+        return self._params.reaper_idle_minutes
+
+    @property
+    def reaper_grace_minutes(self):
+        return self._params.reaper_grace_minutes
+
+    @property
+    def livy_warm_sessions(self):
+        return self._params.livy_warm_sessions
+
+    @property
+    def python_requirements(self):
+        return self._params.python_requirements
+
+    @property
+    def dependency_jars(self):
+        return self._params.dependency_jars
+
+    @property
+    def dependency_s3_path(self):
+        return self._params.dependency_s3_path
+
+    @property
+    def dependency_python_version(self):
+        return self._params.dependency_python_version
+
+    @property
+    def spot_rebalance_max_on_demand_units(self):
+        return self._params.spot_rebalance_max_on_demand_units
+
+    @property
+    def spot_rebalance_restore_minutes(self):
+        return self._params.spot_rebalance_restore_minutes
 
     @property
     def num_concurrent_steps(self):
-        if self._cluster_parameters.get("num_concurrent_steps") is None:
-            return 5
-        else:
-            return self._cluster_parameters.get("num_concurrent_steps")
+        return self._params.num_concurrent_steps
 
 
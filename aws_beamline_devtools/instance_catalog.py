@@ -0,0 +1,58 @@
+import os
+import json
+from collections import namedtuple
+from functools import lru_cache
+from typing import Optional, Mapping
+
+catalog_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "instance_catalog.json")
+
+InstanceSpec = namedtuple("InstanceSpec", ["instance_type", "vcpu", "memory_gib", "yarn_memory_mb",
+                                           "instance_store_disks", "instance_store_gb"])
+
+
+@lru_cache(maxsize=None)
+def instance_catalog(path: str = catalog_path) -> Mapping[str, InstanceSpec]:
+    """
+    Bundled instance type catalog: vCPUs, memory, YARN memory and NVMe instance store disks.
+
+    Keyword Arguments:
+        path {str} -- Catalog JSON (default: {catalog_path})
+
+    Returns:
+        Mapping[str, InstanceSpec] -- Specs by instance type
+    """
+    with open(path) as f:
+        entries = json.load(f)["instance_types"]
+    return {name: InstanceSpec(instance_type=name,
+                               vcpu=x["vcpu"],
+                               memory_gib=x["memory_gib"],
+                               yarn_memory_mb=x["yarn_memory_mb"],
+                               instance_store_disks=x.get("instance_store_disks", 0),
+                               instance_store_gb=x.get("instance_store_gb", 0)) for name, x in entries.items()}
+
+
+def lookup(instance_type: str) -> Optional[InstanceSpec]:
+    """
+    Catalog entry of an instance type.
+
+    Arguments:
+        instance_type {str} -- EC2 instance type, e.g. r5.4xlarge
+
+    Returns:
+        Optional[InstanceSpec] -- Spec, None when the type is not in the catalog
+    """
+    return instance_catalog().get(instance_type)
+
+
+def instance_store_disks(instance_type: str) -> int:
+    """
+    NVMe instance store disks of an instance type, 0 for EBS only and unknown types.
+
+    Arguments:
+        instance_type {str} -- EC2 instance type
+
+    Returns:
+        int -- Number of instance store disks
+    """
+    spec = lookup(instance_type)
+    return spec.instance_store_disks if spec is not None else 0
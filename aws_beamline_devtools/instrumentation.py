@@ -0,0 +1,222 @@
+import os
+import json
+import stat
+import time
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Optional, Dict, Any
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the latency histogram buckets in seconds.
+latency_buckets = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+max_logged_response_chars = 2000
+throttle_error_codes = {"ThrottlingException", "Throttling", "RequestLimitExceeded", "TooManyRequestsException"}
+
+
+def is_throttle_error(error: BaseException) -> bool:
+    """
+    Is the error a botocore ClientError caused by API throttling?
+
+    Arguments:
+        error {BaseException} -- Raised error
+
+    Returns:
+        bool -- True for throttling errors
+    """
+    response = getattr(error, "response", None) or {}
+    return response.get("Error", {}).get("Code") in throttle_error_codes
+
+
+def log_response(log: logging.Logger, operation: str, response: Any):
+    """
+    Log an API response at DEBUG level. The response is only serialized when DEBUG is enabled and
+    is truncated to max_logged_response_chars.
+
+    Arguments:
+        log {logging.Logger} -- Logger of the calling module
+        operation {str} -- Operation or label
+        response {Any} -- API response
+    """
+    if not log.isEnabledFor(logging.DEBUG):
+        return
+    text = json.dumps(response, default=str)
+    if len(text) > max_logged_response_chars:
+        text = "{}... ({} chars truncated)".format(text[:max_logged_response_chars], len(text) - max_logged_response_chars)
+    log.debug("%s response: %s", operation, text)
+
+
+class _OperationStats:
+    __slots__ = ("calls", "errors", "retries", "throttles", "latency_sum", "buckets")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.throttles = 0
+        self.latency_sum = 0.0
+        self.buckets = [0] * (len(latency_buckets) + 1)
+
+
+class Metrics:
+    """
+    Thread safe per operation call counts, latency histograms, retries and throttles.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._operations: Dict[str, _OperationStats] = {}
+
+    def _stats(self, operation: str) -> _OperationStats:
+        stats = self._operations.get(operation)
+        if stats is None:
+            stats = self._operations[operation] = _OperationStats()
+        return stats
+
+    def observe(self, operation: str, seconds: float, error: Optional[BaseException] = None, retries: int = 0):
+        """
+        Record one call.
+
+        Arguments:
+            operation {str} -- Operation name, e.g. describe_cluster
+            seconds {float} -- Latency
+
+        Keyword Arguments:
+            error {Optional[BaseException]} -- Error raised by the call (default: {None})
+            retries {int} -- Retries made by the SDK within the call (default: {0})
+        """
+        index = len(latency_buckets)
+        for i, bound in enumerate(latency_buckets):
+            if seconds <= bound:
+                index = i
+                break
+        with self._lock:
+            stats = self._stats(operation)
+            stats.calls += 1
+            stats.latency_sum += seconds
+            stats.buckets[index] += 1
+            stats.retries += retries
+            if error is not None:
+                stats.errors += 1
+                if is_throttle_error(error):
+                    stats.throttles += 1
+
+    def record_retry(self, operation: str, throttled: bool = False):
+        """
+        Record a retry made outside of the SDK, e.g. by the bulk runner.
+
+        Arguments:
+            operation {str} -- Operation name
+
+        Keyword Arguments:
+            throttled {bool} -- Was the retried call throttled? (default: {False})
+        """
+        with self._lock:
+            stats = self._stats(operation)
+            stats.retries += 1
+            if throttled:
+                stats.throttles += 1
+
+    @contextmanager
+    def timer(self, operation: str):
+        """
+        Time the enclosed call. Use the yielded dict to pass the response, whose SDK retry count is recorded.
+
+        Arguments:
+            operation {str} -- Operation name
+        """
+        holder: Dict[str, Any] = {}
+        started = time.perf_counter()
+        try:
+            yield holder
+        except BaseException as e:
+            self.observe(operation, time.perf_counter() - started, error=e)
+            raise
+        response = holder.get("response")
+        retries = response.get("ResponseMetadata", {}).get("RetryAttempts", 0) if isinstance(response, dict) else 0
+        self.observe(operation, time.perf_counter() - started, retries=retries)
+
+    def reset(self):
+        with self._lock:
+            self._operations.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Point in time copy of every counter.
+
+        Returns:
+            Dictionary -- Per operation calls, errors, retries, throttles, latency sum and cumulative buckets
+        """
+        with self._lock:
+            operations = {}
+            for name, stats in sorted(self._operations.items()):
+                cumulative, total = {}, 0
+                for bound, count in zip(list(latency_buckets) + ["+Inf"], stats.buckets):
+                    total += count
+                    cumulative[str(bound)] = total
+                operations[name] = {
+                    "calls": stats.calls,
+                    "errors": stats.errors,
+                    "retries": stats.retries,
+                    "throttles": stats.throttles,
+                    "latency_seconds_sum": round(stats.latency_sum, 6),
+                    "latency_seconds_avg": round(stats.latency_sum / stats.calls, 6) if stats.calls else 0.0,
+                    "latency_seconds_buckets": cumulative,
+                }
+            return {"timestamp": time.time(), "operations": operations}
+
+    def to_prometheus(self, prefix: str = "beamline_emr_api") -> str:
+        """
+        Render the counters in the Prometheus text exposition format.
+
+        Keyword Arguments:
+            prefix {str} -- Metric name prefix (default: {"beamline_emr_api"})
+
+        Returns:
+            str -- Prometheus text
+        """
+        operations = self.snapshot()["operations"]
+        lines = []
+        for counter, help_text in (("calls", "EMR API calls"), ("errors", "EMR API calls that raised"),
+                                   ("retries", "EMR API retries"), ("throttles", "Throttled EMR API calls")):
+            lines.append("# HELP {}_{}_total {}".format(prefix, counter, help_text))
+            lines.append("# TYPE {}_{}_total counter".format(prefix, counter))
+            for name, stats in operations.items():
+                lines.append('{}_{}_total{{operation="{}"}} {}'.format(prefix, counter, name, stats[counter]))
+        lines.append("# HELP {}_latency_seconds EMR API call latency".format(prefix))
+        lines.append("# TYPE {}_latency_seconds histogram".format(prefix))
+        for name, stats in operations.items():
+            for bound, count in stats["latency_seconds_buckets"].items():
+                lines.append('{}_latency_seconds_bucket{{operation="{}",le="{}"}} {}'.format(prefix, name, bound, count))
+            lines.append('{}_latency_seconds_sum{{operation="{}"}} {}'.format(prefix, name, stats["latency_seconds_sum"]))
+            lines.append('{}_latency_seconds_count{{operation="{}"}} {}'.format(prefix, name, stats["calls"]))
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str):
+        """
+        Atomically write the counters: Prometheus textfile when path ends with .prom, JSON otherwise.
+        An existing file keeps its permissions, a new one gets the default ones of the umask.
+
+        Arguments:
+            path {str} -- Output path
+        """
+        content = self.to_prometheus() if path.endswith(".prom") else json.dumps(self.snapshot(), indent=2)
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        try:
+            mode = stat.S_IMODE(os.stat(path).st_mode)
+        except FileNotFoundError:
+            umask = os.umask(0)
+            os.umask(umask)
+            mode = 0o666 & ~umask
+        # mkstemp creates the file 0600, a textfile collector running as another user could not read it.
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix="." + os.path.basename(path) + ".")
+        with os.fdopen(fd, "w") as f:
+            f.write(content)
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+
+
+# Process wide registry used by EMR.
+metrics = Metrics()
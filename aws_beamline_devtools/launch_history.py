@@ -0,0 +1,291 @@
+import os
+import json
+import time
+import logging
+import datetime
+import threading
+from typing import Optional, List, Dict, Iterable, Any
+from aws_beamline_devtools.emr_client import EMR
+from aws_beamline_devtools.emr_config import roles
+from aws_beamline_devtools.waiter import WaitResult
+
+logger = logging.getLogger(__name__)
+
+default_history_path = os.path.join(os.path.expanduser("~"), ".beamline", "history.db")
+# Launch columns a profile can be grouped or filtered by.
+group_columns = ("param_set", "cluster_size", "release_label", "fingerprint", "debugging", "subnet_id",
+                 "primary_instance_type", "hour_of_day", "outcome")
+profile_percentiles = (50, 90, 99)
+
+schema = """
+CREATE TABLE IF NOT EXISTS launches (
+    cluster_id TEXT PRIMARY KEY,
+    param_set TEXT,
+    cluster_size TEXT,
+    release_label TEXT,
+    fingerprint TEXT,
+    subnet_id TEXT,
+    primary_instance_type TEXT,
+    instance_types TEXT,
+    on_demand_units INTEGER,
+    spot_units INTEGER,
+    debugging INTEGER,
+    launched_at REAL,
+    hour_of_day INTEGER,
+    outcome TEXT,
+    ready_seconds REAL
+);
+CREATE TABLE IF NOT EXISTS phases (
+    cluster_id TEXT,
+    phase TEXT,
+    seconds REAL,
+    PRIMARY KEY (cluster_id, phase)
+);
+CREATE INDEX IF NOT EXISTS launches_by_size ON launches (param_set, cluster_size);
+"""
+# Columns added to launches after its first release, added in place to existing histories.
+added_columns = (
+    ("target_seconds", "REAL"),
+    ("predicted_seconds", "REAL"),
+)
+
+
+def _seconds_between(timeline: Dict, start: str, end: str) -> Optional[float]:
+    if timeline.get(start) is None or timeline.get(end) is None:
+        return None
+    return max(0.0, (timeline[end] - timeline[start]).total_seconds())
+
+
+def launch_phases(state_durations: Dict[str, float], description: Optional[Dict],
+                  fleets: Iterable[Dict], steps: Iterable[Dict]) -> Dict[str, float]:
+    """
+    Per phase seconds of a launch.
+
+    Arguments:
+        state_durations {Dict[str, float]} -- Seconds the waiter observed per cluster state
+        description {Optional[Dict]} -- Last describe_cluster response
+        fleets {Iterable[Dict]} -- list_instance_fleets entries
+        steps {Iterable[Dict]} -- list_steps entries
+
+    Returns:
+        Dict[str, float] -- "ready" (creation to ready), "state:<STATE>", "fleet:<TYPE>" (capacity provisioned) and "step:<name>"
+    """
+    phases = {"state:" + k: round(v, 1) for k, v in state_durations.items()}
+    timeline = ((description or {}).get("Cluster", {}).get("Status") or {}).get("Timeline") or {}
+    ready = _seconds_between(timeline, "CreationDateTime", "ReadyDateTime")
+    if ready is not None:
+        phases["ready"] = ready
+    for fleet in fleets:
+        seconds = _seconds_between(fleet.get("Status", {}).get("Timeline") or {}, "CreationDateTime", "ReadyDateTime")
+        if seconds is not None:
+            phases["fleet:" + fleet["InstanceFleetType"]] = seconds
+    for step in steps:
+        seconds = _seconds_between(step.get("Status", {}).get("Timeline") or {}, "StartDateTime", "EndDateTime")
+        if seconds is not None:
+            phases["step:" + step["Name"]] = seconds
+    return phases
+
+
+def percentile(values: List[float], q: float) -> float:
+    """
+    Percentile with linear interpolation between the closest ranks.
+
+    Arguments:
+        values {List[float]} -- Samples
+        q {float} -- Percentile between 0 and 100
+
+    Returns:
+        float -- Percentile of the samples
+    """
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100.0
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+class LaunchHistory:
+    """
+    Local SQLite history of cluster launches and the time spent in each of their phases.
+    """
+    def __init__(self, path: str = default_history_path):
+        """
+        Keyword Arguments:
+            path {str} -- SQLite database, ":memory:" for a throwaway one (default: {~/.beamline/history.db})
+        """
+        self._path = path
+        self._connection = None
+        self._lock = threading.Lock()
+
+    @property
+    def _db(self):
+        if self._connection is None:
+            import sqlite3
+            if self._path != ":memory:":
+                os.makedirs(os.path.dirname(os.path.abspath(self._path)), exist_ok=True)
+            self._connection = sqlite3.connect(self._path, timeout=30, check_same_thread=False)
+            self._connection.row_factory = sqlite3.Row
+            self._connection.executescript(schema)
+            self._migrate(self._connection)
+        return self._connection
+
+    @staticmethod
+    def _migrate(connection):
+        existing = {row["name"] for row in connection.execute("PRAGMA table_info(launches)")}
+        with connection:
+            for column, column_type in added_columns:
+                if column not in existing:
+                    connection.execute("ALTER TABLE launches ADD COLUMN {} {}".format(column, column_type))
+
+    def record(self, launch: Dict[str, Any], phases: Dict[str, float]):
+        """
+        Store a launch, replacing an earlier record of the same cluster.
+
+        Arguments:
+            launch {Dict[str, Any]} -- Values of the launches columns, cluster_id included
+            phases {Dict[str, float]} -- Seconds per phase, see launch_phases
+        """
+        columns = sorted(launch)
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO launches ({}) VALUES ({})".format(
+                ", ".join(columns), ", ".join("?" * len(columns))), [launch[x] for x in columns])
+            self._db.execute("DELETE FROM phases WHERE cluster_id = ?", (launch["cluster_id"],))
+            self._db.executemany("INSERT INTO phases (cluster_id, phase, seconds) VALUES (?, ?, ?)",
+                                 [(launch["cluster_id"], k, v) for k, v in phases.items()])
+
+    def launches(self, filters: Optional[Dict[str, Any]] = None, since: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Recorded launches, most recent first.
+
+        Keyword Arguments:
+            filters {Optional[Dict[str, Any]]} -- Column values to match, see group_columns (default: {None})
+            since {Optional[float]} -- Only launches from this epoch time on (default: {None})
+
+        Returns:
+            List[Dict[str, Any]] -- One dict of launches columns per launch
+        """
+        where, values = self._where(filters, since)
+        with self._lock:
+            rows = self._db.execute("SELECT * FROM launches{} ORDER BY launched_at DESC".format(where), values).fetchall()
+        return [dict(x) for x in rows]
+
+    @staticmethod
+    def _where(filters: Optional[Dict[str, Any]], since: Optional[float], table: str = "") -> tuple:
+        clauses, values = [], []
+        for column, value in sorted((filters or {}).items()):
+            if column not in group_columns:
+                raise ValueError("Cannot filter launches by {}, use one of {}".format(column, ", ".join(group_columns)))
+            clauses.append("{}{} = ?".format(table, column))
+            values.append(value)
+        if since is not None:
+            clauses.append("{}launched_at >= ?".format(table))
+            values.append(since)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), values
+
+    def phase_samples(self, group_by: str = "cluster_size", filters: Optional[Dict[str, Any]] = None) -> Dict[str, Dict[str, List[float]]]:
+        """
+        Phase durations of the recorded launches, grouped by a launch column.
+
+        Keyword Arguments:
+            group_by {str} -- Launch column, see group_columns (default: {"cluster_size"})
+            filters {Optional[Dict[str, Any]]} -- Column values to match (default: {None})
+
+        Returns:
+            Dict[str, Dict[str, List[float]]] -- Seconds per phase per group value
+        """
+        if group_by not in group_columns:
+            raise ValueError("Cannot group launches by {}, use one of {}".format(group_by, ", ".join(group_columns)))
+        where, values = self._where(filters, None, table="l.")
+        query = "SELECT l.{} AS grp, p.phase, p.seconds FROM launches l JOIN phases p ON p.cluster_id = l.cluster_id{}".format(
+            group_by, where)
+        samples: Dict[str, Dict[str, List[float]]] = {}
+        with self._lock:
+            for row in self._db.execute(query, values):
+                samples.setdefault(str(row["grp"]), {}).setdefault(row["phase"], []).append(row["seconds"])
+        return samples
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+def record_launch(history: LaunchHistory, emr: EMR, cluster_id: str, compute_manager, result: WaitResult,
+                  outcome: Optional[str] = None):
+    """
+    Record a cluster launched by a ComputeManager once the wait for it ended.
+
+    Arguments:
+        history {LaunchHistory} -- History to write to
+        emr {EMR} -- EMR client
+        cluster_id {str} -- JobFlowId
+        compute_manager {ComputeManager} -- Manager that launched the cluster
+        result {WaitResult} -- Outcome of the wait
+
+    Keyword Arguments:
+        outcome {Optional[str]} -- Recorded outcome, the last observed state when None (default: {None})
+    """
+    config = compute_manager.compute_config
+    plan = compute_manager.provisioning_plan
+    # A provisioning plan may have moved spot units to on demand.
+    overrides = plan.overrides if plan is not None else {}
+    description = result.description or emr.get_cluster_description(cluster_id)
+    cluster = description["Cluster"]
+    timeline = cluster["Status"].get("Timeline") or {}
+    created = timeline.get("CreationDateTime")
+    launched_at = created.timestamp() if created is not None else time.time() - result.elapsed
+    units = {role: tuple(overrides.get(key + role, getattr(config, key + role)) for key in ("instance_num_on_demand_", "instance_num_spot_"))
+             for role in roles}
+    primary_role = "core" if sum(units["core"]) > 0 else "master"
+    phases = launch_phases(result.state_durations, description, emr.iter_instance_fleets(cluster_id), emr.iter_steps(cluster_id))
+    history.record({
+        "cluster_id": cluster_id,
+        "param_set": compute_manager.param_set_name,
+        "cluster_size": compute_manager.cluster_size,
+        "release_label": config.emr_release_label,
+        "fingerprint": compute_manager.launch_fingerprint or compute_manager.spec_fingerprint(),
+        "subnet_id": (cluster.get("Ec2InstanceAttributes") or {}).get("Ec2SubnetId") or config.subnet_id,
+        "primary_instance_type": config.fleet_instance_types(primary_role)[0]["instance_type"],
+        "instance_types": json.dumps({role: [x["instance_type"] for x in config.fleet_instance_types(role)] for role in roles if sum(units[role]) > 0}),
+        "on_demand_units": sum(x[0] for x in units.values()),
+        "spot_units": sum(x[1] for x in units.values()),
+        "debugging": int(bool(config.debugging)),
+        "launched_at": launched_at,
+        "hour_of_day": datetime.datetime.utcfromtimestamp(launched_at).hour,
+        "outcome": outcome or result.state,
+        "ready_seconds": phases.get("ready"),
+        "target_seconds": plan.target_seconds if plan is not None else None,
+        "predicted_seconds": plan.predicted_seconds if plan is not None else None,
+    }, phases)
+    logger.info("Launch of cluster {} recorded: {}".format(cluster_id, {k: round(v) for k, v in sorted(phases.items())}))
+    if plan is not None:
+        logger.info("Cluster {} ready after {} against a predicted {} (target {:.0f}s)".format(
+            cluster_id, "{:.0f}s".format(phases["ready"]) if "ready" in phases else "unknown",
+            "{:.0f}s".format(plan.predicted_seconds) if plan.predicted_seconds is not None else "unknown", plan.target_seconds))
+
+
+def format_profile(samples: Dict[str, Dict[str, List[float]]], group_by: str) -> str:
+    """
+    Plain text per phase breakdown of each group: launches, mean and percentiles in seconds.
+
+    Arguments:
+        samples {Dict[str, Dict[str, List[float]]]} -- See LaunchHistory.phase_samples
+        group_by {str} -- Column the samples are grouped by
+
+    Returns:
+        str -- One block per group
+    """
+    if not samples:
+        return "No launches recorded"
+    blocks = []
+    header = "{:<40} {:>5} {:>8}".format("PHASE", "N", "MEAN") + "".join(" {:>8}".format("P{}".format(q)) for q in profile_percentiles)
+    for group in sorted(samples):
+        phases = samples[group]
+        lines = ["{} = {} ({} launch(es))".format(group_by, group, max(len(x) for x in phases.values())), header]
+        # The total first, then phases by their typical share of it.
+        for phase in sorted(phases, key=lambda x: (x != "ready", -percentile(phases[x], 50), x)):
+            values = phases[phase]
+            lines.append("{:<40} {:>5} {:>8.1f}".format(phase[:40], len(values), sum(values) / len(values)) +
+                         "".join(" {:>8.1f}".format(percentile(values, q)) for q in profile_percentiles))
+        blocks.append("\n".join(lines))
+    return "\n\n".join(blocks)
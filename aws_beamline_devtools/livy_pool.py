@@ -0,0 +1,227 @@
+import json
+import time
+import uuid
+import logging
+from typing import Optional, List, Dict, Mapping, Callable, Any
+from aws_beamline_devtools.create_sparkmagic_config import livy_port
+
+logger = logging.getLogger(__name__)
+
+# Session kinds of the sparkmagic kernels: PySpark and Spark (Scala).
+livy_session_kinds = ("pyspark", "spark")
+# Sessions created by the pool are named with this prefix, other sessions are never touched.
+session_name_prefix = "beamline-warm-"
+starting_session_states = {"not_started", "starting"}
+healthy_session_states = {"not_started", "starting", "idle", "busy"}
+
+
+class LivySession:
+    """
+    A Livy session of the pool.
+    """
+    __slots__ = ("session_id", "kind", "name", "state", "app_id", "url")
+
+    def __init__(self, session_id: int, kind: str, name: Optional[str], state: str,
+                 app_id: Optional[str] = None, url: Optional[str] = None):
+        self.session_id = session_id
+        self.kind = kind
+        self.name = name
+        self.state = state
+        self.app_id = app_id
+        self.url = url
+
+    @staticmethod
+    def from_response(session: Dict, url: str) -> "LivySession":
+        return LivySession(session["id"], session.get("kind"), session.get("name"), session.get("state"),
+                           session.get("appId"), "{}/sessions/{}".format(url, session["id"]))
+
+    @property
+    def healthy(self) -> bool:
+        return self.state in healthy_session_states
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {k: getattr(self, k) for k in self.__slots__}
+
+
+class LivySessionPool:
+    """
+    Keeps pre-started Livy sessions per kind on a cluster's master, reserving YARN capacity for
+    code that submits statements to Livy directly. sparkmagic kernels do not pick these sessions up.
+    """
+    def __init__(self, host: str, port: int = livy_port, timeout: float = 10.0, poll_interval: float = 2.0,
+                 session_conf: Optional[Mapping[str, Any]] = None, scheme: str = "http",
+                 sleep: Callable[[float], None] = time.sleep):
+        """
+        Arguments:
+            host {str} -- Master node address
+
+        Keyword Arguments:
+            port {int} -- Livy port (default: {8998})
+            timeout {float} -- Seconds to wait for each Livy request (default: {10.0})
+            poll_interval {float} -- Seconds between session state checks while waiting (default: {2.0})
+            session_conf {Optional[Mapping[str, Any]]} -- Extra POST /sessions fields, e.g. {"driverMemory": "4g"} (default: {None})
+            scheme {str} -- http or https (default: {"http"})
+        """
+        self.url = "{}://{}:{}".format(scheme, host, port)
+        self._timeout = timeout
+        self._poll_interval = poll_interval
+        self._session_conf = dict(session_conf or {})
+        self._sleep = sleep
+
+    def _request(self, method: str, path: str, body: Optional[Dict] = None) -> Dict:
+        # urllib.request pulls in http.client and ssl, only worth importing when Livy is called.
+        import urllib.request
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        request = urllib.request.Request(self.url + path, data=data, method=method,
+                                         headers={"Content-Type": "application/json", "X-Requested-By": "beamline"})
+        with urllib.request.urlopen(request, timeout=self._timeout) as response:
+            content = response.read()
+        return json.loads(content.decode("utf-8")) if content else {}
+
+    def list_sessions(self) -> List[LivySession]:
+        """
+        Sessions created by the pool, in any state.
+
+        Returns:
+            List[LivySession] -- Pool sessions
+        """
+        sessions = self._request("GET", "/sessions?size=1000").get("sessions") or []
+        return [LivySession.from_response(x, self.url) for x in sessions
+                if (x.get("name") or "").startswith(session_name_prefix)]
+
+    def create_session(self, kind: str) -> LivySession:
+        """
+        Start a pool session.
+
+        Arguments:
+            kind {str} -- pyspark or spark
+
+        Returns:
+            LivySession -- The new session, usually starting
+        """
+        if kind not in livy_session_kinds:
+            raise ValueError("Livy session kind must be one of {}, got {}".format(", ".join(livy_session_kinds), kind))
+        body = dict(self._session_conf, kind=kind, name="{}{}-{}".format(session_name_prefix, kind, uuid.uuid4().hex[:8]))
+        session = LivySession.from_response(self._request("POST", "/sessions", body), self.url)
+        logger.info("Started Livy {} session {} on {}".format(kind, session.session_id, self.url))
+        return session
+
+    def delete_session(self, session: LivySession):
+        """
+        Stop a pool session and its Spark application.
+
+        Arguments:
+            session {LivySession} -- Session to stop
+        """
+        self._request("DELETE", "/sessions/{}".format(session.session_id))
+        logger.info("Deleted Livy {} session {} ({})".format(session.kind, session.session_id, session.state))
+
+    def check(self, session: LivySession) -> bool:
+        """
+        Refresh the state and YARN application of a session.
+
+        Arguments:
+            session {LivySession} -- Session to check
+
+        Returns:
+            bool -- False when the session is dead, errored, killed, shutting down or gone
+        """
+        try:
+            response = self._request("GET", "/sessions/{}".format(session.session_id))
+            session.state = response.get("state")
+            session.app_id = response.get("appId") or session.app_id
+        except Exception as e:
+            if getattr(e, "code", None) != 404:
+                raise
+            session.state = "gone"
+        return session.healthy
+
+    def recycle(self) -> List[LivySession]:
+        """
+        Delete pool sessions that are no longer usable.
+
+        Returns:
+            List[LivySession] -- Deleted sessions
+        """
+        dead = [x for x in self.list_sessions() if not x.healthy]
+        for session in dead:
+            try:
+                self.delete_session(session)
+            except Exception as e:
+                logger.warning("Could not delete Livy session {}: {}".format(session.session_id, e))
+        return dead
+
+    def wait_idle(self, sessions: List[LivySession], timeout: float = 300) -> List[LivySession]:
+        """
+        Wait until sessions leave their starting states.
+
+        Arguments:
+            sessions {List[LivySession]} -- Sessions to wait for
+
+        Keyword Arguments:
+            timeout {float} -- Seconds to wait (default: {300})
+
+        Returns:
+            List[LivySession] -- Sessions that are idle or busy, the others are left out
+        """
+        deadline = time.monotonic() + timeout
+        waiting = list(sessions)
+        while waiting:
+            waiting = [x for x in waiting if self.check(x) and x.state in starting_session_states]
+            if waiting and time.monotonic() >= deadline:
+                logger.warning("Livy session(s) {} still starting after {:.0f} seconds".format(
+                    ", ".join(str(x.session_id) for x in waiting), timeout))
+                break
+            if waiting:
+                self._sleep(self._poll_interval)
+        return [x for x in sessions if x.state in ("idle", "busy")]
+
+    def warm(self, counts: Mapping[str, int], timeout: float = 300) -> Dict[str, List[LivySession]]:
+        """
+        Bring the pool to the requested number of sessions per kind: dead sessions are recycled,
+        missing ones started, and all of them waited for.
+
+        Arguments:
+            counts {Mapping[str, int]} -- Sessions per kind, e.g. {"pyspark": 1, "spark": 1}
+
+        Keyword Arguments:
+            timeout {float} -- Seconds to wait for the sessions to become idle (default: {300})
+
+        Returns:
+            Dict[str, List[LivySession]] -- Ready sessions per kind
+        """
+        self.recycle()
+        existing = self.list_sessions()
+        sessions: List[LivySession] = []
+        for kind, count in counts.items():
+            own = [x for x in existing if x.kind == kind]
+            sessions += own[:count]
+            for _ in range(count - len(own)):
+                sessions.append(self.create_session(kind))
+        ready = self.wait_idle(sessions, timeout)
+        for session in sessions:
+            if not session.healthy:
+                logger.warning("Livy {} session {} died while starting ({})".format(session.kind, session.session_id, session.state))
+        result: Dict[str, List[LivySession]] = {kind: [] for kind in counts}
+        for session in ready:
+            result[session.kind].append(session)
+        return result
+
+
+def parse_session_counts(value: str) -> Dict[str, int]:
+    """
+    Parse session counts given as "pyspark=1,spark=1".
+
+    Arguments:
+        value {str} -- Comma separated kind=count pairs
+
+    Returns:
+        Dict[str, int] -- Sessions per kind
+    """
+    counts: Dict[str, int] = {}
+    for pair in [x.strip() for x in value.split(",") if x.strip()]:
+        kind, _, count = pair.partition("=")
+        if kind.strip() not in livy_session_kinds or not count.strip().isdigit():
+            raise ValueError("Expected kind=count with kind one of {}, got {}".format(", ".join(livy_session_kinds), pair))
+        counts[kind.strip()] = int(count)
+    return counts
@@ -0,0 +1,210 @@
+import time
+import logging
+import datetime
+from typing import Optional, List, Dict, Callable, Any
+from aws_beamline_devtools.emr_config import roles
+from aws_beamline_devtools.launch_history import LaunchHistory, percentile
+
+logger = logging.getLogger(__name__)
+
+# EMR accepts spot provisioning timeouts between 5 and 1440 minutes.
+min_spot_timeout_minutes = 5
+# Launches older than this no longer say much about current capacity.
+prediction_lookback_days = 30
+# Fewest successful launches a prediction is made from.
+min_prediction_samples = 3
+# Percentile of past times to ready used as the prediction, a latency target needs more than the median.
+prediction_percentile = 90
+# Subnets are ranked on the launches of this many recent days.
+subnet_ranking_lookback_days = 7
+
+
+class ProvisioningPlan:
+    """
+    How a launch is bought to meet a time to ready target.
+    """
+    __slots__ = ("target_seconds", "purchase", "predicted_seconds", "predicted_spot_seconds",
+                 "predicted_on_demand_seconds", "basis", "overrides")
+
+    def __init__(self, target_seconds: float, purchase: str, predicted_seconds: Optional[float],
+                 predicted_spot_seconds: Optional[float], predicted_on_demand_seconds: Optional[float],
+                 basis: str, overrides: Dict[str, Any]):
+        self.target_seconds = target_seconds
+        self.purchase = purchase
+        self.predicted_seconds = predicted_seconds
+        self.predicted_spot_seconds = predicted_spot_seconds
+        self.predicted_on_demand_seconds = predicted_on_demand_seconds
+        self.basis = basis
+        self.overrides = overrides
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {k: getattr(self, k) for k in self.__slots__}
+
+
+def _seconds(value: Optional[float]) -> str:
+    return "unknown" if value is None else "{:.0f}s".format(value)
+
+
+class ProvisioningPredictor:
+    """
+    Predicts the time to ready of a launch from the launch history, matching the primary instance
+    type, subnet and hour of day of past launches and widening the match when too few are recorded.
+    """
+    def __init__(self, history: LaunchHistory, lookback_days: float = prediction_lookback_days,
+                 min_samples: int = min_prediction_samples, q: float = prediction_percentile,
+                 now: Callable[[], float] = time.time):
+        """
+        Arguments:
+            history {LaunchHistory} -- Launch history to predict from
+
+        Keyword Arguments:
+            lookback_days {float} -- Only launches this recent are used (default: {30})
+            min_samples {int} -- Fewest matching launches a prediction is made from (default: {3})
+            q {float} -- Percentile of the matching times to ready that is predicted (default: {90})
+        """
+        self._history = history
+        self._lookback_days = lookback_days
+        self._min_samples = min_samples
+        self._q = q
+        self._now = now
+
+    def predict(self, instance_type: str, subnet_id: Optional[str], spot: bool) -> tuple:
+        """
+        Predicted seconds from creation to ready.
+
+        Arguments:
+            instance_type {str} -- Primary instance type, the first core type or the master one without core nodes
+            subnet_id {Optional[str]} -- Subnet of the launch, None when EMR chooses among several
+            spot {bool} -- Predict launches requesting spot capacity, otherwise on demand only ones
+
+        Returns:
+            tuple -- (seconds or None without enough history, description of the matched launches)
+        """
+        now = self._now()
+        hour = datetime.datetime.utcfromtimestamp(now).hour
+        if subnet_id is not None:
+            keys: List[Dict[str, Any]] = [
+                {"primary_instance_type": instance_type, "subnet_id": subnet_id, "hour_of_day": hour},
+                {"primary_instance_type": instance_type, "subnet_id": subnet_id},
+            ]
+        else:
+            # EMR picks the subnet among several.
+            keys = [{"primary_instance_type": instance_type, "hour_of_day": hour}]
+        keys.append({"primary_instance_type": instance_type})
+        since = now - self._lookback_days * 86400
+        for filters in keys:
+            launches = self._history.launches(dict(filters, outcome="WAITING"), since=since)
+            samples = [x["ready_seconds"] for x in launches
+                       if x["ready_seconds"] is not None and (x["spot_units"] > 0) == spot]
+            if len(samples) >= self._min_samples:
+                basis = "P{:.0f} of {} launch(es) matching {}".format(self._q, len(samples), ", ".join(
+                    "{}={}".format(k, v) for k, v in sorted(filters.items())))
+                return percentile(samples, self._q), basis
+        return None, "fewer than {} matching launches".format(self._min_samples)
+
+    def plan(self, config, target_seconds: float) -> ProvisioningPlan:
+        """
+        Choose spot or on demand capacity and spot timeouts for a cluster size so it is ready within a target.
+
+        Spot capacity is kept when it is predicted to be ready in time; its provisioning timeout is
+        then shortened so that falling back to on demand still fits the target. Spot units move to
+        on demand when spot is predicted to miss the target. Without enough history spot is kept
+        with the shortened timeout.
+
+        Arguments:
+            config {EMRConfig} -- Cluster size and parameter set of the launch
+            target_seconds {float} -- Wanted seconds from creation to ready
+
+        Returns:
+            ProvisioningPlan -- Plan with the create_cluster arguments to override
+        """
+        units = {role: (getattr(config, "instance_num_on_demand_" + role), getattr(config, "instance_num_spot_" + role)) for role in roles}
+        primary_role = "core" if sum(units["core"]) > 0 else "master"
+        instance_type = config.fleet_instance_types(primary_role)[0]["instance_type"]
+        subnet_id = config.subnet_id
+        if config.subnet_ids:
+            subnet_id = config.subnet_ids[0] if len(config.subnet_ids) == 1 else None
+        on_demand, on_demand_basis = self.predict(instance_type, subnet_id, spot=False)
+        if not any(x[1] for x in units.values()):
+            return ProvisioningPlan(target_seconds, "on_demand", on_demand, None, on_demand, on_demand_basis, {})
+        spot, spot_basis = self.predict(instance_type, subnet_id, spot=True)
+
+        if spot is not None and spot > target_seconds and (on_demand is None or on_demand < spot):
+            overrides: Dict[str, Any] = {}
+            for role, (on_demand_units, spot_units) in units.items():
+                if spot_units:
+                    overrides["instance_num_on_demand_" + role] = on_demand_units + spot_units
+                    overrides["instance_num_spot_" + role] = 0
+            return ProvisioningPlan(target_seconds, "on_demand", on_demand, spot, on_demand, on_demand_basis, overrides)
+
+        # Leave enough of the target for on demand capacity once spot times out.
+        fallback = on_demand if on_demand is not None else (spot if spot is not None else target_seconds / 2)
+        timeout = max(min_spot_timeout_minutes, int((target_seconds - fallback) // 60))
+        overrides = {}
+        for role, (_, spot_units) in units.items():
+            if spot_units:
+                overrides["spot_provisioning_timeout_" + role] = min(timeout, getattr(config, "spot_provisioning_timeout_" + role))
+                overrides["spot_timeout_to_on_demand_" + role] = True
+        return ProvisioningPlan(target_seconds, "spot", spot, spot, on_demand, spot_basis, overrides)
+
+
+class SubnetScore:
+    """
+    Recent launch record of a subnet.
+    """
+    __slots__ = ("subnet_id", "launches", "succeeded", "median_ready_seconds")
+
+    def __init__(self, subnet_id: str, launches: int, succeeded: int, median_ready_seconds: Optional[float]):
+        self.subnet_id = subnet_id
+        self.launches = launches
+        self.succeeded = succeeded
+        self.median_ready_seconds = median_ready_seconds
+
+    @property
+    def success_rate(self) -> float:
+        # Laplace smoothed, a subnet without launches ranks as even odds and still gets tried.
+        return (self.succeeded + 1.0) / (self.launches + 2.0)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict({k: getattr(self, k) for k in self.__slots__}, success_rate=round(self.success_rate, 3))
+
+
+def rank_subnets(history: LaunchHistory, subnet_ids: List[str], lookback_days: float = subnet_ranking_lookback_days,
+                 now: Callable[[], float] = time.time) -> List[SubnetScore]:
+    """
+    Rank subnets by the success of their recent launches, then by their median time to ready.
+
+    Arguments:
+        history {LaunchHistory} -- Launch history, whose subnet_id is the subnet EMR launched in
+        subnet_ids {List[str]} -- Subnets to rank
+
+    Keyword Arguments:
+        lookback_days {float} -- Only launches this recent count (default: {7})
+
+    Returns:
+        List[SubnetScore] -- Best subnet first
+    """
+    since = now() - lookback_days * 86400
+    scores = []
+    for subnet_id in subnet_ids:
+        launches = history.launches({"subnet_id": subnet_id}, since=since)
+        ready = [x["ready_seconds"] for x in launches if x["outcome"] == "WAITING" and x["ready_seconds"] is not None]
+        scores.append(SubnetScore(subnet_id, len(launches), sum(1 for x in launches if x["outcome"] == "WAITING"),
+                                  percentile(ready, 50) if ready else None))
+    # sorted is stable, ties keep the configured order.
+    return sorted(scores, key=lambda x: (-x.success_rate, x.median_ready_seconds if x.median_ready_seconds is not None else float("inf")))
+
+
+def log_plan(plan: ProvisioningPlan):
+    """
+    Log a plan and warn when the target is predicted to be missed.
+
+    Arguments:
+        plan {ProvisioningPlan} -- Plan to log
+    """
+    logger.info("Time to ready target {:.0f}s: buying {} capacity, predicted {} (spot {}, on demand {}; {}), overrides {}".format(
+        plan.target_seconds, plan.purchase.replace("_", " "), _seconds(plan.predicted_seconds), _seconds(plan.predicted_spot_seconds),
+        _seconds(plan.predicted_on_demand_seconds), plan.basis, plan.overrides))
+    if plan.predicted_seconds is not None and plan.predicted_seconds > plan.target_seconds:
+        logger.warning("The cluster is predicted to be ready after {}, past the {:.0f}s target".format(
+            _seconds(plan.predicted_seconds), plan.target_seconds))
@@ -0,0 +1,238 @@
+import os
+import copy
+import json
+import time
+import logging
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Dict, Callable, Any
+from aws_beamline_devtools.emr_client import EMR, tag_prefix, param_set_tag_key
+from aws_beamline_devtools.emr_config import compile_config
+from aws_beamline_devtools.cluster_pool import ClusterPool, locked_json_state, default_pool_state_path
+from aws_beamline_devtools.create_sparkmagic_config import livy_port
+
+logger = logging.getLogger(__name__)
+
+default_reaper_state_path = os.path.join(os.path.expanduser("~"), ".beamline", "reaper.json")
+yarn_port = 8088
+# Clusters carrying this tag are never reaped.
+keep_alive_tag_key = tag_prefix + "keep-alive"
+# Set on idle clusters once warned, holds the time they will be terminated at.
+termination_warning_tag_key = tag_prefix + "idle-termination-at"
+candidate_states = ["WAITING", "RUNNING"]
+# Livy sessions in these states are doing or about to do work.
+active_livy_states = {"not_started", "starting", "busy"}
+
+
+class ReapItem:
+    """
+    Outcome of one cluster in a reaper sweep.
+    """
+    __slots__ = ("cluster_id", "cluster_name", "param_set", "activity", "idle_minutes", "action", "error")
+
+    def __init__(self, cluster_id: str, cluster_name: Optional[str] = None, param_set: Optional[str] = None):
+        self.cluster_id = cluster_id
+        self.cluster_name = cluster_name
+        self.param_set = param_set
+        # active, idle or unreachable
+        self.activity: Optional[str] = None
+        self.idle_minutes = 0.0
+        # none, warned, terminated, protected or skipped
+        self.action = "none"
+        self.error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {k: getattr(self, k) for k in self.__slots__}
+
+
+class Reaper:
+    """
+    Terminates clusters launched by this tool once they have been idle past the reaper_idle_minutes
+    of their parameter set. A cluster is busy while an EMR step, a Livy statement or a YARN application
+    other than an idle Livy session's runs. An idle cluster is first warned, through a tag and the
+    on_warning callback, and terminated when it is still idle reaper_grace_minutes later.
+    """
+    def __init__(self, emr: EMR, emr_config_path: str = "emr.yaml", state_path: str = default_reaper_state_path,
+                 pool_state_path: Optional[str] = default_pool_state_path, max_workers: int = 32,
+                 probe_timeout: float = 5.0, livy_port: int = livy_port, yarn_port: int = yarn_port,
+                 disable_protection: bool = False, dry_run: bool = False,
+                 on_warning: Optional[Callable[[ReapItem, float], None]] = None,
+                 clock: Callable[[], float] = time.time):
+        """
+        Arguments:
+            emr {EMR} -- EMR client
+
+        Keyword Arguments:
+            emr_config_path {str} -- emr.yaml with the reaper_idle_minutes and reaper_grace_minutes of each parameter set (default: {"emr.yaml"})
+            state_path {str} -- Local file recording since when clusters are idle (default: {~/.beamline/reaper.json})
+            pool_state_path {Optional[str]} -- Warm pool state, unassigned pool clusters are left to the pool; None to reap them too (default: {~/.beamline/cluster_pool.json})
+            max_workers {int} -- Clusters probed concurrently (default: {32})
+            probe_timeout {float} -- Seconds to wait for each Livy and YARN request (default: {5.0})
+            livy_port {int} -- Livy port of the master node (default: {8998})
+            yarn_port {int} -- YARN resource manager port of the master node (default: {8088})
+            disable_protection {bool} -- Turn termination protection off before terminating, otherwise protected clusters are only warned (default: {False})
+            dry_run {bool} -- Report what would be done without tagging or terminating (default: {False})
+            on_warning {Optional[Callable[[ReapItem, float], None]]} -- Called with the cluster and its termination time when it is warned (default: {None})
+        """
+        self._emr = emr
+        self._emr_config_path = emr_config_path
+        self._state_path = state_path
+        self._pool_state_path = pool_state_path
+        self._max_workers = max_workers
+        self._probe_timeout = probe_timeout
+        self._livy_port = livy_port
+        self._yarn_port = yarn_port
+        self._disable_protection = disable_protection
+        self._dry_run = dry_run
+        self._on_warning = on_warning
+        self._clock = clock
+
+    def _get_json(self, url: str) -> Dict:
+        import urllib.request
+        with urllib.request.urlopen(url, timeout=self._probe_timeout) as response:
+            return json.loads(response.read().decode("utf-8"))
+
+    def probe(self, host: str) -> str:
+        """
+        Check Livy sessions and YARN applications of a master node.
+
+        Arguments:
+            host {str} -- Master node address
+
+        Returns:
+            str -- active, idle or unreachable
+        """
+        try:
+            sessions = self._get_json("http://{}:{}/sessions".format(host, self._livy_port)).get("sessions") or []
+            apps = self._get_json("http://{}:{}/ws/v1/cluster/apps?states=RUNNING,ACCEPTED".format(host, self._yarn_port))
+        except Exception as e:
+            logger.warning("Could not probe {}: {}".format(host, e))
+            return "unreachable"
+        if any(x.get("state") in active_livy_states for x in sessions):
+            return "active"
+        # Idle Livy sessions keep their Spark application running in YARN.
+        idle_session_apps = {x.get("appId") for x in sessions if x.get("appId")}
+        running = [x for x in ((apps.get("apps") or {}).get("app") or []) if x.get("id") not in idle_session_apps]
+        return "active" if running else "idle"
+
+    def _inspect(self, summary: Dict, pool_cluster_ids: set, thresholds: Dict[str, Any]) -> Optional[tuple]:
+        cluster_id = summary["Id"]
+        cluster = self._emr.get_cluster_description(cluster_id)["Cluster"]
+        tags = {x["Key"]: x["Value"] for x in cluster.get("Tags", [])}
+        param_set = tags.get(param_set_tag_key)
+        if param_set is None or keep_alive_tag_key in tags or cluster_id in pool_cluster_ids:
+            return None
+        item = ReapItem(cluster_id, cluster.get("Name"), param_set)
+        if thresholds.get(param_set) is None or thresholds[param_set].reaper_idle_minutes is None:
+            item.action = "skipped"
+            return item, cluster, tags
+        if cluster["Status"]["State"] == "RUNNING":
+            # EMR reports RUNNING while a step runs.
+            item.activity = "active"
+        else:
+            host = self._emr.get_master_private_ip(cluster_id)
+            item.activity = self.probe(host) if host is not None else "unreachable"
+        return item, cluster, tags
+
+    def _terminate(self, item: ReapItem, cluster: Dict):
+        if cluster.get("TerminationProtected"):
+            if not self._disable_protection:
+                item.action = "protected"
+                logger.warning("Cluster {} is idle past its grace period but termination protected".format(item.cluster_id))
+                return
+            if not self._dry_run:
+                self._emr.set_termination_protection(item.cluster_id, False)
+        if not self._dry_run:
+            self._emr.terminate_cluster(item.cluster_id)
+        item.action = "terminated"
+        logger.info("{} idle cluster {} ({}, idle {:.0f} minutes)".format("Would terminate" if self._dry_run else "Terminated",
+                                                                      item.cluster_id, item.cluster_name, item.idle_minutes))
+
+    def _warn(self, item: ReapItem, terminate_at: float):
+        deadline = datetime.datetime.utcfromtimestamp(terminate_at).strftime("%Y-%m-%dT%H:%M:%SZ")
+        if not self._dry_run:
+            self._emr.add_tags(item.cluster_id, {termination_warning_tag_key: deadline})
+        item.action = "warned"
+        logger.warning("Cluster {} ({}) has been idle for {:.0f} minutes and will be terminated at {} unless it is used".format(
+            item.cluster_id, item.cluster_name, item.idle_minutes, deadline))
+        if self._on_warning is not None:
+            self._on_warning(item, terminate_at)
+
+    def sweep(self) -> List[ReapItem]:
+        """
+        Probe every live cluster launched by this tool and warn or terminate idle ones.
+
+        Returns:
+            List[ReapItem] -- Outcome per cluster
+        """
+        now = self._clock()
+        thresholds = compile_config(self._emr_config_path).param_sets
+        pool_cluster_ids = set(ClusterPool(self._emr, self._pool_state_path).cluster_ids()) if self._pool_state_path else set()
+        summaries = list(self._emr.iter_clusters(cluster_states=candidate_states))
+
+        def inspect(summary):
+            try:
+                return self._inspect(summary, pool_cluster_ids, thresholds)
+            except Exception as e:
+                item = ReapItem(summary["Id"], summary.get("Name"))
+                item.activity, item.error = "unreachable", str(e)
+                return item, None, {}
+
+        with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+            inspected = [x for x in executor.map(inspect, summaries) if x is not None]
+
+        items: List[ReapItem] = []
+        with locked_json_state(self._state_path, {"clusters": {}}) as saved:
+            # A dry run reports what a real sweep would do and leaves the idle clocks alone.
+            state = copy.deepcopy(saved) if self._dry_run else saved
+            live = {item.cluster_id for item, _, _ in inspected}
+            for cluster_id in list(state["clusters"]):
+                if cluster_id not in live:
+                    del state["clusters"][cluster_id]
+            for item, cluster, tags in inspected:
+                items.append(item)
+                if item.activity is None or item.activity == "unreachable":
+                    # Unknown activity neither starts nor resets the idle clock.
+                    continue
+                entry = state["clusters"].get(item.cluster_id)
+                if item.activity == "active":
+                    state["clusters"].pop(item.cluster_id, None)
+                    if termination_warning_tag_key in tags and not self._dry_run:
+                        self._emr.remove_tags(item.cluster_id, [termination_warning_tag_key])
+                        logger.info("Cluster {} is in use again, termination warning withdrawn".format(item.cluster_id))
+                    continue
+                if entry is None:
+                    entry = state["clusters"][item.cluster_id] = {"idle_since": now, "warned_at": None}
+                item.idle_minutes = round((now - entry["idle_since"]) / 60.0, 1)
+                params = thresholds[item.param_set]
+                try:
+                    if entry["warned_at"] is not None and now - entry["warned_at"] >= params.reaper_grace_minutes * 60:
+                        self._terminate(item, cluster)
+                        if item.action == "terminated":
+                            del state["clusters"][item.cluster_id]
+                    elif entry["warned_at"] is None and item.idle_minutes >= params.reaper_idle_minutes:
+                        self._warn(item, now + params.reaper_grace_minutes * 60)
+                        entry["warned_at"] = now
+                except Exception as e:
+                    item.error = str(e)
+                    logger.error("Reaping cluster {} failed: {}".format(item.cluster_id, e))
+        return items
+
+def format_report(items: List[ReapItem]) -> str:
+    """
+    Plain text status table of a reaper sweep.
+
+    Arguments:
+        items {List[ReapItem]} -- Sweep outcome
+
+    Returns:
+        str -- One line per cluster and a summary line
+    """
+    lines = ["{:<22} {:<28} {:<12} {:<12} {:>12} {:<11}  {}".format(
+        "CLUSTER_ID", "NAME", "PARAM_SET", "ACTIVITY", "IDLE_MINUTES", "ACTION", "ERROR")]
+    for x in items:
+        lines.append("{:<22} {:<28} {:<12} {:<12} {:>12.1f} {:<11}  {}".format(
+            x.cluster_id, x.cluster_name or "-", x.param_set or "-", x.activity or "-", x.idle_minutes, x.action, x.error or ""))
+    lines.append("{} cluster(s), {} warned, {} terminated".format(
+        len(items), len([x for x in items if x.action == "warned"]), len([x for x in items if x.action == "terminated"])))
+    return "\n".join(lines)
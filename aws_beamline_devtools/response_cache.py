@@ -0,0 +1,130 @@
+import json
+import time
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Callable, Any
+
+# Seconds a response stays fresh per EMR operation. Operations not listed are never cached.
+default_ttls: Dict[str, float] = {
+    "describe_cluster": 10,
+    "list_clusters": 10,
+    "list_instances": 60,
+}
+
+
+class _InFlight:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class ResponseCache:
+    """
+    Thread safe TTL and LRU cache for read only EMR API responses.
+
+    Identical requests issued concurrently are coalesced: one thread calls the API and the
+    others wait for its response. Cached responses are shared between callers and must be
+    treated as read only.
+    """
+    def __init__(self, ttls: Optional[Dict[str, float]] = None, max_entries: int = 256,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        Keyword Arguments:
+            ttls {Optional[Dict[str, float]]} -- Seconds to keep a response per operation (default: {default_ttls})
+            max_entries {int} -- Entries kept before the least recently used one is evicted (default: {256})
+        """
+        self._ttls = default_ttls if ttls is None else ttls
+        self._max_entries = max_entries
+        self._clock = clock
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._in_flight: Dict[tuple, _InFlight] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(operation: str, params: Dict[str, Any]) -> tuple:
+        return operation, json.dumps(params, sort_keys=True, default=str)
+
+    def get_or_call(self, operation: str, params: Dict[str, Any], call: Callable[[], Any]) -> Any:
+        """
+        Return a fresh cached response, wait for an identical in-flight request, or make the call.
+
+        Arguments:
+            operation {str} -- EMR operation name, e.g. describe_cluster
+            params {Dict[str, Any]} -- Request parameters
+            call {Callable[[], Any]} -- Makes the API request
+
+        Returns:
+            Any -- API response
+        """
+        ttl = self._ttls.get(operation)
+        if not ttl:
+            return call()
+        key = self._key(operation, params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > self._clock():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            in_flight = self._in_flight.get(key)
+            leader = in_flight is None
+            if leader:
+                in_flight = self._in_flight[key] = _InFlight()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            in_flight.event.wait()
+            if in_flight.error is not None:
+                raise in_flight.error
+            return in_flight.result
+
+        try:
+            in_flight.result = call()
+            return in_flight.result
+        except BaseException as e:
+            in_flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+                if in_flight.error is None:
+                    self._entries[key] = (self._clock() + ttl, params, in_flight.result)
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self._max_entries:
+                        self._entries.popitem(last=False)
+                        self.evictions += 1
+            in_flight.event.set()
+
+    def invalidate(self, cluster_id: Optional[str] = None):
+        """
+        Drop cached responses after a mutating call.
+
+        Keyword Arguments:
+            cluster_id {Optional[str]} -- Drop responses about this cluster and cluster listings. None drops everything. (default: {None})
+        """
+        with self._lock:
+            if cluster_id is None:
+                self._entries.clear()
+                return
+            for key in [k for k, v in self._entries.items() if v[1].get("ClusterId") in (cluster_id, None)]:
+                del self._entries[key]
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Cache counters
+
+        Returns:
+            Dictionary -- hits, misses, coalesced requests, evictions and current size
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "coalesced": self.coalesced,
+                    "evictions": self.evictions, "size": len(self._entries)}
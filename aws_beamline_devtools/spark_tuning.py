@@ -0,0 +1,152 @@
+import math
+import logging
+from typing import Optional, List, Dict, Tuple, Mapping, Sequence, Any
+from aws_beamline_devtools.emr_config import EMRConfig, ConfigError, roles
+from aws_beamline_devtools.instance_catalog import InstanceSpec, catalog_path, lookup
+
+logger = logging.getLogger(__name__)
+
+# Executors with more than five cores get poor HDFS and S3 throughput.
+target_executor_cores = 5
+memory_overhead_fraction = 0.1
+min_memory_overhead_mb = 384
+partitions_per_core = 2
+# Spark properties set by the tuner, in report order.
+tuned_properties = ("spark.executor.cores", "spark.executor.memory", "spark.executor.memoryOverhead",
+                    "spark.executor.instances", "spark.default.parallelism", "spark.sql.shuffle.partitions")
+
+
+def instance_spec(instance_type: str) -> InstanceSpec:
+    """
+    Catalog entry of an instance type.
+
+    Arguments:
+        instance_type {str} -- EC2 instance type, e.g. r5.4xlarge
+
+    Returns:
+        InstanceSpec -- vCPUs, memory, YARN memory and instance store disks
+    """
+    spec = lookup(instance_type)
+    if spec is None:
+        raise ConfigError("Instance type {} is not in the bundled catalog {}".format(instance_type, catalog_path))
+    return spec
+
+
+class ExecutorPlan:
+    """
+    Executor sizing derived from the fleets a cluster runs executors on.
+    """
+    __slots__ = ("executor_cores", "executor_memory_mb", "memory_overhead_mb", "executor_instances",
+                 "parallelism", "nodes")
+
+    def __init__(self, executor_cores: int, executor_memory_mb: int, memory_overhead_mb: int,
+                 executor_instances: int, parallelism: int, nodes: List[Dict[str, Any]]):
+        self.executor_cores = executor_cores
+        self.executor_memory_mb = executor_memory_mb
+        self.memory_overhead_mb = memory_overhead_mb
+        self.executor_instances = executor_instances
+        self.parallelism = parallelism
+        self.nodes = nodes
+
+    def properties(self) -> Dict[str, str]:
+        """
+        spark-defaults properties of the plan.
+
+        Returns:
+            Dictionary -- Property values as strings
+        """
+        return {
+            "spark.executor.cores": str(self.executor_cores),
+            "spark.executor.memory": "{}m".format(self.executor_memory_mb),
+            "spark.executor.memoryOverhead": "{}m".format(self.memory_overhead_mb),
+            "spark.executor.instances": str(self.executor_instances),
+            "spark.default.parallelism": str(self.parallelism),
+            "spark.sql.shuffle.partitions": str(self.parallelism),
+        }
+
+    def format_report(self, spark_defaults: Optional[Mapping[str, str]] = None) -> str:
+        """
+        Plain text report of the node types, the derived properties and those overridden by configured spark_defaults.
+
+        Keyword Arguments:
+            spark_defaults {Optional[Mapping[str, str]]} -- Configured spark_defaults, which take precedence (default: {None})
+
+        Returns:
+            str -- Report
+        """
+        spark_defaults = spark_defaults or {}
+        lines = ["{:<7} {:<14} {:>6} {:>6} {:>5} {:>8} {:>15}".format(
+            "FLEET", "INSTANCE_TYPE", "UNITS", "WEIGHT", "VCPU", "YARN_MB", "EXECUTORS/NODE")]
+        for x in self.nodes:
+            lines.append("{:<7} {:<14} {:>6} {:>6} {:>5} {:>8} {:>15}".format(
+                x["fleet"], x["instance_type"], x["units"], x["weighted_capacity"], x["vcpu"], x["yarn_memory_mb"],
+                x["executors_per_node"]))
+        lines.append("")
+        for name, value in self.properties().items():
+            if name in spark_defaults:
+                lines.append("{:<32} {:<10} overridden by spark_defaults: {}".format(name, value, spark_defaults[name]))
+            else:
+                lines.append("{:<32} {}".format(name, value))
+        return "\n".join(lines)
+
+
+def plan_executors(fleets: Sequence[Tuple[str, int, Sequence[Mapping[str, Any]]]]) -> ExecutorPlan:
+    """
+    Size executors so that one executor container fits every instance type of the fleets.
+
+    Arguments:
+        fleets {Sequence[Tuple[str, int, Sequence[Mapping[str, Any]]]]} -- (fleet, target capacity units, instance types with instance_type and weighted_capacity)
+
+    Returns:
+        ExecutorPlan -- Executor sizing
+    """
+    nodes = [(fleet, units, x, instance_spec(x["instance_type"])) for fleet, units, types in fleets for x in types]
+    if not nodes:
+        raise ConfigError("No instance types to size executors for")
+    executor_cores = min(target_executor_cores, min(spec.vcpu for _, _, _, spec in nodes))
+    # The smallest container any node type can give each of its executors.
+    container_mb = min(spec.yarn_memory_mb // (spec.vcpu // executor_cores) for _, _, _, spec in nodes)
+    memory_overhead_mb = max(min_memory_overhead_mb, int(math.ceil(container_mb * memory_overhead_fraction / (1 + memory_overhead_fraction))))
+    executor_memory_mb = container_mb - memory_overhead_mb
+
+    report, executors = [], 0.0
+    for fleet, units, types in fleets:
+        per_unit = None
+        for x in types:
+            spec = instance_spec(x["instance_type"])
+            per_node = min(spec.vcpu // executor_cores, spec.yarn_memory_mb // container_mb)
+            weight = x.get("weighted_capacity", 1)
+            # Capacity may be filled with any of the types, so count the least executors per unit.
+            per_unit = per_node / weight if per_unit is None else min(per_unit, per_node / weight)
+            report.append({"fleet": fleet, "instance_type": spec.instance_type, "units": units, "weighted_capacity": weight,
+                           "vcpu": spec.vcpu, "yarn_memory_mb": spec.yarn_memory_mb, "executors_per_node": per_node})
+        executors += units * (per_unit or 0)
+    # One container goes to the application master, which runs the driver in YARN cluster mode.
+    executor_instances = max(1, int(executors) - 1)
+    return ExecutorPlan(executor_cores=executor_cores,
+                        executor_memory_mb=executor_memory_mb,
+                        memory_overhead_mb=memory_overhead_mb,
+                        executor_instances=executor_instances,
+                        parallelism=executor_instances * executor_cores * partitions_per_core,
+                        nodes=report)
+
+
+def tune_spark(config: EMRConfig) -> ExecutorPlan:
+    """
+    Executor sizing of a cluster size: executors run on the core and task fleets, or on the
+    master when the size has neither.
+
+    Arguments:
+        config {EMRConfig} -- Size and parameter set
+
+    Returns:
+        ExecutorPlan -- Executor sizing
+    """
+    fleets = []
+    for role in roles:
+        units = getattr(config, "instance_num_on_demand_" + role) + getattr(config, "instance_num_spot_" + role)
+        if role != "master" and units > 0:
+            fleets.append((role, units, config.fleet_instance_types(role)))
+    if not fleets:
+        fleets.append(("master", 1, config.fleet_instance_types("master")))
+    return plan_executors(fleets)
@@ -0,0 +1,287 @@
+import os
+import json
+import time
+import logging
+import datetime
+import threading
+from typing import Optional, List, Dict, Callable, Any
+from aws_beamline_devtools.emr_client import EMR, tag_prefix, param_set_tag_key
+from aws_beamline_devtools.emr_config import compile_config
+
+logger = logging.getLogger(__name__)
+
+default_event_log_path = os.path.join(os.path.expanduser("~"), ".beamline", "spot-events.jsonl")
+# Fleets the watcher rebalances; the master fleet can't be resized.
+watched_fleet_types = ("CORE", "TASK")
+# Holds the on demand targets of fleets while they are raised, "<fleet id>=<units>,...", so a restarted watcher can lower them back.
+on_demand_baseline_tag_key = tag_prefix + "on-demand-baseline"
+
+
+class FleetCapacity:
+    """
+    Target and provisioned capacity of an instance fleet.
+    """
+    __slots__ = ("fleet_id", "fleet_type", "state", "target_on_demand", "target_spot", "provisioned_on_demand", "provisioned_spot")
+
+    def __init__(self, fleet_id: str, fleet_type: str, state: str, target_on_demand: int, target_spot: int,
+                 provisioned_on_demand: int, provisioned_spot: int):
+        self.fleet_id = fleet_id
+        self.fleet_type = fleet_type
+        self.state = state
+        self.target_on_demand = target_on_demand
+        self.target_spot = target_spot
+        self.provisioned_on_demand = provisioned_on_demand
+        self.provisioned_spot = provisioned_spot
+
+    @staticmethod
+    def from_response(fleet: Dict) -> "FleetCapacity":
+        return FleetCapacity(fleet["Id"], fleet["InstanceFleetType"], fleet.get("Status", {}).get("State"),
+                             fleet.get("TargetOnDemandCapacity", 0), fleet.get("TargetSpotCapacity", 0),
+                             fleet.get("ProvisionedOnDemandCapacity", 0), fleet.get("ProvisionedSpotCapacity", 0))
+
+    @property
+    def spot_shortfall(self) -> int:
+        return max(0, self.target_spot - self.provisioned_spot)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {k: getattr(self, k) for k in self.__slots__}
+
+
+class SpotEvent:
+    """
+    Something the watcher saw or did.
+    """
+    __slots__ = ("at", "cluster_id", "fleet_type", "kind", "detail")
+
+    def __init__(self, at: float, cluster_id: str, fleet_type: str, kind: str, detail: Dict[str, Any]):
+        self.at = at
+        self.cluster_id = cluster_id
+        self.fleet_type = fleet_type
+        # interrupted, degraded, raised, capped, restored or recovered
+        self.kind = kind
+        self.detail = detail
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict({k: getattr(self, k) for k in self.__slots__},
+                    time=datetime.datetime.utcfromtimestamp(self.at).strftime("%Y-%m-%dT%H:%M:%SZ"))
+
+
+def _parse_baseline(value: Optional[str]) -> Dict[str, int]:
+    pairs = [x.partition("=") for x in (value or "").split(",") if "=" in x]
+    return {fleet_id: int(units) for fleet_id, _, units in pairs}
+
+
+class SpotWatcher:
+    """
+    Watches the core and task fleets of a cluster for lost spot capacity. While a fleet is short of
+    spot units it raises the fleet's on demand target, up to the spot_rebalance_max_on_demand_units
+    of the cluster's parameter set, and lowers it back once EMR has replaced the spot capacity for
+    spot_rebalance_restore_minutes. Every event is logged with its time to a JSON lines file.
+    """
+    def __init__(self, emr: EMR, cluster_id: str, max_on_demand_units: Optional[int] = None, restore_minutes: float = 5,
+                 event_log_path: Optional[str] = default_event_log_path, clock: Callable[[], float] = time.time):
+        """
+        Arguments:
+            emr {EMR} -- EMR client
+            cluster_id {str} -- JobFlowId
+
+        Keyword Arguments:
+            max_on_demand_units {Optional[int]} -- Most on demand units per fleet while replacing spot, None only records events (default: {None})
+            restore_minutes {float} -- Minutes spot capacity must be back before on demand targets are lowered (default: {5})
+            event_log_path {Optional[str]} -- JSON lines file events are appended to, None keeps them in memory (default: {~/.beamline/spot-events.jsonl})
+        """
+        self._emr = emr
+        self.cluster_id = cluster_id
+        self._max_on_demand_units = max_on_demand_units
+        self._restore_seconds = restore_minutes * 60
+        self._event_log_path = event_log_path
+        self._clock = clock
+        self._stop = threading.Event()
+        self.events: List[SpotEvent] = []
+        # Per fleet: when spot capacity went short, and since when it is full again.
+        self._degraded_since: Dict[str, float] = {}
+        self._full_since: Dict[str, float] = {}
+        self._capped: set = set()
+        self._seen_interruptions: Optional[set] = None
+        # On demand targets of the raised fleets, read back from the cluster's tag on the first check.
+        self._baseline: Optional[Dict[str, int]] = None
+
+    @staticmethod
+    def for_cluster(emr: EMR, cluster_id: str, emr_config_path: str = "emr.yaml", param_set_name: Optional[str] = None,
+                    **kwargs) -> "SpotWatcher":
+        """
+        Watcher with the cost cap of the cluster's parameter set, read from its beamline:param-set tag.
+
+        Arguments:
+            emr {EMR} -- EMR client
+            cluster_id {str} -- JobFlowId
+
+        Keyword Arguments:
+            emr_config_path {str} -- Path of emr.yaml (default: {"emr.yaml"})
+            param_set_name {Optional[str]} -- Parameter set of clusters without the tag (default: {None})
+            **kwargs -- Passed to SpotWatcher
+
+        Returns:
+            SpotWatcher -- Watcher of the cluster
+        """
+        tags = {x["Key"]: x["Value"] for x in emr.get_cluster_description(cluster_id)["Cluster"].get("Tags", [])}
+        params = compile_config(emr_config_path).param_sets.get(tags.get(param_set_tag_key, param_set_name))
+        if params is None:
+            logger.warning("No parameter set found for cluster {}, spot capacity is watched without rebalancing".format(cluster_id))
+            return SpotWatcher(emr, cluster_id, **kwargs)
+        return SpotWatcher(emr, cluster_id, params.spot_rebalance_max_on_demand_units, params.spot_rebalance_restore_minutes, **kwargs)
+
+    def _event(self, fleet_type: str, kind: str, **detail) -> SpotEvent:
+        event = SpotEvent(self._clock(), self.cluster_id, fleet_type, kind, detail)
+        self.events.append(event)
+        logger.log(logging.INFO if kind in ("restored", "recovered") else logging.WARNING,
+                   "Cluster {} {} fleet {}: {}".format(self.cluster_id, fleet_type, kind, detail))
+        if self._event_log_path is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(self._event_log_path)), exist_ok=True)
+            with open(self._event_log_path, "a") as f:
+                f.write(json.dumps(event.to_dict(), sort_keys=True) + "\n")
+        return event
+
+    def _save_baseline(self):
+        if self._baseline:
+            self._emr.add_tags(self.cluster_id, {on_demand_baseline_tag_key: ",".join(
+                "{}={}".format(k, v) for k, v in sorted(self._baseline.items()))})
+        else:
+            self._emr.remove_tags(self.cluster_id, [on_demand_baseline_tag_key])
+
+    def _interruptions(self, fleet: FleetCapacity) -> List[Dict]:
+        return [x for x in self._emr.iter_instances(self.cluster_id, instance_fleet_type=fleet.fleet_type, instance_states=["TERMINATED"])
+                if x.get("Market") == "SPOT"]
+
+    def _modify(self, fleet: FleetCapacity, on_demand_units: int):
+        self._emr.modify_instance_fleet(self.cluster_id, fleet.fleet_id, on_demand_units=on_demand_units)
+        fleet.target_on_demand = on_demand_units
+
+    def check(self) -> List[FleetCapacity]:
+        """
+        Look at the fleets once, record interruptions and capacity changes and rebalance.
+
+        Returns:
+            List[FleetCapacity] -- Core and task fleets as seen
+        """
+        fleets = [FleetCapacity.from_response(x) for x in self._emr.iter_instance_fleets(self.cluster_id)
+                  if x["InstanceFleetType"] in watched_fleet_types]
+        if self._baseline is None:
+            tags = {x["Key"]: x["Value"] for x in self._emr.get_cluster_description(self.cluster_id)["Cluster"].get("Tags", [])}
+            self._baseline = _parse_baseline(tags.get(on_demand_baseline_tag_key))
+        first = self._seen_interruptions is None
+        seen = self._seen_interruptions if not first else set()
+        now = self._clock()
+        for fleet in fleets:
+            # Spot instances reclaimed before the watcher started are not news.
+            for instance in self._interruptions(fleet):
+                if instance["Id"] not in seen:
+                    seen.add(instance["Id"])
+                    if not first:
+                        self._event(fleet.fleet_type, "interrupted", instance_id=instance["Id"],
+                                    instance_type=instance.get("InstanceType"))
+            self._rebalance(fleet, now)
+        self._seen_interruptions = seen
+        return fleets
+
+    def _rebalance(self, fleet: FleetCapacity, now: float):
+        shortfall = fleet.spot_shortfall
+        baseline = self._baseline.get(fleet.fleet_id)
+        if shortfall and fleet.fleet_id not in self._degraded_since:
+            self._degraded_since[fleet.fleet_id] = now
+            self._event(fleet.fleet_type, "degraded", target_spot=fleet.target_spot, provisioned_spot=fleet.provisioned_spot)
+        if fleet.state != "RUNNING":
+            # A fleet resizing or provisioning is left alone until it settles.
+            return
+        if shortfall:
+            self._full_since.pop(fleet.fleet_id, None)
+            if self._max_on_demand_units is None:
+                return
+            base = baseline if baseline is not None else fleet.target_on_demand
+            wanted = base + shortfall
+            target = min(wanted, max(base, self._max_on_demand_units))
+            if target > fleet.target_on_demand:
+                if baseline is None:
+                    self._baseline[fleet.fleet_id] = base
+                    self._save_baseline()
+                self._modify(fleet, target)
+                self._event(fleet.fleet_type, "raised", on_demand_units=target, baseline=base, spot_shortfall=shortfall)
+            if wanted > target and fleet.fleet_id not in self._capped:
+                self._capped.add(fleet.fleet_id)
+                self._event(fleet.fleet_type, "capped", wanted_on_demand_units=wanted, cap=self._max_on_demand_units)
+            return
+        self._capped.discard(fleet.fleet_id)
+        if fleet.fleet_id in self._degraded_since:
+            degraded = now - self._degraded_since.pop(fleet.fleet_id)
+            self._event(fleet.fleet_type, "recovered", degraded_seconds=round(degraded, 1))
+        full_since = self._full_since.setdefault(fleet.fleet_id, now)
+        if baseline is not None and now - full_since >= self._restore_seconds:
+            self._modify(fleet, baseline)
+            del self._baseline[fleet.fleet_id]
+            self._save_baseline()
+            self._event(fleet.fleet_type, "restored", on_demand_units=baseline)
+
+    def watch(self, interval: float = 60, duration: Optional[float] = None) -> List[SpotEvent]:
+        """
+        Check the fleets every interval seconds until stop() is called, the duration is over or the cluster is gone.
+
+        Keyword Arguments:
+            interval {float} -- Seconds between checks (default: {60})
+            duration {Optional[float]} -- Seconds to watch, None until stopped (default: {None})
+
+        Returns:
+            List[SpotEvent] -- Events of the watch
+        """
+        deadline = None if duration is None else self._clock() + duration
+        while not self._stop.is_set():
+            if self._emr.get_cluster_state(self.cluster_id) not in ("WAITING", "RUNNING"):
+                logger.info("Cluster {} is no longer running, stopping the spot watcher".format(self.cluster_id))
+                break
+            try:
+                self.check()
+            except Exception as e:
+                logger.error("Checking the fleets of cluster {} failed: {}".format(self.cluster_id, e))
+            if deadline is not None and self._clock() >= deadline:
+                break
+            self._stop.wait(interval)
+        return self.events
+
+    def stop(self):
+        self._stop.set()
+
+
+def degraded_seconds(events: List[SpotEvent]) -> Dict[str, float]:
+    """
+    Seconds each fleet spent short of spot capacity, from degraded to recovered events.
+
+    Arguments:
+        events {List[SpotEvent]} -- Events, e.g. read back from the event log
+
+    Returns:
+        Dict[str, float] -- Seconds per cluster and fleet type, "<cluster id>/<fleet type>"
+    """
+    totals: Dict[str, float] = {}
+    for event in events:
+        if event.kind == "recovered":
+            key = "{}/{}".format(event.cluster_id, event.fleet_type)
+            totals[key] = totals.get(key, 0.0) + event.detail["degraded_seconds"]
+    return totals
+
+
+def format_report(events: List[SpotEvent]) -> str:
+    """
+    Plain text table of spot events.
+
+    Arguments:
+        events {List[SpotEvent]} -- Events to list
+
+    Returns:
+        str -- One line per event
+    """
+    if not events:
+        return "No spot capacity events"
+    lines = ["{:<20} {:<16} {:<5} {:<12} {}".format("TIME", "CLUSTER", "FLEET", "EVENT", "DETAIL")]
+    for event in events:
+        detail = ", ".join("{}={}".format(k, v) for k, v in sorted(event.detail.items()))
+        lines.append("{:<20} {:<16} {:<5} {:<12} {}".format(event.to_dict()["time"], event.cluster_id, event.fleet_type, event.kind, detail))
+    return "\n".join(lines)
@@ -0,0 +1,308 @@
+import time
+import logging
+import threading
+from typing import Optional, List, Dict, Iterable, Any
+from aws_beamline_devtools.emr_client import EMR, max_step_ids_per_call
+from aws_beamline_devtools.bulk import TokenBucket, call_with_retry
+
+logger = logging.getLogger(__name__)
+
+default_step_jar = "command-runner.jar"
+active_step_states = ["PENDING", "CANCEL_PENDING", "RUNNING"]
+terminal_step_states = {"COMPLETED", "CANCELLED", "FAILED", "INTERRUPTED"}
+# Steps in these states never complete, so the steps depending on them are skipped.
+unsuccessful_step_states = {"CANCELLED", "FAILED", "INTERRUPTED", "SKIPPED"}
+
+
+class StepSpec:
+    """
+    A step to run and the steps that must complete before it is submitted.
+    """
+    __slots__ = ("name", "args", "depends_on", "action_on_failure", "jar")
+
+    def __init__(self, name: str, args: List[str], depends_on: Iterable[str] = (),
+                 action_on_failure: str = "CONTINUE", jar: str = default_step_jar):
+        """
+        Arguments:
+            name {str} -- Step name, unique within a run
+            args {List[str]} -- Jar arguments, e.g. ["spark-submit", "--deploy-mode", "cluster", "s3://bucket/job.py"]
+
+        Keyword Arguments:
+            depends_on {Iterable[str]} -- Names of the steps that must complete first (default: {()})
+            action_on_failure {str} -- CONTINUE, CANCEL_AND_WAIT or TERMINATE_CLUSTER (default: {"CONTINUE"})
+            jar {str} -- Jar to run (default: {"command-runner.jar"})
+        """
+        self.name = name
+        self.args = list(args)
+        self.depends_on = tuple(depends_on)
+        self.action_on_failure = action_on_failure
+        self.jar = jar
+
+    def step_config(self) -> Dict[str, Any]:
+        """
+        Step configuration accepted by add_job_flow_steps and EMR.create_cluster.
+
+        Returns:
+            Dictionary -- Name, ActionOnFailure and HadoopJarStep
+        """
+        return {
+            "Name": self.name,
+            "ActionOnFailure": self.action_on_failure,
+            "HadoopJarStep": {
+                "Jar": self.jar,
+                "Args": list(self.args)
+            }
+        }
+
+
+class StepRun:
+    """
+    Outcome of one step of a scheduler run.
+    """
+    __slots__ = ("name", "step_id", "state", "depends_on", "submitted_at", "ended_at", "reason")
+
+    def __init__(self, name: str, depends_on: Iterable[str] = ()):
+        self.name = name
+        self.step_id: Optional[str] = None
+        # WAITING until submitted, then the EMR step state, or SKIPPED when a dependency did not complete
+        self.state = "WAITING"
+        self.depends_on = tuple(depends_on)
+        self.submitted_at: Optional[float] = None
+        self.ended_at: Optional[float] = None
+        self.reason: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {k: getattr(self, k) for k in self.__slots__}
+
+
+def order_steps(steps: List[StepSpec]) -> List[StepSpec]:
+    """
+    Check that step names are unique and dependencies form a DAG of known steps.
+
+    Arguments:
+        steps {List[StepSpec]} -- Steps of a run
+
+    Returns:
+        List[StepSpec] -- Steps in a dependency respecting order, otherwise in the given order
+    """
+    by_name: Dict[str, StepSpec] = {}
+    for step in steps:
+        if step.name in by_name:
+            raise ValueError("Step {} is defined more than once".format(step.name))
+        by_name[step.name] = step
+    for step in steps:
+        unknown = [x for x in step.depends_on if x not in by_name]
+        if unknown:
+            raise ValueError("Step {} depends on unknown step(s) {}".format(step.name, ", ".join(unknown)))
+    ordered: List[StepSpec] = []
+    placed: set = set()
+    remaining = list(steps)
+    while remaining:
+        ready = [x for x in remaining if all(d in placed for d in x.depends_on)]
+        if not ready:
+            raise ValueError("Steps {} have cyclic dependencies".format(", ".join(x.name for x in remaining)))
+        ordered += ready
+        placed.update(x.name for x in ready)
+        remaining = [x for x in remaining if x.name not in placed]
+    return ordered
+
+
+def load_steps(path: str) -> List[StepSpec]:
+    """
+    Read a step file:
+
+        steps:
+        - name: extract
+          args: [spark-submit, --deploy-mode, cluster, s3://bucket/extract.py]
+        - name: report
+          args: [spark-submit, --deploy-mode, cluster, s3://bucket/report.py]
+          depends_on: [extract]
+          action_on_failure: CONTINUE
+
+    Arguments:
+        path {str} -- YAML step file path
+
+    Returns:
+        List[StepSpec] -- Steps, validated by order_steps
+    """
+    import yaml
+    with open(path) as f:
+        document = yaml.safe_load(f) or {}
+    steps = []
+    for entry in document.get("steps") or []:
+        if "name" not in entry or not entry.get("args"):
+            raise ValueError("Step entry {} needs a name and args".format(entry))
+        steps.append(StepSpec(entry["name"], entry["args"], depends_on=entry.get("depends_on") or (),
+                              action_on_failure=entry.get("action_on_failure", "CONTINUE"),
+                              jar=entry.get("jar", default_step_jar)))
+    order_steps(steps)
+    return steps
+
+
+class StepScheduler:
+    """
+    Runs a DAG of steps on a cluster. Steps are submitted as soon as their dependencies complete,
+    in batched add_job_flow_steps calls sized to the free StepConcurrencyLevel slots, so the cluster
+    never idles while steps are ready and EMR never holds a long queue that cancellation would have
+    to drain. Status is tracked with list_steps, polled more slowly while nothing changes.
+    """
+    def __init__(self, emr: EMR, cluster_id: str, concurrency: Optional[int] = None,
+                 poll_interval: float = 5.0, max_poll_interval: float = 60.0, rate: float = 2.0,
+                 cancellation_option: str = "SEND_INTERRUPT"):
+        """
+        Arguments:
+            emr {EMR} -- EMR client
+            cluster_id {str} -- JobFlowId of a running cluster
+
+        Keyword Arguments:
+            concurrency {Optional[int]} -- Steps run at once, the cluster's StepConcurrencyLevel when None (default: {None})
+            poll_interval {float} -- Seconds between list_steps polls after a change (default: {5.0})
+            max_poll_interval {float} -- Longest poll interval while nothing changes (default: {60.0})
+            rate {float} -- EMR API calls per second, lowered automatically when throttled (default: {2.0})
+            cancellation_option {str} -- SEND_INTERRUPT or TERMINATE_PROCESS for cancelled steps (default: {"SEND_INTERRUPT"})
+        """
+        self._emr = emr
+        self._cluster_id = cluster_id
+        self._concurrency = concurrency
+        self._poll_interval = poll_interval
+        self._max_poll_interval = max_poll_interval
+        self._bucket = TokenBucket(rate, max(1.0, rate))
+        self._cancellation_option = cancellation_option
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        """
+        Stop submitting steps and cancel the submitted ones that did not finish. Safe to call from
+        another thread or a signal handler; run returns once the cancelled steps have stopped.
+        """
+        self._cancelled.set()
+
+    def _call(self, function):
+        return call_with_retry(function, self._bucket)[0]
+
+    def _step_concurrency(self) -> int:
+        if self._concurrency is not None:
+            return self._concurrency
+        cluster = self._call(lambda: self._emr.get_cluster_description(self._cluster_id))["Cluster"]
+        return cluster.get("StepConcurrencyLevel", 1)
+
+    @staticmethod
+    def _record(run: StepRun, summary: Dict) -> bool:
+        status = summary["Status"]
+        if status["State"] == run.state:
+            return False
+        run.state = status["State"]
+        if run.state in terminal_step_states:
+            ended = status.get("Timeline", {}).get("EndDateTime")
+            run.ended_at = ended.timestamp() if hasattr(ended, "timestamp") else time.time()
+            run.reason = (status.get("FailureDetails") or {}).get("Reason") or (status.get("StateChangeReason") or {}).get("Message")
+            logger.log(logging.INFO if run.state == "COMPLETED" else logging.WARNING,
+                       "Step {} ({}) {}{}".format(run.name, run.step_id, run.state, ": " + run.reason if run.reason else ""))
+        return True
+
+    def _poll(self, runs: Dict[str, StepRun], in_flight: Dict[str, str]) -> tuple:
+        # Active steps of the cluster are few, including those submitted by others; finished ones
+        # are looked up by id once.
+        active = {x["Id"]: x for x in self._call(
+            lambda: list(self._emr.iter_steps(self._cluster_id, step_states=active_step_states)))}
+        changed = False
+        for step_id in list(in_flight):
+            if step_id in active:
+                changed |= self._record(runs[in_flight[step_id]], active[step_id])
+        left = [x for x in in_flight if x not in active]
+        for start in range(0, len(left), max_step_ids_per_call):
+            chunk = left[start:start + max_step_ids_per_call]
+            for summary in self._call(lambda: list(self._emr.iter_steps(self._cluster_id, step_ids=chunk))):
+                if summary["Id"] in in_flight:
+                    changed |= self._record(runs[in_flight[summary["Id"]]], summary)
+        for step_id in list(in_flight):
+            if runs[in_flight[step_id]].state in terminal_step_states:
+                del in_flight[step_id]
+        return len(active), changed
+
+    def _cancel_in_flight(self, in_flight: Dict[str, str]):
+        if in_flight:
+            logger.warning("Cancelling {} step(s) on cluster {}".format(len(in_flight), self._cluster_id))
+            self._call(lambda: self._emr.cancel_steps(self._cluster_id, list(in_flight), self._cancellation_option))
+
+    def run(self, steps: List[StepSpec], timeout: Optional[float] = None) -> List[StepRun]:
+        """
+        Submit the steps as their dependencies complete and wait until every step has finished or
+        been skipped. Steps depending on one that did not complete are skipped.
+
+        Arguments:
+            steps {List[StepSpec]} -- Steps to run
+
+        Keyword Arguments:
+            timeout {Optional[float]} -- Seconds after which the run is cancelled (default: {None})
+
+        Returns:
+            List[StepRun] -- Outcome per step, in the given order
+        """
+        specs = {x.name: x for x in order_steps(steps)}
+        runs = {x.name: StepRun(x.name, x.depends_on) for x in steps}
+        concurrency = self._step_concurrency()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        in_flight: Dict[str, str] = {}
+        delay = self._poll_interval
+        cancelling = False
+        logger.info("Running {} step(s) on cluster {}, {} at a time".format(len(steps), self._cluster_id, concurrency))
+        try:
+            while True:
+                active, changed = self._poll(runs, in_flight)
+                if deadline is not None and time.monotonic() >= deadline and not self._cancelled.is_set():
+                    logger.warning("Step run on cluster {} timed out after {:.0f} seconds".format(self._cluster_id, timeout))
+                    self.cancel()
+                if self._cancelled.is_set() and not cancelling:
+                    cancelling = True
+                    self._cancel_in_flight(in_flight)
+                for name in specs:
+                    run = runs[name]
+                    if run.state != "WAITING":
+                        continue
+                    if cancelling:
+                        run.state, run.reason = "CANCELLED", "Run cancelled before submission"
+                    elif any(runs[x].state in unsuccessful_step_states for x in run.depends_on):
+                        run.state, run.reason = "SKIPPED", "A dependency did not complete"
+                        logger.warning("Step {} skipped, a dependency did not complete".format(name))
+                ready = [runs[x] for x in specs if runs[x].state == "WAITING"
+                         and all(runs[d].state == "COMPLETED" for d in runs[x].depends_on)]
+                # Slots taken by steps submitted by others count as well.
+                ready = ready[:max(0, concurrency - active)]
+                if ready:
+                    step_ids = self._call(lambda: self._emr.add_steps(self._cluster_id, [specs[x.name].step_config() for x in ready]))
+                    for run, step_id in zip(ready, step_ids):
+                        run.step_id, run.state, run.submitted_at = step_id, "PENDING", time.time()
+                        in_flight[step_id] = run.name
+                    changed = True
+                if not in_flight and all(x.state != "WAITING" for x in runs.values()):
+                    break
+                delay = self._poll_interval if changed else min(self._max_poll_interval, delay * 2)
+                if cancelling:
+                    time.sleep(delay)
+                else:
+                    # Woken up early by cancel.
+                    self._cancelled.wait(delay)
+        except KeyboardInterrupt:
+            self._cancel_in_flight(in_flight)
+            raise
+        return [runs[x.name] for x in steps]
+
+
+def format_report(runs: List[StepRun]) -> str:
+    """
+    Plain text status table of a step run.
+
+    Arguments:
+        runs {List[StepRun]} -- Step run outcome
+
+    Returns:
+        str -- One line per step and a summary line
+    """
+    lines = ["{:<32} {:<16} {:<12} {:>9}  {}".format("STEP", "STEP_ID", "STATE", "SECONDS", "REASON")]
+    for x in runs:
+        seconds = x.ended_at - x.submitted_at if x.ended_at is not None and x.submitted_at is not None else 0.0
+        lines.append("{:<32} {:<16} {:<12} {:>9.1f}  {}".format(x.name, x.step_id or "-", x.state, seconds, x.reason or ""))
+    completed = len([x for x in runs if x.state == "COMPLETED"])
+    lines.append("{} step(s), {} completed, {} not completed".format(len(runs), completed, len(runs) - completed))
+    return "\n".join(lines)
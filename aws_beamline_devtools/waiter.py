@@ -0,0 +1,236 @@
+import time
+import random
+import logging
+from typing import Optional, Dict, Callable, Iterable
+
+logger = logging.getLogger(__name__)
+
+# Per state polling profile: (expected seconds spent in the state, shortest poll, longest poll).
+# Polls stay long while the state is far from its expected end and shrink to the shortest
+# interval once the expected transition is near.
+phase_profiles: Dict[str, tuple] = {
+    "STARTING": (360, 5, 60),
+    "BOOTSTRAPPING": (150, 5, 30),
+    "RUNNING": (30, 5, 15),
+    "TERMINATING": (60, 5, 15),
+}
+default_phase_profile = (60, 5, 30)
+failure_states = ["TERMINATING", "TERMINATED", "TERMINATED_WITH_ERRORS"]
+
+
+class ClusterWaitError(Exception):
+    """
+    Raised when a cluster does not reach one of the target states.
+    """
+    def __init__(self, message: str, cluster_id: str, state: str, result: "WaitResult"):
+        super().__init__(message)
+        self.cluster_id = cluster_id
+        self.state = state
+        self.result = result
+
+
+class ClusterFailedError(ClusterWaitError):
+    """
+    Raised when the cluster enters a failure state while waiting.
+    """
+
+
+class ClusterWaitTimeout(ClusterWaitError):
+    """
+    Raised when the deadline passes before the cluster is ready.
+    """
+
+
+class WaitResult:
+    """
+    Outcome of a cluster wait
+
+    Arguments:
+        cluster_id {str} -- JobFlowId
+        state {str} -- Last observed state
+        state_durations {Dict[str, float]} -- Seconds spent in each observed state
+        polls {int} -- Number of DescribeCluster calls made
+        elapsed {float} -- Total seconds spent waiting
+        description {Dict} -- Last describe_cluster response
+    """
+    __slots__ = ("cluster_id", "state", "state_durations", "polls", "elapsed", "description")
+
+    def __init__(self, cluster_id: str, state: str, state_durations: Dict[str, float], polls: int,
+                 elapsed: float, description: Optional[Dict] = None):
+        self.cluster_id = cluster_id
+        self.state = state
+        self.state_durations = state_durations
+        self.polls = polls
+        self.elapsed = elapsed
+        self.description = description
+
+    def __repr__(self):
+        return "WaitResult(cluster_id={}, state={}, polls={}, elapsed={:.1f}, state_durations={})".format(
+            self.cluster_id, self.state, self.polls, self.elapsed, self.state_durations)
+
+
+def next_poll_delay(state: str, elapsed_in_state: float, jitter: float = 0.2,
+                    profiles: Optional[Dict[str, tuple]] = None) -> float:
+    """
+    Compute the delay before the next poll for a cluster that has been in a state for some time.
+
+    Arguments:
+        state {str} -- Current cluster state
+        elapsed_in_state {float} -- Seconds the cluster has been observed in this state
+
+    Keyword Arguments:
+        jitter {float} -- Fraction of the delay randomized to spread concurrent waiters (default: {0.2})
+        profiles {Optional[Dict[str, tuple]]} -- Overrides for phase_profiles (default: {None})
+
+    Returns:
+        float -- Seconds to sleep
+    """
+    expected, shortest, longest = (profiles or phase_profiles).get(state, default_phase_profile)
+    remaining = expected - elapsed_in_state
+    if remaining <= shortest:
+        # Transition is due: poll at the short interval, backing off again the longer it is overdue.
+        delay = min(longest, shortest - min(remaining, 0) / 4.0)
+    else:
+        # Sleep half of the remaining expected time, so polls converge on the transition.
+        delay = min(longest, max(shortest, remaining / 2.0))
+    if jitter:
+        delay = delay * random.uniform(1 - jitter, 1 + jitter)
+    return max(0.0, delay)
+
+
+class ClusterWaiter:
+    """
+    Polls an EMR cluster with a phase aware backoff until it reaches a target state.
+    """
+    def __init__(self,
+                 describe: Optional[Callable[[str], Dict]] = None,
+                 target_states: Iterable[str] = ("WAITING",),
+                 failure_states: Iterable[str] = failure_states,
+                 timeout: Optional[float] = 3600,
+                 callbacks: Optional[Dict[str, Callable[[str, Dict], None]]] = None,
+                 jitter: float = 0.2,
+                 profiles: Optional[Dict[str, tuple]] = None,
+                 sleep: Callable[[float], None] = time.sleep,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        Keyword Arguments:
+            describe {Optional[Callable[[str], Dict]]} -- Function returning the describe_cluster response for a cluster id, required by wait (default: {None})
+            target_states {Iterable[str]} -- States that end the wait successfully (default: {("WAITING",)})
+            failure_states {Iterable[str]} -- States that end the wait with ClusterFailedError (default: {failure_states})
+            timeout {Optional[float]} -- Deadline in seconds, None waits forever (default: {3600})
+            callbacks {Optional[Dict[str, Callable]]} -- Called with (state, response) when the cluster enters a state. Key "*" matches every state. (default: {None})
+            jitter {float} -- Jitter fraction applied to each delay (default: {0.2})
+            profiles {Optional[Dict[str, tuple]]} -- Overrides for phase_profiles (default: {None})
+            sleep {Callable[[float], None]} -- Sleeps between polls (default: {time.sleep})
+            clock {Callable[[], float]} -- Monotonic time source of the deadline and state durations (default: {time.monotonic})
+        """
+        self._describe = describe
+        self._target_states = set(target_states)
+        self._failure_states = set(failure_states) - self._target_states
+        self._timeout = timeout
+        self._callbacks = callbacks or {}
+        self._jitter = jitter
+        self._profiles = profiles
+        self._sleep = sleep
+        self._clock = clock
+
+    def _notify(self, state: str, response: Dict):
+        for key in (state, "*"):
+            callback = self._callbacks.get(key)
+            if callback is not None:
+                callback(state, response)
+
+    def progress(self, cluster_id: str) -> "WaitProgress":
+        """
+        Start tracking a wait driven by the caller, e.g. from an event loop.
+
+        Arguments:
+            cluster_id {str} -- JobFlowId
+
+        Returns:
+            WaitProgress -- Feed it describe_cluster responses until it returns None
+        """
+        return WaitProgress(self, cluster_id)
+
+    def wait(self, cluster_id: str) -> WaitResult:
+        """
+        Block until the cluster reaches a target state.
+
+        Arguments:
+            cluster_id {str} -- JobFlowId
+
+        Raises:
+            ClusterFailedError -- Cluster entered a failure state
+            ClusterWaitTimeout -- Deadline passed
+
+        Returns:
+            WaitResult -- Final state, time spent per state and number of polls
+        """
+        progress = self.progress(cluster_id)
+        while True:
+            delay = progress.observe(self._describe(cluster_id))
+            if delay is None:
+                return progress.result
+            self._sleep(delay)
+
+
+class WaitProgress:
+    """
+    State of one cluster wait: time spent per state, polls made and the deadline.
+    """
+    def __init__(self, waiter: ClusterWaiter, cluster_id: str):
+        self._waiter = waiter
+        self.cluster_id = cluster_id
+        self.started = waiter._clock()
+        self.deadline = None if waiter._timeout is None else self.started + waiter._timeout
+        self.durations: Dict[str, float] = {}
+        self.state: Optional[str] = None
+        self.state_entered = self.started
+        self.polls = 0
+        self.result: Optional[WaitResult] = None
+
+    def observe(self, response: Dict) -> Optional[float]:
+        """
+        Record a describe_cluster response.
+
+        Arguments:
+            response {Dict} -- describe_cluster response
+
+        Raises:
+            ClusterFailedError -- Cluster entered a failure state
+            ClusterWaitTimeout -- Deadline passed
+
+        Returns:
+            Optional[float] -- Seconds to sleep before the next poll, None once a target state is reached (see result)
+        """
+        waiter = self._waiter
+        self.polls += 1
+        now = waiter._clock()
+        observed = response["Cluster"]["Status"]["State"]
+        if self.state is not None:
+            self.durations[self.state] = self.durations.get(self.state, 0.0) + (now - self.state_entered)
+        if observed != self.state:
+            self.state = observed
+            self.durations.setdefault(observed, 0.0)
+            logger.info("Cluster {} entered state {}".format(self.cluster_id, observed))
+            waiter._notify(observed, response)
+        self.state_entered = now
+        state = self.state
+
+        if state in waiter._target_states or state in waiter._failure_states:
+            self.result = WaitResult(self.cluster_id, state, self.durations, self.polls, now - self.started, response)
+            if state in waiter._target_states:
+                return None
+            reason = response["Cluster"]["Status"].get("StateChangeReason", {})
+            raise ClusterFailedError("Cluster {} entered state {}: {}".format(
+                self.cluster_id, state, reason.get("Message", reason.get("Code", "unknown reason"))),
+                self.cluster_id, state, self.result)
+
+        delay = next_poll_delay(state, self.durations[state], waiter._jitter, waiter._profiles)
+        if self.deadline is not None:
+            if now >= self.deadline:
+                raise ClusterWaitTimeout("Cluster {} still in state {} after {} seconds".format(
+                    self.cluster_id, state, waiter._timeout), self.cluster_id, state,
+                    WaitResult(self.cluster_id, state, self.durations, self.polls, now - self.started, response))
+            delay = min(delay, self.deadline - now)
+        return delay
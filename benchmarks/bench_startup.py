@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+"""
+Cold start benchmark for the attach-emr CLI.
+
+Runs each scenario in fresh interpreters and compares the median wall clock time with the budget
+pinned below. Exits with status 1 when a scenario is over budget or its interpreter fails.
+
+    python benchmarks/bench_startup.py [--runs 10] [--output startup.json]
+"""
+import os
+import sys
+import json
+import statistics
+import subprocess
+import time
+from optparse import OptionParser
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Median wall clock budget in milliseconds, interpreter start up included.
+budgets_ms = {
+    "help": 150,
+    "attach_imports": 400,
+    "attach_client": 900,
+}
+
+scenarios = {
+    # attach-emr -h must not import boto3, yaml or the package modules.
+    "help": [os.path.join(repo_root, "attach_emr.py"), "-h"],
+    # Everything the attach path imports before its first API call.
+    "attach_imports": ["-c", "import attach_emr; "
+                             "import aws_beamline_devtools.emr_client, aws_beamline_devtools.compute_manager, "
+                             "aws_beamline_devtools.cluster_pool, aws_beamline_devtools.create_sparkmagic_config, "
+                             "aws_beamline_devtools.emr_config, yaml"],
+    # Attach path imports plus the lazily created boto3 EMR client.
+    "attach_client": ["-c", "import os; os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1'); "
+                            "from aws_beamline_devtools.emr_client import shared_client; shared_client()"],
+}
+forbidden_on_help = ["boto3", "botocore", "yaml", "aws_beamline_devtools"]
+# Statuses that fail the benchmark.
+failing_statuses = ("over_budget", "failed")
+
+
+def _run(argv, importtime=False):
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + argv
+    started = time.perf_counter()
+    completed = subprocess.run(command, cwd=repo_root, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                               env=dict(os.environ, PYTHONPATH=repo_root))
+    return (time.perf_counter() - started) * 1000, completed.returncode, completed.stderr.decode("utf-8", "replace")
+
+
+def _imported_modules(importtime_output):
+    modules = []
+    for line in importtime_output.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            name = line.split("|")[-1].strip()
+            if name != "imported package":
+                modules.append(name)
+    return modules
+
+
+def run_benchmark(runs=10):
+    """
+    Measure every scenario.
+
+    Keyword Arguments:
+        runs {int} -- Fresh interpreters per scenario (default: {10})
+
+    Returns:
+        Dictionary -- Results per scenario: median, min and max ms, budget and status (ok, over_budget or failed)
+    """
+    results = {}
+    for name, argv in scenarios.items():
+        _, returncode, stderr = _run(argv, importtime=True)
+        if returncode != 0:
+            # A path that can't even start, e.g. a missing dependency, breaks the budget too.
+            results[name] = {"status": "failed", "reason": stderr.strip().splitlines()[-1] if stderr.strip() else "exit {}".format(returncode)}
+            continue
+        timings = [_run(argv)[0] for _ in range(runs)]
+        median = statistics.median(timings)
+        result = {
+            "median_ms": round(median, 1),
+            "min_ms": round(min(timings), 1),
+            "max_ms": round(max(timings), 1),
+            "budget_ms": budgets_ms[name],
+            "modules_imported": len(_imported_modules(stderr)),
+            "status": "ok" if median <= budgets_ms[name] else "over_budget",
+        }
+        if name == "help":
+            leaked = sorted({m for m in _imported_modules(stderr) if m.split(".")[0] in forbidden_on_help})
+            if leaked:
+                result["status"] = "over_budget"
+                result["unexpected_imports"] = leaked
+        results[name] = result
+    return results
+
+
+def main():
+    parser = OptionParser(usage="usage: %prog [options]")
+    parser.add_option("-r", "--runs", dest="runs", type="int", default=10,
+                      help="Fresh interpreters per scenario, Default: 10")
+    parser.add_option("-o", "--output", dest="output", default=None,
+                      help="Write the JSON results to this file instead of stdout")
+    (options, _) = parser.parse_args()
+
+    results = {"python": sys.version.split()[0], "scenarios": run_benchmark(options.runs)}
+    report = json.dumps(results, indent=2, sort_keys=True)
+    if options.output:
+        with open(options.output, "w") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+    if any(x["status"] in failing_statuses for x in results["scenarios"].values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
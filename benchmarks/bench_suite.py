@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+"""
+Offline benchmark suite: runs without AWS credentials or network access against the simulated
+EMR backend in simulated_emr.py and prints machine readable JSON.
+
+Scenarios:
+    cold_start      -- attach-emr start up in fresh interpreters, see bench_startup.py
+    config_compile  -- emr.yaml compilations per second for a generated config with many parameter sets and sizes
+    build_args      -- run_job_flow argument sets built per second for every size of that config
+    attach          -- attach-emr -s in process against the simulator: EMR API calls per attach, simulated
+                       create to sparkmagic config seconds and the real time spent outside waits
+
+    python benchmarks/bench_suite.py [--runs 5] [--paramSets 20] [--sizes 10] [--throttleRate 0.1] [--output suite.json]
+"""
+import os
+import sys
+import json
+import copy
+import shutil
+import statistics
+import tempfile
+import functools
+import time
+from unittest import mock
+from optparse import OptionParser
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_root)
+
+import bench_startup
+from simulated_emr import SimulatedEMR, VirtualClock
+
+
+def _summary(timings_ms):
+    return {"median_ms": round(statistics.median(timings_ms), 3), "min_ms": round(min(timings_ms), 3),
+            "max_ms": round(max(timings_ms), 3)}
+
+
+def write_large_config(path, param_sets=20, sizes=10):
+    """
+    Write an emr.yaml with param_sets parameter sets of sizes sizes each, derived from the repo's emr.yaml.
+
+    Arguments:
+        path {str} -- Where the config is written
+
+    Keyword Arguments:
+        param_sets {int} -- Parameter sets (default: {20})
+        sizes {int} -- Sizes per parameter set (default: {10})
+
+    Returns:
+        list -- (param_set, size) pairs of the config
+    """
+    import yaml
+    with open(os.path.join(repo_root, "emr.yaml")) as f:
+        config = yaml.safe_load(f)
+    spec = config["spec"]
+    base_sizes = list(spec["clusterSize"]["default"].values())
+    base_params = spec["clusterParamSet"]["default"]
+    spec["clusterSize"], spec["clusterParamSet"] = {}, {}
+    pairs = []
+    for i in range(param_sets):
+        name = "set{:03d}".format(i)
+        spec["clusterParamSet"][name] = dict(copy.deepcopy(base_params), subnet_id="subnet-{:08x}".format(i))
+        spec["clusterSize"][name] = {}
+        for j in range(sizes):
+            size = "size{:03d}".format(j)
+            spec["clusterSize"][name][size] = copy.deepcopy(base_sizes[j % len(base_sizes)])
+            pairs.append((name, size))
+    with open(path, "w") as f:
+        yaml.safe_dump(config, f, default_flow_style=False)
+    return pairs
+
+
+def bench_config_compile(config_path, runs):
+    from aws_beamline_devtools import emr_config
+    path = os.path.abspath(config_path)
+    cold = []
+    for _ in range(runs):
+        emr_config._compiled.pop(path, None)
+        started = time.perf_counter()
+        compiled = emr_config.compile_config(config_path)
+        cold.append((time.perf_counter() - started) * 1000)
+    lookups = 1000
+    started = time.perf_counter()
+    for _ in range(lookups):
+        emr_config.compile_config(config_path)
+    cached_ms = (time.perf_counter() - started) * 1000 / lookups
+    sizes = sum(len(x) for x in compiled.cluster_sizes.values())
+    result = _summary(cold)
+    result.update({"param_sets": len(compiled.param_sets), "sizes": sizes,
+                   "compiles_per_second": round(1000 / statistics.median(cold), 2),
+                   "sizes_per_second": round(sizes * 1000 / statistics.median(cold), 1),
+                   "cached_lookup_us": round(cached_ms * 1000, 2)})
+    return result
+
+
+def bench_build_args(config_path, pairs, runs):
+    from aws_beamline_devtools.emr_client import EMR
+    from aws_beamline_devtools.compute_manager import ComputeManager
+    emr = EMR(client=SimulatedEMR())
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        for param_set, size in pairs:
+            EMR._build_cluster_args(**ComputeManager(size, param_set, config_path, emr=emr).cluster_parameters())
+        timings.append((time.perf_counter() - started) * 1000)
+    result = _summary(timings)
+    result.update({"arg_sets": len(pairs), "arg_sets_per_second": round(len(pairs) * 1000 / statistics.median(timings), 1)})
+    return result
+
+
+def _attach_once(config_path, workdir, throttle_rate, existing_clusters, seed):
+    import attach_emr
+    from aws_beamline_devtools import emr_client
+    from aws_beamline_devtools.waiter import ClusterWaiter
+    from aws_beamline_devtools.instrumentation import is_throttle_error
+    clock = VirtualClock()
+    client = SimulatedEMR(clock=clock, throttle_rate=throttle_rate, existing_clusters=existing_clusters, seed=seed)
+    sparkmagic_config = os.path.join(workdir, "config-{}.json".format(seed))
+    argv = ["attach_emr.py", "-s", "M", "-c", config_path, "--sparkmagicConfig", sparkmagic_config,
+            "--historyFile", os.path.join(workdir, "history.db")]
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        clock.sleep(seconds)
+
+    simulated_start = clock.monotonic()
+    started = time.perf_counter()
+    status = "ok"
+    with mock.patch.object(emr_client, "_shared_client", client), \
+            mock.patch.object(emr_client, "ClusterWaiter", functools.partial(ClusterWaiter, sleep=sleep, clock=clock.monotonic)), \
+            mock.patch.object(sys, "argv", argv):
+        try:
+            attach_emr.main()
+        except SystemExit as e:
+            status = "exit {}".format(e.code)
+        except Exception as e:
+            status = "throttled" if is_throttle_error(e) else "error: {}".format(e)
+    real_ms = (time.perf_counter() - started) * 1000
+    if status == "ok" and not os.path.isfile(sparkmagic_config):
+        status = "no sparkmagic config"
+    return {
+        "status": status,
+        "api_calls": sum(client.calls.values()),
+        "calls_per_operation": dict(client.calls),
+        "throttled_attempts": sum(client.throttles.values()),
+        "simulated_seconds": clock.monotonic() - simulated_start,
+        "real_overhead_ms": real_ms,
+        "polls": len(sleeps),
+    }
+
+
+def bench_attach(config_path, runs, throttle_rate=0.0, existing_clusters=0):
+    import logging
+    # attach_emr.main configures INFO logging, keep the JSON output readable.
+    logging.disable(logging.CRITICAL)
+    workdir = tempfile.mkdtemp(prefix="beamline-bench-")
+    try:
+        attaches = [_attach_once(config_path, workdir, throttle_rate, existing_clusters, seed) for seed in range(runs)]
+    finally:
+        logging.disable(logging.NOTSET)
+        shutil.rmtree(workdir, ignore_errors=True)
+    ok = [x for x in attaches if x["status"] == "ok"]
+    result = {"runs": runs, "succeeded": len(ok), "throttle_rate": throttle_rate, "existing_clusters": existing_clusters,
+              "failures": sorted({x["status"] for x in attaches if x["status"] != "ok"})}
+    if ok:
+        operations = sorted({k for x in ok for k in x["calls_per_operation"]})
+        result.update({
+            "api_calls_per_attach": statistics.median(x["api_calls"] for x in ok),
+            "calls_per_operation": {k: statistics.median(x["calls_per_operation"].get(k, 0) for x in ok) for k in operations},
+            "throttled_attempts_per_attach": statistics.median(x["throttled_attempts"] for x in ok),
+            "status_polls_per_attach": statistics.median(x["polls"] for x in ok),
+            "create_to_config_simulated_s": round(statistics.median(x["simulated_seconds"] for x in ok), 1),
+            "real_overhead_ms": _summary([x["real_overhead_ms"] for x in ok]),
+        })
+    return result
+
+
+def run_suite(runs=5, param_sets=20, sizes=10, throttle_rate=0.0, existing_clusters=0, cold_start_runs=5):
+    """
+    Run every scenario.
+
+    Keyword Arguments:
+        runs {int} -- Repetitions of the in process scenarios (default: {5})
+        param_sets {int} -- Parameter sets of the generated emr.yaml (default: {20})
+        sizes {int} -- Sizes per parameter set of the generated emr.yaml (default: {10})
+        throttle_rate {float} -- Probability that a simulated API attempt is throttled (default: {0.0})
+        existing_clusters {int} -- Unrelated live clusters listed while looking for a reusable one (default: {0})
+        cold_start_runs {int} -- Fresh interpreters per cold start scenario, 0 to skip them (default: {5})
+
+    Returns:
+        Dictionary -- Results per scenario
+    """
+    results = {}
+    if cold_start_runs > 0:
+        results["cold_start"] = bench_startup.run_benchmark(cold_start_runs)
+    workdir = tempfile.mkdtemp(prefix="beamline-bench-")
+    try:
+        config_path = os.path.join(workdir, "emr.yaml")
+        pairs = write_large_config(config_path, param_sets, sizes)
+        results["config_compile"] = bench_config_compile(config_path, runs)
+        results["build_args"] = bench_build_args(config_path, pairs, runs)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    results["attach"] = bench_attach(os.path.join(repo_root, "emr.yaml"), runs, throttle_rate, existing_clusters)
+    return results
+
+
+def main():
+    parser = OptionParser(usage="usage: %prog [options]")
+    parser.add_option("-r", "--runs", dest="runs", type="int", default=5,
+                      help="Repetitions of the in process scenarios, Default: 5")
+    parser.add_option("--coldStartRuns", dest="cold_start_runs", type="int", default=5,
+                      help="Fresh interpreters per cold start scenario, 0 skips them, Default: 5")
+    parser.add_option("--paramSets", dest="param_sets", type="int", default=20,
+                      help="Parameter sets of the generated emr.yaml, Default: 20")
+    parser.add_option("--sizes", dest="sizes", type="int", default=10,
+                      help="Sizes per parameter set of the generated emr.yaml, Default: 10")
+    parser.add_option("--throttleRate", dest="throttle_rate", type="float", default=0.0,
+                      help="Probability that a simulated EMR API attempt is throttled, Default: 0.0")
+    parser.add_option("--existingClusters", dest="existing_clusters", type="int", default=0,
+                      help="Unrelated live clusters in the simulated account, paginated through by list_clusters, Default: 0")
+    parser.add_option("-o", "--output", dest="output", default=None,
+                      help="Write the JSON results to this file instead of stdout")
+    (options, _) = parser.parse_args()
+
+    results = {"python": sys.version.split()[0],
+               "scenarios": run_suite(options.runs, options.param_sets, options.sizes, options.throttle_rate,
+                                      options.existing_clusters, options.cold_start_runs)}
+    report = json.dumps(results, indent=2, sort_keys=True)
+    if options.output:
+        with open(options.output, "w") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+    # Calls throttled on every attempt are an expected outcome at high --throttleRate, anything else is a regression,
+    # as is a cold start scenario that is over budget or fails to run.
+    cold_start = results["scenarios"].get("cold_start", {})
+    if any(x["status"] in bench_startup.failing_statuses for x in cold_start.values()) or \
+            any(x != "throttled" for x in results["scenarios"]["attach"]["failures"]):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
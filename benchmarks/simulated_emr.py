@@ -0,0 +1,259 @@
+"""
+Simulated EMR backend for the offline benchmarks.
+
+SimulatedEMR stands in for the boto3 EMR client: clusters move through configurable state
+timelines on a virtual clock, list operations are paginated, and calls can be throttled. Throttled
+attempts are retried the way the SDK does and reported in ResponseMetadata.RetryAttempts; a call
+throttled on every attempt raises an error shaped like botocore's ClientError.
+"""
+import random
+import datetime
+import threading
+from collections import Counter
+
+# Seconds spent in each state before WAITING, close to what a fleet cluster takes on EMR.
+default_timeline = (("STARTING", 420.0), ("BOOTSTRAPPING", 150.0), ("RUNNING", 20.0))
+
+
+class ThrottlingError(Exception):
+    def __init__(self, operation):
+        super().__init__("An error occurred (ThrottlingException) when calling the {} operation: Rate exceeded".format(operation))
+        self.response = {"Error": {"Code": "ThrottlingException", "Message": "Rate exceeded"}}
+
+
+class VirtualClock:
+    """
+    Clock that only moves when slept on, so waits of minutes take no real time.
+    """
+    def __init__(self, start=1767225600.0):
+        self.now = start
+        self._lock = threading.Lock()
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        with self._lock:
+            self.now += max(0.0, seconds)
+
+
+class Paginator:
+    def __init__(self, client, operation):
+        self._client = client
+        self._operation = operation
+
+    def paginate(self, **kwargs):
+        while True:
+            page = getattr(self._client, self._operation)(**kwargs)
+            yield page
+            if not page.get("Marker"):
+                return
+            kwargs = dict(kwargs, Marker=page["Marker"])
+
+
+class SimulatedEMR:
+    """
+    In memory EMR client covering the operations the package uses.
+    """
+    def __init__(self, clock=None, timeline=default_timeline, page_size=50, throttle_rate=0.0, max_attempts=3,
+                 existing_clusters=0, seed=0):
+        """
+        Keyword Arguments:
+            clock {VirtualClock} -- Time source of the state timelines (default: {a new VirtualClock})
+            timeline {tuple} -- (state, seconds) pairs a new cluster goes through before WAITING (default: {default_timeline})
+            page_size {int} -- Items per page of list operations (default: {50})
+            throttle_rate {float} -- Probability that an attempt is throttled (default: {0.0})
+            max_attempts {int} -- Attempts before a throttled call fails, as in the SDK's standard retry mode (default: {3})
+            existing_clusters {int} -- Unrelated live clusters in the account, listed by list_clusters (default: {0})
+            seed {int} -- Seed of the throttling decisions (default: {0})
+        """
+        self.clock = clock or VirtualClock()
+        self._timeline = timeline
+        self._page_size = page_size
+        self._throttle_rate = throttle_rate
+        self._max_attempts = max_attempts
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._clusters = {}
+        self._next_id = 0
+        self.calls = Counter()
+        self.throttles = Counter()
+        for i in range(existing_clusters):
+            self._add_cluster({"Name": "existing-{}".format(i), "Tags": [], "Instances": {"InstanceFleets": []}},
+                              created=self.clock.monotonic() - 86400)
+
+    # Bookkeeping
+
+    def _api(self, operation):
+        with self._lock:
+            self.calls[operation] += 1
+            for attempt in range(self._max_attempts):
+                if self._random.random() >= self._throttle_rate:
+                    return {"RequestId": "sim", "HTTPStatusCode": 200, "RetryAttempts": attempt}
+                self.throttles[operation] += 1
+        raise ThrottlingError(operation)
+
+    def _add_cluster(self, args, created=None):
+        with self._lock:
+            self._next_id += 1
+            cluster_id = "j-SIM{:09d}".format(self._next_id)
+            self._clusters[cluster_id] = {"args": args, "created": self.clock.monotonic() if created is None else created,
+                                          "tags": {x["Key"]: x["Value"] for x in args.get("Tags", [])},
+                                          "steps": [], "terminated": None}
+        for step in args.get("Steps", []):
+            self._add_step(cluster_id, step)
+        return cluster_id
+
+    def _add_step(self, cluster_id, step):
+        steps = self._clusters[cluster_id]["steps"]
+        step_id = "s-SIM{:09d}".format(len(steps) + 1 + 1000 * self._next_id)
+        steps.append({"Id": step_id, "Name": step["Name"], "Config": step.get("HadoopJarStep", {}),
+                      "ActionOnFailure": step.get("ActionOnFailure"), "submitted": self.clock.monotonic()})
+        return step_id
+
+    def _datetime(self, seconds):
+        return datetime.datetime.fromtimestamp(seconds, tz=datetime.timezone.utc)
+
+    def _phase_ends(self, cluster):
+        ends, at = {}, cluster["created"]
+        for state, seconds in self._timeline:
+            at += seconds
+            ends[state] = at
+        return ends
+
+    def _state(self, cluster):
+        if cluster["terminated"] is not None:
+            return "TERMINATED"
+        now = self.clock.monotonic()
+        for state, end in self._phase_ends(cluster).items():
+            if now < end:
+                return state
+        return "WAITING"
+
+    def _page(self, items, key, marker):
+        start = int(marker or 0)
+        page = {key: items[start:start + self._page_size]}
+        if start + self._page_size < len(items):
+            page["Marker"] = str(start + self._page_size)
+        return page
+
+    def get_paginator(self, operation):
+        return Paginator(self, operation)
+
+    # Operations
+
+    def run_job_flow(self, **kwargs):
+        metadata = self._api("run_job_flow")
+        return {"JobFlowId": self._add_cluster(kwargs), "ResponseMetadata": metadata}
+
+    def describe_cluster(self, ClusterId):
+        metadata = self._api("describe_cluster")
+        cluster = self._clusters[ClusterId]
+        args = cluster["args"]
+        state = self._state(cluster)
+        timeline = {"CreationDateTime": self._datetime(cluster["created"])}
+        # Ready once bootstrap actions are done, as on EMR.
+        ends = self._phase_ends(cluster)
+        ready = ends.get("BOOTSTRAPPING", ends[self._timeline[-1][0]])
+        if state != "TERMINATED" and self.clock.monotonic() >= ready:
+            timeline["ReadyDateTime"] = self._datetime(ready)
+        subnet = args.get("Instances", {}).get("Ec2SubnetId") or (args.get("Instances", {}).get("Ec2SubnetIds") or [None])[0]
+        return {"Cluster": {
+            "Id": ClusterId,
+            "Name": args.get("Name"),
+            "Status": {"State": state, "Timeline": timeline},
+            "Tags": [{"Key": k, "Value": v} for k, v in cluster["tags"].items()],
+            "InstanceCollectionType": "INSTANCE_FLEET",
+            "StepConcurrencyLevel": args.get("StepConcurrencyLevel", 1),
+            "TerminationProtected": args.get("Instances", {}).get("TerminationProtected", False),
+            "Ec2InstanceAttributes": {"Ec2SubnetId": subnet},
+            "ReleaseLabel": args.get("ReleaseLabel"),
+        }, "ResponseMetadata": metadata}
+
+    def list_clusters(self, ClusterStates=None, Marker=None, CreatedAfter=None, CreatedBefore=None):
+        metadata = self._api("list_clusters")
+        summaries = []
+        for cluster_id, cluster in sorted(self._clusters.items(), reverse=True):
+            state = self._state(cluster)
+            if ClusterStates is None or state in ClusterStates:
+                summaries.append({"Id": cluster_id, "Name": cluster["args"].get("Name"), "Status": {"State": state}})
+        return dict(self._page(summaries, "Clusters", Marker), ResponseMetadata=metadata)
+
+    def list_instances(self, ClusterId, InstanceFleetType=None, InstanceGroupTypes=None, InstanceStates=None, Marker=None):
+        metadata = self._api("list_instances")
+        cluster = self._clusters[ClusterId]
+        instances = []
+        if self._state(cluster) not in ("STARTING", "TERMINATED"):
+            index = int(ClusterId[-6:])
+            for fleet in cluster["args"].get("Instances", {}).get("InstanceFleets", []):
+                if InstanceFleetType is not None and fleet["InstanceFleetType"] != InstanceFleetType:
+                    continue
+                units = fleet.get("TargetOnDemandCapacity", 0) + fleet.get("TargetSpotCapacity", 0)
+                for i in range(units):
+                    instances.append({"Id": "ci-{}-{}".format(fleet["InstanceFleetType"], i), "Status": {"State": "RUNNING"},
+                                      "PrivateIpAddress": "10.{}.{}.{}".format(index // 256 % 256, index % 256, len(instances) + 10)})
+        return dict(self._page(instances, "Instances", Marker), ResponseMetadata=metadata)
+
+    def list_instance_fleets(self, ClusterId, Marker=None):
+        metadata = self._api("list_instance_fleets")
+        cluster = self._clusters[ClusterId]
+        provisioned = self._state(cluster) not in ("STARTING",)
+        fleets = []
+        for fleet in cluster["args"].get("Instances", {}).get("InstanceFleets", []):
+            timeline = {"CreationDateTime": self._datetime(cluster["created"])}
+            if provisioned:
+                timeline["ReadyDateTime"] = self._datetime(self._phase_ends(cluster)["STARTING"])
+            fleets.append({"Id": "if-{}".format(fleet["InstanceFleetType"]), "InstanceFleetType": fleet["InstanceFleetType"],
+                           "Status": {"State": "RUNNING" if provisioned else "PROVISIONING", "Timeline": timeline},
+                           "TargetOnDemandCapacity": fleet.get("TargetOnDemandCapacity", 0),
+                           "TargetSpotCapacity": fleet.get("TargetSpotCapacity", 0),
+                           "ProvisionedOnDemandCapacity": fleet.get("TargetOnDemandCapacity", 0) if provisioned else 0,
+                           "ProvisionedSpotCapacity": fleet.get("TargetSpotCapacity", 0) if provisioned else 0,
+                           "InstanceTypeSpecifications": fleet.get("InstanceTypeConfigs", [])})
+        return dict(self._page(fleets, "InstanceFleets", Marker), ResponseMetadata=metadata)
+
+    def list_steps(self, ClusterId, StepStates=None, StepIds=None, Marker=None):
+        metadata = self._api("list_steps")
+        cluster = self._clusters[ClusterId]
+        # Steps added at launch run during RUNNING, one after another; later ones complete a minute after submission.
+        running_start = self._phase_ends(cluster).get("BOOTSTRAPPING", cluster["created"])
+        now = self.clock.monotonic()
+        summaries = []
+        for step in reversed(cluster["steps"]):
+            start = max(step["submitted"], running_start)
+            end = start + (20.0 if step["submitted"] <= cluster["created"] else 60.0)
+            state = "PENDING" if now < start else "RUNNING" if now < end else "COMPLETED"
+            if (StepStates is not None and state not in StepStates) or (StepIds is not None and step["Id"] not in StepIds):
+                continue
+            timeline = {"CreationDateTime": self._datetime(step["submitted"])}
+            if state != "PENDING":
+                timeline["StartDateTime"] = self._datetime(start)
+            if state == "COMPLETED":
+                timeline["EndDateTime"] = self._datetime(end)
+            summaries.append({"Id": step["Id"], "Name": step["Name"], "Config": step["Config"],
+                              "Status": {"State": state, "Timeline": timeline}})
+        return dict(self._page(summaries, "Steps", Marker), ResponseMetadata=metadata)
+
+    def add_job_flow_steps(self, JobFlowId, Steps):
+        metadata = self._api("add_job_flow_steps")
+        return {"StepIds": [self._add_step(JobFlowId, x) for x in Steps], "ResponseMetadata": metadata}
+
+    def terminate_job_flows(self, JobFlowIds):
+        metadata = self._api("terminate_job_flows")
+        for cluster_id in JobFlowIds:
+            self._clusters[cluster_id]["terminated"] = self.clock.monotonic()
+        return {"ResponseMetadata": metadata}
+
+    def add_tags(self, ResourceId, Tags):
+        metadata = self._api("add_tags")
+        self._clusters[ResourceId]["tags"].update({x["Key"]: x["Value"] for x in Tags})
+        return {"ResponseMetadata": metadata}
+
+    def remove_tags(self, ResourceId, TagKeys):
+        metadata = self._api("remove_tags")
+        for key in TagKeys:
+            self._clusters[ResourceId]["tags"].pop(key, None)
+        return {"ResponseMetadata": metadata}
@@ -20,10 +20,13 @@ setup(
     long_description_content_type="text/markdown",
     license=packagemetadata["__license__"],
     packages=find_packages(include=["aws_beamline_devtools", "aws_beamline_devtools.*"]),
-    python_requires=">=3.6",
+    package_data={"aws_beamline_devtools": ["templates/*.json", "data/*.json"]},
+    python_requires=">=3.8",
     install_requires=[
-        "botocore~=1.13.25",
-        "boto3~=1.10.25",
+        # First releases whose EMR model has ManagedScalingPolicy, AutoTerminationPolicy, gp3 Throughput,
+        # OnDemandSpecification and InstanceTypeConfig Priority.
+        "botocore>=1.34.136",
+        "boto3>=1.34.136",
     ])
 
 # Clean older build: python setup.py clean --all
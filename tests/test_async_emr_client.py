@@ -0,0 +1,106 @@
+"""
+AsyncEMR against the simulated EMR endpoint of the benchmarks, no AWS credentials or network needed.
+
+    python -m pytest tests
+"""
+import os
+import sys
+import time
+import asyncio
+import threading
+import unittest
+from unittest import mock
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(repo_root, "benchmarks"))
+
+from simulated_emr import SimulatedEMR, VirtualClock
+from aws_beamline_devtools.emr_client import EMR
+from aws_beamline_devtools.async_emr_client import AsyncEMR
+from aws_beamline_devtools.compute_manager import ComputeManager
+
+
+class ConcurrencyTrackingEMR(SimulatedEMR):
+    """
+    Simulated endpoint whose describe_cluster takes real time and records the requests in flight.
+    """
+    def __init__(self, latency=0.05, **kwargs):
+        super().__init__(**kwargs)
+        self._latency = latency
+        self._in_flight_lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def describe_cluster(self, ClusterId):
+        with self._in_flight_lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self._latency)
+            return super().describe_cluster(ClusterId)
+        finally:
+            with self._in_flight_lock:
+                self.in_flight -= 1
+
+
+class AsyncEMRTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = VirtualClock()
+        self.stub = SimulatedEMR(clock=self.clock)
+        self.client = AsyncEMR(max_concurrency=4, emr=EMR(client=self.stub))
+        self.parameters = ComputeManager("M", "default", os.path.join(repo_root, "emr.yaml")).cluster_parameters()
+
+    def tearDown(self):
+        self.client.close()
+
+    def test_create_state_terminate(self):
+        async def run():
+            cluster_id = (await self.client.create_cluster(**self.parameters))["JobFlowId"]
+            started = await self.client.get_cluster_state(cluster_id)
+            await self.client.terminate_cluster(cluster_id)
+            return cluster_id, started, await self.client.get_cluster_state(cluster_id)
+
+        cluster_id, started, terminated = asyncio.run(run())
+        self.assertTrue(cluster_id.startswith("j-"))
+        self.assertEqual(started, "STARTING")
+        self.assertEqual(terminated, "TERMINATED")
+        self.assertEqual(self.stub.calls["run_job_flow"], 1)
+        self.assertEqual(self.stub.calls["terminate_job_flows"], 1)
+
+    def test_wait_for_cluster(self):
+        delays = []
+
+        async def virtual_sleep(seconds):
+            delays.append(seconds)
+            self.clock.sleep(seconds)
+
+        async def run():
+            cluster_id = (await self.client.create_cluster(**self.parameters))["JobFlowId"]
+            with mock.patch.object(asyncio, "sleep", virtual_sleep):
+                return await self.client.wait_for_cluster(cluster_id, timeout=None)
+
+        result = asyncio.run(run())
+        self.assertEqual(result.state, "WAITING")
+        self.assertEqual(result.polls, len(delays) + 1)
+        self.assertEqual(result.polls, self.stub.calls["describe_cluster"])
+        self.assertTrue({"STARTING", "BOOTSTRAPPING"} <= set(result.state_durations))
+
+    def test_max_concurrency_bounds_requests_in_flight(self):
+        stub = ConcurrencyTrackingEMR(clock=self.clock)
+        client = AsyncEMR(max_concurrency=3, emr=EMR(client=stub))
+
+        async def run():
+            cluster_id = (await client.create_cluster(**self.parameters))["JobFlowId"]
+            return await asyncio.gather(*[client.get_cluster_state(cluster_id) for _ in range(12)])
+
+        try:
+            states = asyncio.run(run())
+        finally:
+            client.close()
+        self.assertEqual(states, ["STARTING"] * 12)
+        self.assertEqual(stub.max_in_flight, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+"""
+LivySessionPool against a fake Livy server on localhost.
+
+    python -m pytest tests
+"""
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from aws_beamline_devtools.livy_pool import LivySessionPool, session_name_prefix
+
+
+class FakeLivy:
+    """
+    In memory Livy REST API. A new session reports "starting" for its first starting_polls state
+    checks, then "idle".
+    """
+    def __init__(self, starting_polls=2):
+        self.sessions = {}
+        self.deleted = []
+        self.created = 0
+        self._starting_polls = starting_polls
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def add(self, kind, name, state):
+        with self._lock:
+            session = {"id": self._next_id, "kind": kind, "name": name, "state": state, "appId": None, "polls": 0}
+            self.sessions[session["id"]] = session
+            self._next_id += 1
+            return session
+
+    def handler(self):
+        livy = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, code, body=None):
+                content = json.dumps(body).encode("utf-8") if body is not None else b""
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            @staticmethod
+            def _view(session):
+                return {k: v for k, v in session.items() if k != "polls"}
+
+            def do_GET(self):
+                if self.path.startswith("/sessions?"):
+                    return self._reply(200, {"sessions": [self._view(x) for x in livy.sessions.values()]})
+                session = livy.sessions.get(int(self.path.rsplit("/", 1)[1]))
+                if session is None:
+                    return self._reply(404, {"msg": "not found"})
+                session["polls"] += 1
+                if session["state"] == "starting" and session["polls"] > livy._starting_polls:
+                    session["state"], session["appId"] = "idle", "application_{}".format(session["id"])
+                return self._reply(200, self._view(session))
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                livy.created += 1
+                return self._reply(201, self._view(livy.add(body["kind"], body.get("name"), "starting")))
+
+            def do_DELETE(self):
+                session_id = int(self.path.rsplit("/", 1)[1])
+                livy.deleted.append(session_id)
+                livy.sessions.pop(session_id, None)
+                return self._reply(200, {"msg": "deleted"})
+
+        return Handler
+
+
+class LivySessionPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.livy = FakeLivy()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.livy.handler())
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.sleeps = []
+        self.pool = LivySessionPool("127.0.0.1", port=self.server.server_address[1], sleep=self.sleeps.append)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_warm_waits_until_idle(self):
+        ready = self.pool.warm({"pyspark": 1, "spark": 1})
+        self.assertEqual({kind: len(x) for kind, x in ready.items()}, {"pyspark": 1, "spark": 1})
+        for session in ready["pyspark"] + ready["spark"]:
+            self.assertEqual(session.state, "idle")
+            self.assertTrue(session.name.startswith(session_name_prefix))
+            self.assertEqual(session.app_id, "application_{}".format(session.session_id))
+        self.assertEqual(self.livy.created, 2)
+        self.assertTrue(self.sleeps)
+
+    def test_warm_reuses_healthy_sessions(self):
+        self.livy.add("pyspark", session_name_prefix + "pyspark-1", "idle")
+        ready = self.pool.warm({"pyspark": 1})
+        self.assertEqual([x.session_id for x in ready["pyspark"]], [0])
+        self.assertEqual(self.livy.created, 0)
+
+    def test_dead_sessions_are_recycled(self):
+        dead = self.livy.add("pyspark", session_name_prefix + "pyspark-1", "dead")
+        foreign = self.livy.add("pyspark", "someone-else", "dead")
+        ready = self.pool.warm({"pyspark": 1})
+        self.assertEqual(self.livy.deleted, [dead["id"]])
+        self.assertIn(foreign["id"], self.livy.sessions)
+        self.assertEqual(len(ready["pyspark"]), 1)
+        self.assertNotEqual(ready["pyspark"][0].session_id, dead["id"])
+        self.assertEqual(self.livy.created, 1)
+
+    def test_session_gone_while_starting(self):
+        session = self.pool.create_session("spark")
+        del self.livy.sessions[session.session_id]
+        self.assertEqual(self.pool.wait_idle([session]), [])
+        self.assertEqual(session.state, "gone")
+
+
+if __name__ == "__main__":
+    unittest.main()